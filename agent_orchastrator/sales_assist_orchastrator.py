@@ -1,14 +1,20 @@
 # workflow.py
 
 from agents.get_assigned_beats_agent import GetAssignedBeatsAgent
-from agents.get_beat_route_plan_agent import GetBeatRoutePlanAgent
+from agents.get_beat_route_plan_agent import GetBeatRoutePlanAgent, route_key
+from agents.replan_route_agent import ReplanRouteAgent
 from agents.select_retailer_agent import SelectRetailer
-from agents.get_retailer_info_agent import GetRetailerInfoAgent
-from agents.get_pitch_summary_agent import PitchSummarizationAgent
+from agents.get_retailer_info_agent import GetRetailerInfoAgent, PrefetchRetailersAgent
+from agents.get_pitch_summary_agent import PitchSummarizationAgent, PitchPregenerationAgent
 from agents.order_logging_agent import OrderLoggingRunnable, OrderLoggingAgent
 from agents.day_summary_agent import DaySummaryRunnable, DaySummaryAgent
 from utils.set_state import SalesRepState
-from typing import Dict, Any
+from utils.intent import intent_of
+from utils.retailer_cache import retailer_bundle_cache, session_id_from_config
+from utils.state_store import beat_route
+from utils.graph_telemetry import metered_node
+from typing import Dict, Any, List, Optional
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, START, END
 
 
@@ -20,60 +26,139 @@ order_logging_agent = OrderLoggingAgent()
 day_summary_node = DaySummaryRunnable(day_summary_agent)
 order_logging_node = OrderLoggingRunnable(order_logging_agent)
 
-def _msg(state: Dict[str, Any]) -> str:
-    return (state.get("user_message") or "").strip().lower()
 
+# ---- Entry (shared by the sync and async graphs) ----
 
-def build_agent_graph():
-    builder = StateGraph(SalesRepState)
+# Beat and route are loaded once per rep, weekday and date; "refresh" reloads them
+def needs_route(state: Dict[str, Any]) -> bool:
+    return (
+        intent_of(state) == "refresh"
+        or not state.get("Beat_ID")
+        or state.get("Route_Key") != route_key(state)
+        # After a restart the route is reloaded by reference; [] if it changed in the DB
+        or not beat_route(state)
+    )
 
-    # ---- Nodes ----
-    builder.add_node("get_beat", GetAssignedBeatsAgent)
-    builder.add_node("get_route", GetBeatRoutePlanAgent)
-    builder.add_node("SelectRetailer", SelectRetailer)
-    builder.add_node("get_retailer_info", GetRetailerInfoAgent)
-    builder.add_node("get_sales_pitch", PitchSummarizationAgent)
-    builder.add_node("log_order", order_logging_node)
-    builder.add_node("day_summary", day_summary_node)
 
-    # ---- Edges ----
-    builder.add_edge(START, "get_beat")
-    builder.add_edge("get_beat", "get_route")
+# The app submits an order as a turn of its own: a visit_id and no chat message.
+# A chat turn clears visit_id, so a leftover one never takes over the rep's next command.
+def order_submitted(state: Dict[str, Any]) -> bool:
+    return state.get("visit_id") is not None and not state.get("user_message")
 
-    # From route -> either wait, select retailer, or day summary
-    def after_get_route(state: Dict[str, Any]) -> str:
-        # msg = (state.get("user_message") or "").lower()
-        msg = _msg(state)
-        if "day summary" in msg:
-            return "day_summary"
-        if "visit" in msg and not state.get("selection_failed", False):
-            return "SelectRetailer"
-        # No visit/summary in message -> stop now, UI will prompt next user action
-        return "__END__"
 
-    builder.add_conditional_edges(
-        "get_route",
-        after_get_route,
-        {
-            "day_summary": "day_summary",
-            "SelectRetailer": "SelectRetailer",
-            "__END__": END,
-        },
-    )
+def _warm_node(state: Dict[str, Any], config: Optional[RunnableConfig]) -> str:
+    # After a restart the session's retailer cache is empty although the route is in state
+    retailer_ids = [r["Retailer_ID"] for r in beat_route(state) if isinstance(r, dict) and "Retailer_ID" in r]
+    if retailer_bundle_cache.missing(session_id_from_config(config), retailer_ids):
+        return "prefetch_retailers"
+    return "pregenerate_pitches"
+
+
+def route_entry(state: Dict[str, Any], config: Optional[RunnableConfig] = None) -> str:
+    """
+    Sync graph: a submitted order goes straight to log_order; otherwise
+    START -> get_beat only when the beat/route in state are missing or stale.
+    Other turns pass through the cache-warming nodes (cheap once warm) on
+    their way to whatever after_get_route picks.
+    """
+    if order_submitted(state):
+        return "log_order"
+    if needs_route(state):
+        return "get_beat"
+    return _warm_node(state, config)
+
+
+def fan_out_entry(state: Dict[str, Any], config: Optional[RunnableConfig] = None) -> List[str]:
+    """Async graph: route_entry, with the cache warming run alongside the command."""
+    if order_submitted(state):
+        return ["log_order"]
+    if needs_route(state):
+        return ["get_beat"]
+    branch = after_get_route(state)
+    return [_warm_node(state, config)] + ([branch] if branch != "__END__" else [])
+
 
-    # SelectRetailer: either we have a store or fall back to route
-    def after_select_retailer(state: Dict[str, Any]) -> str:
-        msg = _msg(state)
-        if "day summary" in msg:
-            return "day_summary"
-        # SelectRetailer (your node) will set:
-        #   - state["Store_Info"] & ["Retailer_ID"] if matched (and next_node="get_retailer_info")
-        #   - OR "next_node"="get_route" if not matched/invalid
-        next_node = state.get("next_node")
-        if next_node == "get_retailer_info" and state.get("Store_Info"):
-            return "get_retailer_info"
-        return "__END__"#"get_route"
+# ---- Routers (shared by the sync and async graphs) ----
 
+# From route -> either wait, select retailer, or day summary
+def after_get_route(state: Dict[str, Any]) -> str:
+    intent = intent_of(state)
+    if intent == "day_summary":
+        return "day_summary"
+    if intent == "replan":
+        return "replan_route"
+    if intent == "visit" and not state.get("selection_failed", False):
+        return "SelectRetailer"
+    # No visit/summary in message -> stop now, UI will prompt next user action
+    return "__END__"
+
+
+# SelectRetailer: either we have a store or fall back to route
+def after_select_retailer(state: Dict[str, Any]) -> str:
+    if intent_of(state) == "day_summary":
+        return "day_summary"
+    # SelectRetailer (your node) will set:
+    #   - state["Store_Info"] & ["Retailer_ID"] if matched (and next_node="get_retailer_info")
+    #   - OR "next_node"="get_route" if not matched/invalid
+    next_node = state.get("next_node")
+    if next_node == "get_retailer_info" and state.get("Store_Info"):
+        return "get_retailer_info"
+    return "__END__"#"get_route"
+
+
+# After pitch decide: log order (if cart present) or go back/show route or summary
+def after_pitch(state: Dict[str, Any]) -> str:
+    if intent_of(state) == "day_summary":
+        return "day_summary"
+    # if state.get("order_products"):
+    if order_submitted(state):
+        return "log_order"
+    return "__END__"#"get_route"
+
+
+# After logging order → check if finished or wait
+def after_log_order(state: Dict[str, Any]) -> str:
+    if intent_of(state) == "day_summary":
+        return "day_summary"
+
+    visited = state.get("visited_retailers", []) or []
+    route = beat_route(state)
+
+    # Off-route drop-ins are in visited_retailers too; only route stops finish the day
+    route_ids = {str(r.get("Retailer_ID")) for r in route if isinstance(r, dict)}
+    if route_ids and route_ids <= set(map(str, visited)):
+        return "day_summary"
+    return "__END__"#"get_route"
+
+
+def fan_out_after_get_route(state: Dict[str, Any]) -> List[str]:
+    """
+    Async graph: prefetch/pregeneration only warm caches, so they run as a
+    side branch alongside whatever the message asked for.
+    """
+    branch = after_get_route(state)
+    return ["prefetch_retailers"] + ([branch] if branch != "__END__" else [])
+
+
+def _add_nodes(builder: StateGraph) -> None:
+    nodes = {
+        "get_beat": GetAssignedBeatsAgent,
+        "get_route": GetBeatRoutePlanAgent,
+        "prefetch_retailers": PrefetchRetailersAgent,
+        "pregenerate_pitches": PitchPregenerationAgent,
+        "replan_route": ReplanRouteAgent,
+        "SelectRetailer": SelectRetailer,
+        "get_retailer_info": GetRetailerInfoAgent,
+        "get_sales_pitch": PitchSummarizationAgent,
+        "log_order": order_logging_node,
+        "day_summary": day_summary_node,
+    }
+    # Each node is timed (with the SQL / LLM time inside it) for the Metrics tab
+    for name, node in nodes.items():
+        builder.add_node(name, metered_node(name, node))
+
+
+def _add_visit_edges(builder: StateGraph) -> None:
     # From retailer selection -> either get info or back to route or day summary
     builder.add_conditional_edges(
         "SelectRetailer",
@@ -90,18 +175,6 @@ def build_agent_graph():
     # From retailer info -> pitch
     builder.add_edge("get_retailer_info", "get_sales_pitch")
 
-    
-    # After pitch decide: log order (if cart present) or go back/show route or summary
-    def after_pitch(state: Dict[str, Any]) -> str:
-        # msg = (state.get("user_message") or "").lower()
-        msg = _msg(state)
-        if "day summary" in msg:
-            return "day_summary"
-        # if state.get("order_products"):
-        if state.get("visit_id") is not None:
-            return "log_order"
-        return "__END__"#"get_route"
-
     builder.add_conditional_edges(
         "get_sales_pitch",
         after_pitch,
@@ -113,23 +186,6 @@ def build_agent_graph():
         },
     )
 
-    # After logging order → check if finished or wait
-    def after_log_order(state: Dict[str, Any]) -> str:
-        # msg = (state.get("user_message") or "").lower()
-        msg = _msg(state)
-        if "day summary" in msg:
-            return "day_summary"
-
-        visited = state.get("visited_retailers", []) or []
-        route = state.get("Beat_Route_Plan", []) or []
-        # Some agents return {"Beat_Route_Plan": [...]} others embed as dict. Normalize:
-        if isinstance(route, dict) and "Beat_Route_Plan" in route:
-            route = route.get("Beat_Route_Plan") or []
-
-        if route and len(visited) >= len(route):
-            return "day_summary"
-        return "__END__"#"get_route"
-
     builder.add_conditional_edges(
         "log_order",
         after_log_order,
@@ -141,6 +197,80 @@ def build_agent_graph():
     )
 
     # End
+    builder.add_edge("replan_route", END)
     builder.add_edge("day_summary", END)
 
+
+def build_agent_graph():
+    builder = StateGraph(SalesRepState)
+
+    # ---- Nodes ----
+    _add_nodes(builder)
+
+    # ---- Edges ----
+    builder.add_conditional_edges(
+        START,
+        route_entry,
+        {
+            "get_beat": "get_beat",
+            "log_order": "log_order",
+            "prefetch_retailers": "prefetch_retailers",
+            "pregenerate_pitches": "pregenerate_pitches",
+        },
+    )
+    builder.add_edge("get_beat", "get_route")
+    # Load every store on the route in a few set-based queries before selection
+    builder.add_edge("get_route", "prefetch_retailers")
+    # Start writing pitches for the next stops in the background
+    builder.add_edge("prefetch_retailers", "pregenerate_pitches")
+
+    builder.add_conditional_edges(
+        "pregenerate_pitches",
+        after_get_route,
+        {
+            "day_summary": "day_summary",
+            "replan_route": "replan_route",
+            "SelectRetailer": "SelectRetailer",
+            "__END__": END,
+        },
+    )
+
+    _add_visit_edges(builder)
+
+    return builder
+
+
+def build_async_agent_graph():
+    """
+    Same nodes as build_agent_graph, wired for `ainvoke` / `astream`.
+
+    Every node has an async implementation (DB work on the SQLite executor,
+    LLM calls awaited), and the cache-warming prefetch -> pregenerate branch
+    runs concurrently with store selection, retailer info and the pitch
+    instead of ahead of them.
+    """
+    builder = StateGraph(SalesRepState)
+
+    # ---- Nodes ----
+    _add_nodes(builder)
+
+    # ---- Edges ----
+    builder.add_conditional_edges(
+        START,
+        fan_out_entry,
+        ["get_beat", "log_order", "prefetch_retailers", "pregenerate_pitches",
+         "replan_route", "SelectRetailer", "day_summary"],
+    )
+    builder.add_edge("get_beat", "get_route")
+
+    builder.add_conditional_edges(
+        "get_route",
+        fan_out_after_get_route,
+        ["prefetch_retailers", "replan_route", "SelectRetailer", "day_summary"],
+    )
+    builder.add_edge("prefetch_retailers", "pregenerate_pitches")
+    builder.add_edge("pregenerate_pitches", END)
+
+    _add_visit_edges(builder)
+
     return builder
@@ -1,14 +1,22 @@
-import os
-import sqlite3
 from datetime import datetime
 from typing import Dict, List,Any
-from langchain_openai import ChatOpenAI
-from dotenv import load_dotenv
 from utils.get_day import get_current_day
+from utils.db import DB_PATH, get_pool, run_db
+from utils.llm_cache import llm_cache
+from utils.llm_clients import get_llm
+from utils.order_outbox import get_order_outbox
+from utils.daily_metrics import fetch_daily_metrics
+from utils.streaming import DAY_SUMMARY_STREAM, astream_llm_text, stream_llm_text
 
-load_dotenv(override=True)
 
-os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
+PLANNED_VISITS_QUERY = """
+    select count(*) - 1 AS planned
+    FROM beat_route_plan a
+    join beats b
+    ON a.Beat_ID = b.Beat_ID
+    WHERE b.Assigned_Agent = ? 
+    AND b.Beat_day = ?
+"""
 
 
 class DaySummaryAgent:
@@ -16,81 +24,35 @@ class DaySummaryAgent:
     Generates a summary of the day's activities for the sales representative.
     """
 
-    def __init__(self, db_path: str = "sales_agent_co_pilot.db"):
+    def __init__(self, db_path: str = DB_PATH):
         self.db_path = db_path
-        self.llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.7)
+
+    @property
+    def llm(self):
+        # Created on the first summary, not when the graph module is imported
+        return get_llm("day_summary")
 
 
     def fetch_metrics(self, agent_id: str, date: str) -> Dict[str, Any]:
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        # Orders submitted moments ago may still be in the outbox; land them first
+        get_order_outbox(self.db_path).flush()
+        with get_pool(self.db_path).connection() as conn:
+            return self._fetch_metrics(conn, agent_id, date)
+
+    def _fetch_metrics(self, conn, agent_id: str, date: str) -> Dict[str, Any]:
         # date_today = datetime.now().strftime("%Y-%m-%d")
         current_day = get_current_day()
 
         # Total planned visits from beat plan
-        cursor.execute("""
-            select count(*) - 1
-            FROM beat_route_plan a
-            join beats b
-            ON a.Beat_ID = b.Beat_ID
-            WHERE b.Assigned_Agent = ? 
-            AND b.Beat_day = ?
-        """, (agent_id, current_day))
-        total_planned_visits = cursor.fetchone()[0]
-
-        # Total actual visits
-        cursor.execute("""
-            SELECT count(distinct Retailer_ID)
-            FROM visits
-            WHERE Agent_ID = ? AND DATE(Date) = DATE(?)
-        """, (agent_id, date))
-        total_actual_visits = cursor.fetchone()[0]
-
-        # Total sales & revenue
-        cursor.execute("""
-            SELECT COUNT(DISTINCT Invoice_ID), SUM(Total_Amount) 
-            FROM sales
-            WHERE Retailer_ID IN (
-                SELECT Retailer_ID FROM visits 
-                WHERE Agent_ID = ? AND DATE(Date) = DATE(?)
-            )
-            AND DATE(Date) = DATE(?)
-        """, (agent_id, date, date))
-        total_orders, total_revenue = cursor.fetchone()
-
-        # Top products
-        cursor.execute("""
-            SELECT p.Product_Name, SUM(s.Quantity) as qty
-            FROM sales s
-            JOIN products p ON s.Product_ID = p.Product_ID
-            JOIN visits v ON s.Visit_ID = v.Visit_ID
-            WHERE v.Agent_ID = ? AND DATE(s.Date) = DATE(?)
-            GROUP BY p.Product_Name
-            ORDER BY qty DESC LIMIT 3
-        """, (agent_id, date))
-        top_products = cursor.fetchall()
+        total_planned_visits = conn.execute(PLANNED_VISITS_QUERY, (agent_id, current_day)).fetchone()["planned"]
 
+        # Actual visits, orders, revenue and top products: kept up to date by every logged order
         return {
             "total_planned_visits": total_planned_visits or 0,
-            "total_actual_visits": total_actual_visits or 0,
-            "total_orders": total_orders or 0,
-            "total_revenue": total_revenue or 0.0,
-            "top_products": [f"{p[0]} ({p[1]})" for p in top_products]
+            **fetch_daily_metrics(conn, agent_id, date),
         }
 
-    def summarize_day(self, state: Dict[str, Any]) -> Dict[str, Any]:
-        """
-        Creates a summary based on the current state.
-
-        Returns:
-            A string summary of the day's activities.
-        """
-
-        agent_id = state["sales_rep_id"]
-        date = datetime.now().strftime("%Y-%m-%d")
-
-        metrics = self.fetch_metrics(agent_id, date)
-        
+    def build_prompt(self, agent_id: str, date: str, metrics: Dict[str, Any]) -> str:
         # Structured summary
         structured_summary = (
             f"Sales Rep {agent_id} summary for {date}:\n"
@@ -110,12 +72,35 @@ class DaySummaryAgent:
         Write a clear, professional, and motivating summary for the sales rep.
         Highlight visit adherence (planned vs. actual), sales performance, and suggest one area of improvement.
         """
-        llm_summary = self.llm.invoke(prompt).content
+        return prompt
+
+    def summarize_day(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Creates a summary based on the current state.
+
+        Returns:
+            The state update: Day_Summary, a summary of the day's activities, and conversation_end.
+        """
 
-        state["Day_Summary"] = llm_summary
-        state["conversation_end"] = True 
+        agent_id = state["sales_rep_id"]
+        date = datetime.now().strftime("%Y-%m-%d")
 
-        return state
+        metrics = self.fetch_metrics(agent_id, date)
+        prompt = self.build_prompt(agent_id, date, metrics)
+        llm_summary = stream_llm_text(self.llm, prompt, DAY_SUMMARY_STREAM, llm_cache)
+
+        return {"Day_Summary": llm_summary, "conversation_end": True}
+
+    async def asummarize_day(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Async variant of summarize_day; metrics are fetched on the DB executor."""
+        agent_id = state["sales_rep_id"]
+        date = datetime.now().strftime("%Y-%m-%d")
+
+        metrics = await run_db(self.fetch_metrics, agent_id, date)
+        prompt = self.build_prompt(agent_id, date, metrics)
+        llm_summary = await astream_llm_text(self.llm, prompt, DAY_SUMMARY_STREAM, llm_cache)
+
+        return {"Day_Summary": llm_summary, "conversation_end": True}
     
 
 
@@ -128,4 +113,8 @@ class DaySummaryRunnable(Runnable):
 
     def invoke(self, state: Dict[str, Any], config: Dict = None) -> Dict[str, Any]:
         """Runs the day summary agent inside a LangChain Runnable interface"""
-        return self.agent.summarize_day(state)
\ No newline at end of file
+        return self.agent.summarize_day(state)
+
+    async def ainvoke(self, state: Dict[str, Any], config: Dict = None, **kwargs: Any) -> Dict[str, Any]:
+        """Async counterpart of invoke, used by the async graph"""
+        return await self.agent.asummarize_day(state)
\ No newline at end of file
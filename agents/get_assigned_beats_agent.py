@@ -1,11 +1,17 @@
-import sqlite3
-import pandas as pd
 from langchain_core.runnables import RunnableLambda
 from typing import Dict, List, Union
+from utils.db import DB_PATH, fetch_one, run_db
 
 
+ASSIGNED_BEATS_QUERY = """
+    SELECT DISTINCT Beat_ID,Beat_Name
+    FROM beats 
+    WHERE Assigned_Agent = ?
+    AND Beat_day = ?
+"""
 
-def fetch_assigned_beats(inputs: Dict[str,Union[str, int]], db_path: str = "sales_agent_co_pilot.db") -> List[Dict]:
+
+def fetch_assigned_beats(inputs: Dict[str,Union[str, int]], db_path: str = DB_PATH) -> List[Dict]:
     """
     Fetches the beats assigned to a specific sales representative.
 
@@ -20,42 +26,32 @@ def fetch_assigned_beats(inputs: Dict[str,Union[str, int]], db_path: str = "sale
     sales_rep_id = inputs.get("sales_rep_id")
     weekday = inputs.get("Weekday", "Monday")  # Default to Monday if not provided
 
-    conn = sqlite3.connect(db_path)
-
     # Check if sales_rep_id is provided
     if not sales_rep_id:
-        conn.close()
         return "Sales Rep ID is required."
     
     # Validate sales_rep_id type
     if not isinstance(sales_rep_id, str):
-        conn.close()
         return "Sales Rep ID must be a string."
     
 
     # Fetch assigned beats for the sales rep
-    query = """
-        SELECT DISTINCT Beat_ID,Beat_Name
-        FROM beats 
-        WHERE Assigned_Agent = ?
-        AND Beat_day = ?
-    """
-    beats_df = pd.read_sql_query(query, conn, params=(sales_rep_id, weekday))
-
-    conn.close()
+    beat = fetch_one(ASSIGNED_BEATS_QUERY, (sales_rep_id, weekday), db_path=db_path)
 
     # Check if any beats were found
-    if beats_df.empty:
+    if beat is None:
         return [{"message": f"No beats found for {sales_rep_id} on {weekday}."}]
-    
-    # Convert DataFrame to a list of dictionaries
-    beats_list = beats_df.to_dict(orient='records')[0]
 
-    return beats_list
+    return beat
+
+
 
 
+async def afetch_assigned_beats(inputs: Dict[str,Union[str, int]], db_path: str = DB_PATH) -> List[Dict]:
+    """Async variant of fetch_assigned_beats; the query runs on the DB executor."""
+    return await run_db(fetch_assigned_beats, inputs, db_path)
 
 
 # Create a runnable function to fetch beats assigned to a sales rep
-GetAssignedBeatsAgent = RunnableLambda(fetch_assigned_beats)
+GetAssignedBeatsAgent = RunnableLambda(fetch_assigned_beats, afunc=afetch_assigned_beats)
 
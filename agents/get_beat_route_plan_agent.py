@@ -1,10 +1,31 @@
-import sqlite3
-import pandas as pd
-from typing import Dict, Union, List
+from datetime import date
+from typing import Any, Dict, Union, List
 from langchain_core.runnables import RunnableLambda
+from utils.db import DB_PATH, fetch_all, run_db
+from utils.state_store import route_store
 
 
-def fetch_beat_route_plan(inputs: Dict[str, Union[str, int]], db_path: str = "sales_agent_co_pilot.db") -> List[dict]:
+ROUTE_PLAN_QUERY = """
+    SELECT brp.Retailer_ID, r.Name, r.City,r.Channel,r.Latitude, r.Longitude,brp.Visit_Sequence
+    FROM beat_route_plan brp
+    JOIN retailers r ON brp.Retailer_ID = r.Retailer_ID
+    WHERE brp.Beat_ID = ?
+    and brp.Visit_Sequence < (SELECT max(Visit_Sequence) FROM beat_route_plan WHERE Beat_ID = ?)
+    ORDER BY brp.Visit_Sequence ASC
+"""
+
+
+def route_key(state: Dict[str, Any]) -> str:
+    """What a loaded beat and route are valid for: the rep, the weekday and today's date."""
+    return f"{state.get('sales_rep_id')}|{state.get('Weekday')}|{date.today().isoformat()}"
+
+
+def load_route(beat_id: str, db_path: str = DB_PATH) -> List[dict]:
+    """Stops of a beat's route in Visit_Sequence order, without the return to the start."""
+    return fetch_all(ROUTE_PLAN_QUERY, (beat_id, beat_id), db_path=db_path)
+
+
+def fetch_beat_route_plan(inputs: Dict[str, Union[str, int]], db_path: str = DB_PATH) -> List[dict]:
     """
     Fetches the beat route plan for a specific beat ID.
 
@@ -13,40 +34,34 @@ def fetch_beat_route_plan(inputs: Dict[str, Union[str, int]], db_path: str = "sa
         db_path (str): Path to the SQLite database file.
 
     Returns:
-        A List of dictionaries containing the beat route plan.
+        The Route_Version of the stops, now in the route store (read them
+        back with utils.state_store.beat_route), and the Route_Key.
     """
 
     beat_id = inputs.get("Beat_ID")
 
-    conn = sqlite3.connect(db_path)
-
 
     # Fetch beat route plan for the given beat ID
-    query = """
-            SELECT brp.Retailer_ID, r.Name, r.City,r.Channel,r.Latitude, r.Longitude,brp.Visit_Sequence
-            FROM beat_route_plan brp
-            JOIN retailers r ON brp.Retailer_ID = r.Retailer_ID
-            WHERE brp.Beat_ID = ?
-            and brp.Visit_Sequence < (SELECT max(Visit_Sequence) FROM beat_route_plan WHERE Beat_ID = ?)
-            ORDER BY brp.Visit_Sequence ASC
-        """
-    
-    route_plan_df = pd.read_sql_query(query, conn, params=(beat_id,beat_id))
-    
-    conn.close()
+    route_plan_list = load_route(beat_id, db_path)
 
     # Check if any route plan was found
-    if route_plan_df.empty:
+    if not route_plan_list:
         return [{"message": f"No route plan found for Beat ID {beat_id}."}]
-    
-    # Convert DataFrame to a list of dictionaries
-    route_plan_list = route_plan_df.to_dict(orient='records')
+
     route_plan_dict = {
-        "Beat_Route_Plan" : route_plan_list
+        # The stops themselves stay in the route store; state keeps the reference
+        "Route_Version": route_store.put(beat_id, route_plan_list),
+        # Later turns reuse the beat and route while this still matches
+        "Route_Key": route_key(inputs),
     }
 
     return route_plan_dict
 
 
+async def afetch_beat_route_plan(inputs: Dict[str, Union[str, int]], db_path: str = DB_PATH) -> List[dict]:
+    """Async variant of fetch_beat_route_plan; the query runs on the DB executor."""
+    return await run_db(fetch_beat_route_plan, inputs, db_path)
+
+
 # Create a runnable function to fetch beat route plan
-GetBeatRoutePlanAgent = RunnableLambda(fetch_beat_route_plan)
\ No newline at end of file
+GetBeatRoutePlanAgent = RunnableLambda(fetch_beat_route_plan, afunc=afetch_beat_route_plan)
\ No newline at end of file
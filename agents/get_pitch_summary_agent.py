@@ -1,16 +1,17 @@
-import os
-from dotenv import load_dotenv
-from typing import List,Dict,Any
-from langchain_openai import ChatOpenAI
-from langchain_core.runnables import RunnableLambda
-
-load_dotenv(override=True)
-
-os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
-
-
-# Create LLM instance
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.7)
+import asyncio
+from typing import Callable, List,Dict,Any
+from langchain_core.runnables import RunnableLambda, RunnableConfig
+from agents.replan_route_agent import active_replan
+from utils.db import run_db
+from utils.llm_cache import llm_cache
+from utils.llm_clients import get_llm
+from utils.pitch_pregenerator import PitchPregenerator
+from utils.retailer_cache import retailer_bundle_cache, session_id_from_config
+from utils.state_store import beat_route, retailer_bundle
+from utils.streaming import PITCH_STREAM, astream_llm_text, stream_llm_text, token_writer
+
+# LLM client is created on first use by the shared registry
+LLM_NAME = "pitch"
 
 #Build prompt
 def build_prompt(input_data: Dict[str, Any]) -> str:
@@ -50,18 +51,91 @@ def build_prompt(input_data: Dict[str, Any]) -> str:
     return prompt.strip()
 
 
+def pitch_generator(chat_model=None) -> Callable[[Dict[str, Any]], str]:
+    """
+    Returns a function that writes a pitch for a retailer bundle with `chat_model`
+    (the registry's pitch model, looked up per call, when None).
+    """
+    def generate(bundle: Dict[str, Any]) -> str:
+        return llm_cache.invoke(chat_model or get_llm(LLM_NAME), build_prompt(input_data=bundle))
+    return generate
+
+
+# Shared background pool that writes pitches for the next stops on the route
+pitch_pregenerator = PitchPregenerator(generate=pitch_generator())
+
+
+#Pitch Pre-generation Function
+def pregenerate_pitches(inputs: Dict[str, Any], config: RunnableConfig = None) -> Dict[str, Any]:
+    """
+    Queues pitches for the next unvisited stops on the route.
+
+    Bundles come from the session cache warmed by the prefetch node. A changed
+    route cancels the jobs queued for the old one. The graph state is left unchanged.
+    """
+    session_id = session_id_from_config(config)
+    pitch_pregenerator.schedule(
+        session_id,
+        beat_route(inputs),
+        inputs.get("visited_retailers") or [],
+        load_bundle=lambda rid: retailer_bundle_cache.get(session_id, rid),
+        # After a "replan", the next stops are the re-planned ones
+        order=active_replan(inputs),
+    )
+    return {}
+
+
 #Pitch Summary Function
-def generate_sales_pitch(inputs : Dict[str,Any]) -> Dict[str,Any]:
-    prompt = build_prompt(input_data= inputs)
-    response = llm.invoke(prompt)
+def generate_sales_pitch(inputs : Dict[str,Any], config: RunnableConfig = None) -> Dict[str,Any]:
+    retailer_id = inputs.get('Retailer_Info').get("Retailer_ID")
+    session_id = session_id_from_config(config)
+
+    # Serve the background pitch when it was written from the store's current bundle,
+    # otherwise stream it from the LLM now (the prompt is deterministic per store
+    # snapshot, so repeat visits hit the cache)
+    bundle = retailer_bundle(retailer_id, config)
+    pitch = pitch_pregenerator.get_ready(session_id, retailer_id, bundle)
+    if pitch is not None:
+        token_writer(PITCH_STREAM)(pitch)
+    else:
+        prompt = build_prompt(input_data=bundle)
+        pitch = stream_llm_text(get_llm(LLM_NAME), prompt, PITCH_STREAM, llm_cache)
+        pitch_pregenerator.set_ready(session_id, retailer_id, bundle, pitch)
+
     sales_pitch = {
-        "Retailer_ID" : inputs.get('Retailer_Info').get("Retailer_ID"),
-        "Pitch" : response.content
+        "Retailer_ID" : retailer_id,
+        "Pitch" : pitch
     }
 
     return sales_pitch
 
 
+async def apregenerate_pitches(inputs: Dict[str, Any], config: RunnableConfig = None) -> Dict[str, Any]:
+    """Async variant of pregenerate_pitches; scheduling only enqueues work, so it runs inline."""
+    return pregenerate_pitches(inputs, config)
+
+
+async def agenerate_sales_pitch(inputs : Dict[str,Any], config: RunnableConfig = None) -> Dict[str,Any]:
+    """Async variant of generate_sales_pitch; waits for in-flight pitches off the event loop."""
+    retailer_id = inputs.get('Retailer_Info').get("Retailer_ID")
+    session_id = session_id_from_config(config)
+
+    bundle = await run_db(retailer_bundle, retailer_id, config)
+    pitch = await asyncio.to_thread(pitch_pregenerator.get_ready, session_id, retailer_id, bundle)
+    if pitch is not None:
+        token_writer(PITCH_STREAM)(pitch)
+    else:
+        prompt = build_prompt(input_data=bundle)
+        pitch = await astream_llm_text(get_llm(LLM_NAME), prompt, PITCH_STREAM, llm_cache)
+        pitch_pregenerator.set_ready(session_id, retailer_id, bundle, pitch)
+
+    return {
+        "Retailer_ID" : retailer_id,
+        "Pitch" : pitch
+    }
+
+
 # LangChain Runnable
-PitchSummarizationAgent = RunnableLambda(generate_sales_pitch)
+PitchSummarizationAgent = RunnableLambda(generate_sales_pitch, afunc=agenerate_sales_pitch)
+PitchPregenerationAgent = RunnableLambda(pregenerate_pitches, afunc=apregenerate_pitches)
 
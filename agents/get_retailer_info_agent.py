@@ -1,88 +1,252 @@
-import sqlite3
-import pandas as pd
-from typing import Dict, Union, List
-from langchain_core.runnables import RunnableLambda
+import asyncio
+from collections import defaultdict
+from typing import Any, Dict, Union, List
+from langchain_core.runnables import RunnableLambda, RunnableConfig
+from utils.db import DB_PATH, get_pool, run_db
+from utils.retailer_cache import retailer_bundle_cache, session_id_from_config
+from utils.state_store import beat_route
+
+
+RETAILER_QUERY = """
+    SELECT Retailer_ID, Name, City, Channel, Latitude, Longitude
+    FROM retailers
+    WHERE Retailer_ID = ?
+"""
+
+# Served by idx_visits_retailer_date walked backwards, no sort
+LATEST_VISIT_QUERY = """
+    SELECT Visit_ID
+    FROM visits
+    WHERE Retailer_ID = ?
+    ORDER BY Date DESC
+    LIMIT 1
+"""
+
+VISIT_STOCK_QUERY = """
+    SELECT v.Date as Visit_date,vs.Product_ID, p.Product_Name,p.Pack_size,p.Category, vs.Available_Stock
+    FROM visits v
+    JOIN visit_stock vs ON v.Visit_ID = vs.Visit_ID
+    JOIN products p ON vs.Product_ID = p.Product_ID
+    WHERE vs.Visit_ID = ?
+"""
+
+RECOMMENDATIONS_QUERY = """
+    SELECT prm.Product_ID, p.Product_Name, round(prm.Final_Score,2) Score
+    FROM product_recommendations_ml prm
+    JOIN products p ON prm.Product_ID = p.Product_ID
+    WHERE prm.Retailer_ID = ?
+    ORDER BY prm.Final_Score DESC
+"""
+
+
+# ---------- Route-level prefetch (set-based variants of the queries above) ----------
+ROUTE_RETAILERS_QUERY = """
+    SELECT Retailer_ID, Name, City, Channel, Latitude, Longitude
+    FROM retailers
+    WHERE Retailer_ID IN ({placeholders})
+"""
+
+# SQLite returns the bare Visit_ID column from the row holding max(Date)
+ROUTE_LATEST_VISITS_QUERY = """
+    SELECT Retailer_ID, Visit_ID, max(Date) AS Date
+    FROM visits
+    WHERE Retailer_ID IN ({placeholders})
+    GROUP BY Retailer_ID
+"""
+
+ROUTE_VISIT_STOCK_QUERY = """
+    SELECT vs.Visit_ID, v.Date as Visit_date,vs.Product_ID, p.Product_Name,p.Pack_size,p.Category, vs.Available_Stock
+    FROM visits v
+    JOIN visit_stock vs ON v.Visit_ID = vs.Visit_ID
+    JOIN products p ON vs.Product_ID = p.Product_ID
+    WHERE vs.Visit_ID IN ({placeholders})
+"""
+
+ROUTE_RECOMMENDATIONS_QUERY = """
+    SELECT prm.Retailer_ID, prm.Product_ID, p.Product_Name, round(prm.Final_Score,2) Score
+    FROM product_recommendations_ml prm
+    JOIN products p ON prm.Product_ID = p.Product_ID
+    WHERE prm.Retailer_ID IN ({placeholders})
+    ORDER BY prm.Retailer_ID, prm.Final_Score DESC
+"""
+
+# Stay well under SQLITE_MAX_VARIABLE_NUMBER on older builds
+IN_CLAUSE_CHUNK = 500
+
+
+def _fetch_in(conn, query: str, keys: List[str]) -> List[Dict[str, Any]]:
+    rows = []
+    for i in range(0, len(keys), IN_CLAUSE_CHUNK):
+        chunk = keys[i:i + IN_CLAUSE_CHUNK]
+        sql = query.format(placeholders=",".join("?" * len(chunk)))
+        rows.extend(conn.execute(sql, chunk).fetchall())
+    return rows
+
+
+def fetch_retailer_bundles(retailer_ids: List[str], db_path: str = DB_PATH) -> Dict[str, Dict[str, Any]]:
+    """
+    Loads retailer info, latest-visit stock and recommendations for many stores at once.
+
+    Args:
+        retailer_ids (List[str]): Retailers to load.
+        db_path (str): Path to the SQLite database file.
+
+    Returns:
+        A dictionary of Retailer_ID -> bundle (Retailer_Info, Last_Visit_Stock, Product_Recommendations).
+        Unknown retailers are left out.
+    """
+    ids = list(dict.fromkeys(str(rid) for rid in retailer_ids))
+    if not ids:
+        return {}
+
+    with get_pool(db_path).connection() as conn:
+        retailers = _fetch_in(conn, ROUTE_RETAILERS_QUERY, ids)
+        latest = _fetch_in(conn, ROUTE_LATEST_VISITS_QUERY, ids)
+        visit_to_retailer = {row["Visit_ID"]: row["Retailer_ID"] for row in latest}
+        stock_rows = _fetch_in(conn, ROUTE_VISIT_STOCK_QUERY, list(visit_to_retailer))
+        rec_rows = _fetch_in(conn, ROUTE_RECOMMENDATIONS_QUERY, ids)
+
+    stock_by_retailer = defaultdict(list)
+    for row in stock_rows:
+        stock_by_retailer[visit_to_retailer[row.pop("Visit_ID")]].append(row)
+
+    recs_by_retailer = defaultdict(list)
+    for row in rec_rows:
+        recs_by_retailer[row.pop("Retailer_ID")].append(row)
+
+    return {
+        r["Retailer_ID"]: {
+            "Retailer_Info": r,
+            "Product_Recommendations": recs_by_retailer.get(r["Retailer_ID"], []),
+            "Last_Visit_Stock": stock_by_retailer.get(r["Retailer_ID"], []),
+        }
+        for r in retailers
+    }
+
 
+def prefetch_route_retailers(inputs: Dict[str, Any], config: RunnableConfig = None, db_path: str = DB_PATH) -> Dict:
+    """
+    Warms the session's retailer cache for every store on the loaded route.
 
-def fetch_retailer_info(inputs: Dict[str, Union[str, int]], db_path: str = "sales_agent_co_pilot.db") -> Dict:
+    Only stores not already cached are fetched, so re-running the node on later
+    turns costs no DB time. The graph state is left unchanged.
+    """
+    retailer_ids = [r["Retailer_ID"] for r in beat_route(inputs, db_path) if "Retailer_ID" in r]
+
+    session_id = session_id_from_config(config)
+    missing = retailer_bundle_cache.missing(session_id, retailer_ids)
+    if missing:
+        retailer_bundle_cache.put_many(session_id, fetch_retailer_bundles(missing, db_path=db_path))
+
+    return {}
+
+
+def _latest_visit_stock(conn, retailer_id: str) -> List[Dict[str, Any]]:
+    # Get latest visit_id for this retailer
+    latest_visit = conn.execute(LATEST_VISIT_QUERY, (retailer_id,)).fetchone()
+    if latest_visit is None:
+        return []
+
+    # Fetch stock for the latest visit
+    return conn.execute(VISIT_STOCK_QUERY, (latest_visit["Visit_ID"],)).fetchall()
+
+
+def _with_connection(db_path: str, fn, *args):
+    with get_pool(db_path).connection() as conn:
+        return fn(conn, *args)
+
+
+def fetch_retailer_info(inputs: Dict[str, Union[str, int]], config: RunnableConfig = None, db_path: str = DB_PATH) -> Dict:
     """
     Fetches information about a specific retailer.
 
+    Served from the session's prefetched bundles when available, otherwise
+    queried live and cached for the rest of the session. Only the retailer
+    row goes into the graph state; stock and recommendations stay in the
+    session cache (utils.state_store.retailer_bundle).
+
     Args:
         inputs (Dict[str, Union[str, int]]): The ID of the retailer.
+        config (RunnableConfig): Run config; its thread_id selects the session cache.
         db_path (str): Path to the SQLite database file.
 
     Returns:
-        A dictionary containing the retailer's information.
+        {"Retailer_Info": retailer row}.
     """
 
     retailer_id = inputs.get("Store_Info").get("Retailer_ID")
+    session_id = session_id_from_config(config)
 
-    conn = sqlite3.connect(db_path)
-
-    # Fetch retailer information for the given retailer ID
-    retailer_query = """
-            SELECT Retailer_ID, Name, City, Channel, Latitude, Longitude
-            FROM retailers
-            WHERE Retailer_ID = ?
-        """
-    
-    retailer_df = pd.read_sql_query(retailer_query, conn, params=(retailer_id,))
-    if retailer_df.empty:
-        conn.close()
-        return {"message": f"No retailer found with ID {retailer_id}"}
-    
+    cached = retailer_bundle_cache.get(session_id, retailer_id)
+    if cached is not None:
+        return {"Retailer_Info": cached["Retailer_Info"]}
 
-    # Get latest visit_id for this retailer
-    visit_query = """
-        SELECT Visit_ID
-        FROM visits
-        WHERE Retailer_ID = ?
-        ORDER BY Date DESC
-        LIMIT 1
-    """
-    latest_visit = pd.read_sql_query(visit_query, conn, params=(retailer_id,))
-    
-    if not latest_visit.empty:
-        visit_id = latest_visit["Visit_ID"].iloc[0]
-
-        # Fetch stock for the latest visit
-        stock_query = """
-            SELECT v.Date as Visit_date,vs.Product_ID, p.Product_Name,p.Pack_size,p.Category, vs.Available_Stock
-            FROM visits v
-            JOIN visit_stock vs ON v.Visit_ID = vs.Visit_ID
-            JOIN products p ON vs.Product_ID = p.Product_ID
-            WHERE vs.Visit_ID = ?
-        """
-        stock_df = pd.read_sql_query(stock_query, conn, params=(visit_id,))
-        stock_data = stock_df.to_dict(orient="records")
-    else:
-        stock_data = []
-
-
-    # Get product recommendations
-    rec_query = """
-        SELECT prm.Product_ID, p.Product_Name, round(prm.Final_Score,2) Score
-        FROM product_recommendations_ml prm
-        JOIN products p ON prm.Product_ID = p.Product_ID
-        WHERE prm.Retailer_ID = ?
-        ORDER BY prm.Final_Score DESC
+    # One pooled connection serves all three lookups for the store
+    with get_pool(db_path).connection() as conn:
+
+        # Fetch retailer information for the given retailer ID
+        retailer = conn.execute(RETAILER_QUERY, (retailer_id,)).fetchone()
+        if retailer is None:
+            return {"message": f"No retailer found with ID {retailer_id}"}
+
+
+        # Get stock captured on the latest visit
+        stock_data = _latest_visit_stock(conn, retailer_id)
+
+
+        # Get product recommendations
+        rec_data = conn.execute(RECOMMENDATIONS_QUERY, (retailer_id,)).fetchall()
+
+
+    retailer_info = {
+        "Retailer_Info": retailer,
+        "Product_Recommendations": rec_data,
+        "Last_Visit_Stock": stock_data
+    }
+    retailer_bundle_cache.put(session_id, retailer_id, retailer_info)
+
+    return {"Retailer_Info": retailer}
+
+
+async def afetch_retailer_info(inputs: Dict[str, Union[str, int]], config: RunnableConfig = None, db_path: str = DB_PATH) -> Dict:
     """
-    rec_df = pd.read_sql_query(rec_query, conn, params=(retailer_id,))
-    rec_data = rec_df.to_dict(orient="records")
+    Async variant of fetch_retailer_info.
 
-    conn.close()
-    
-    
+    On a cache miss the retailer row, latest-visit stock and recommendations
+    are queried concurrently, each on its own pooled connection.
+    """
+    retailer_id = inputs.get("Store_Info").get("Retailer_ID")
+    session_id = session_id_from_config(config)
+
+    cached = retailer_bundle_cache.get(session_id, retailer_id)
+    if cached is not None:
+        return {"Retailer_Info": cached["Retailer_Info"]}
+
+    retailer, stock_data, rec_data = await asyncio.gather(
+        run_db(_with_connection, db_path, lambda conn: conn.execute(RETAILER_QUERY, (retailer_id,)).fetchone()),
+        run_db(_with_connection, db_path, _latest_visit_stock, retailer_id),
+        run_db(_with_connection, db_path, lambda conn: conn.execute(RECOMMENDATIONS_QUERY, (retailer_id,)).fetchall()),
+    )
+    if retailer is None:
+        return {"message": f"No retailer found with ID {retailer_id}"}
 
     retailer_info = {
-        "Retailer_Info": retailer_df.to_dict(orient="records")[0],
+        "Retailer_Info": retailer,
         "Product_Recommendations": rec_data,
         "Last_Visit_Stock": stock_data
     }
+    retailer_bundle_cache.put(session_id, retailer_id, retailer_info)
+
+    return {"Retailer_Info": retailer}
 
-    return retailer_info
+
+async def aprefetch_route_retailers(inputs: Dict[str, Any], config: RunnableConfig = None, db_path: str = DB_PATH) -> Dict:
+    """Async variant of prefetch_route_retailers; the set-based queries run on the DB executor."""
+    return await run_db(prefetch_route_retailers, inputs, config, db_path)
 
 
 # Create a runnable function to fetch retailer information
-GetRetailerInfoAgent = RunnableLambda(fetch_retailer_info)
\ No newline at end of file
+GetRetailerInfoAgent = RunnableLambda(fetch_retailer_info, afunc=afetch_retailer_info)
+
+# Create a runnable function to prefetch every store on the route
+PrefetchRetailersAgent = RunnableLambda(prefetch_route_retailers, afunc=aprefetch_route_retailers)
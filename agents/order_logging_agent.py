@@ -1,18 +1,23 @@
+import logging
 import sqlite3
 from datetime import datetime
 from typing import Any, Dict, List
 from utils.set_state import SalesRepState
+from utils.db import DB_PATH, run_db
+from utils.order_outbox import get_order_outbox
 import uuid
 
+logger = logging.getLogger(__name__)
+
 class OrderLoggingAgent:
     """
-    Captures order details and writes them into:
+    Captures order details and queues them, via the order outbox, for:
     - sales
     - visits
     - visit_stock
     """
 
-    def __init__(self,db_path: str = "sales_agent_co_pilot.db"):
+    def __init__(self,db_path: str = DB_PATH):
         self.db_path = db_path
 
     def _resolve_retailer_id(self, state: Dict[str, Any]) -> str:
@@ -39,7 +44,11 @@ class OrderLoggingAgent:
         feedback: Optional feedback string
 
         Returns:
-            A success or failure message.
+            The state update: order_log with a success or failure message,
+            order_error (None once the order is queued) and visited_retailers.
+            visit_id is cleared either way, so a failed submit never holds on
+            to the rep's next turn. The order is durable once queued; the outbox
+            flusher writes it to the database in the background.
         """
 
         products = state.get("order_products", [])
@@ -52,85 +61,59 @@ class OrderLoggingAgent:
         date_today = datetime.now().strftime("%Y-%m-%d")
 
         if not retailer_id:
-            state["order_log"] = "Retailer_ID missing; visit not logged."
-            return state
-
-        # if not products:
-        #     state["order_log"] = "No products to log."
-        #     return state
+            error = "Retailer_ID missing; visit not logged."
+            return {"order_log": error, "order_error": error, "visit_id": None}
+
+        order = {
+            "visit_id": visit_id,
+            "invoice_id": invoice_id,
+            "retailer_id": retailer_id,
+            "agent_id": agent_id,
+            "date": date_today,
+            "products": self._merge_lines(products),
+            "feedback": feedback or "",
+        }
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-
-            # Insert into visits
-            cursor.execute("""
-                INSERT INTO visits (Visit_ID, Retailer_ID, Date, Products_Suggested, Feedback, Order_Placed, Agent_ID)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (
-                visit_id,
-                retailer_id,
-                date_today,
-                ", ".join([p.get("Product_ID", "") for p in products]) if products else "N.A",
-                feedback if feedback else "",
-                1 if products else 0,
-                agent_id
-            ))
-
-            
-            if products:
-                # Insert into visit_stock + sales
-                for prod in products:
-                    product_id = prod["Product_ID"]
-                    qty = prod["Quantity"]
-                    stock = prod["Available_Stock"]
-                    price = prod.get("Price", 0.0)
-                    total_amount = qty * price
-
-                    # visit_stock
-                    cursor.execute("""
-                        INSERT INTO visit_stock (Visit_ID, Product_ID, Retailer_ID, Available_Stock)
-                        VALUES (?, ?, ?, ?)
-                    """, (visit_id, product_id, retailer_id, stock))
-
-                    # sales
-                    cursor.execute("""
-                        INSERT INTO sales (Invoice_ID, Visit_ID, Retailer_ID, Product_ID, Quantity, Date, Total_Amount)
-                        VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        invoice_id,
-                        visit_id,
-                        retailer_id,
-                        product_id,
-                        qty,
-                        date_today,
-                        total_amount
-                    ))
-
-            conn.commit()
-
-
-            # log_msg = f"Order logged for Visit ID: {visit_id}, Invoice ID: {invoice_id}"
-            # state["order_log"] = log_msg
-            visited = state.get("visited_retailers", [])
-            if retailer_id not in visited:
-                visited.append(retailer_id)
-            state["visited_retailers"] = visited
-
-            state["order_log"] = (
+            # Durable local append; the flusher writes visits / visit_stock / sales in one transaction
+            get_order_outbox(self.db_path).submit(order)
+        except (sqlite3.Error, OSError) as e:
+            # submit already retried a busy outbox; the cart stays in the app for another try
+            logger.exception("Could not queue order %s", visit_id)
+            error = f"Order not saved ({e}). Please submit it again."
+            return {"order_log": error, "order_error": error, "visit_id": None}
+
+        visited = list(state.get("visited_retailers") or [])
+        if retailer_id not in visited:
+            visited.append(retailer_id)
+
+        return {
+            "visited_retailers": visited,
+            "order_log": (
                 f"Visit logged (Visit_ID={visit_id}). "
                 + ("Order captured." if products else "No order captured.")
-            )
-            
-            return state
-
-        except sqlite3.Error as e:
-            state["order_log"] =  f"An error occurred: {e}"
-            return state
-
-        finally:
-            if conn:
-                conn.close()
+            ),
+            "order_error": None,
+            # Logged: later turns must not log it again
+            "visit_id": None,
+        }
+
+    @staticmethod
+    def _merge_lines(products: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # A product added to the cart twice is one sales row (Invoice_ID, Product_ID is the key)
+        merged: Dict[str, Dict[str, Any]] = {}
+        for prod in products:
+            line = merged.get(prod["Product_ID"])
+            if line is None:
+                merged[prod["Product_ID"]] = {
+                    "Product_ID": prod["Product_ID"],
+                    "Quantity": prod["Quantity"],
+                    "Available_Stock": prod["Available_Stock"],
+                    "Price": prod.get("Price", 0.0),
+                }
+            else:
+                line["Quantity"] += prod["Quantity"]
+                line["Available_Stock"] = prod["Available_Stock"]
+        return list(merged.values())
 
 # LangChain Runnable
 from langchain_core.runnables import Runnable
@@ -143,3 +126,7 @@ class OrderLoggingRunnable(Runnable):
     def invoke(self, state: Dict[str, Any], config: Dict = None) -> Dict[str, Any]:
         """Runs the order logging agent inside a LangChain Runnable interface"""
         return self.agent.log_order(state)
+
+    async def ainvoke(self, state: Dict[str, Any], config: Dict = None, **kwargs: Any) -> Dict[str, Any]:
+        """Async counterpart of invoke; the outbox append runs on the DB executor"""
+        return await run_db(self.agent.log_order, state)
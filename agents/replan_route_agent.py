@@ -0,0 +1,137 @@
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.runnables import RunnableLambda
+
+from utils.set_state import SalesRepState
+from utils.state_store import beat_route
+
+
+# "replan from 12.9716, 77.5946" starts from that position instead of the last visited store
+_LAT_LON = re.compile(r"(-?\d{1,2}\.\d+)\s*[,\s]\s*(-?\d{1,3}\.\d+)")
+
+
+def parse_lat_lon(message: str) -> Optional[Tuple[float, float]]:
+    m = _LAT_LON.search(message or "")
+    if not m:
+        return None
+    lat, lon = float(m.group(1)), float(m.group(2))
+    return (lat, lon) if -90 <= lat <= 90 and -180 <= lon <= 180 else None
+
+
+def active_replan(state: Dict[str, Any]) -> Optional[List[str]]:
+    """Retailer_IDs in re-planned order, if the last replan was for today's beat."""
+    replan = state.get("Route_Replan") or {}
+    if not replan.get("order") or replan.get("Beat_ID") != state.get("Beat_ID"):
+        return None
+    return replan["order"]
+
+
+def follow_replan(route: List[dict], order: Optional[List[str]]) -> List[dict]:
+    """Route stops in re-planned order; stops the replan does not cover keep their Visit_Sequence order after them."""
+    if not order:
+        return route
+    position = {rid: i for i, rid in enumerate(order)}
+    return sorted(route, key=lambda r: (
+        position.get(str(r.get("Retailer_ID")), len(order)),
+        int(r.get("Visit_Sequence", 0)),
+    ))
+
+
+def _coords(stop: dict) -> Optional[Tuple[float, float]]:
+    lat, lon = stop.get("Latitude"), stop.get("Longitude")
+    return None if lat is None or lon is None else (float(lat), float(lon))
+
+
+def rep_position(state: Dict[str, Any], route: List[dict]) -> Tuple[Optional[Tuple[float, float]], str]:
+    """
+    Where the rep is: the lat/lon in the message ("position"), else the last
+    visited store with coordinates, on the route or an off-route drop-in
+    ("last_visit"), else (None, "unknown").
+    """
+    point = parse_lat_lon(state.get("user_message", ""))
+    if point is not None:
+        return point, "position"
+    by_id = {str(r.get("Retailer_ID")): r for r in route}
+    for rid in reversed([str(v) for v in state.get("visited_retailers") or []]):
+        stop = by_id.get(rid)
+        if stop is None:
+            from utils.retailer_index import get_retailer_index
+            stop = get_retailer_index().get(rid)
+        if stop is not None and _coords(stop) is not None:
+            return _coords(stop), "last_visit"
+    return None, "unknown"
+
+
+def _path_km(start: Tuple[float, float], points: List[Tuple[float, float]]) -> float:
+    from pipelines.beats import haversine_km
+
+    if not points:
+        return 0.0
+    lat, lon = zip(start, *points)
+    return float(haversine_km(lat[:-1], lon[:-1], lat[1:], lon[1:]).sum())
+
+
+def _stored_distances(beat_id: str, route: List[dict], start: Tuple[float, float], located: List[dict]):
+    """
+    (n + 1, n + 1) km between `start` and the `located` stops, with the stop
+    block sliced from the beat's stored matrix; None if it is missing or stale.
+    """
+    import numpy as np
+    from pipelines.beats import haversine_km
+    from pipelines.distances import DistanceStore
+
+    stops = [r for r in route if _coords(r) is not None]
+    stored = DistanceStore().load(beat_id, [r["Retailer_ID"] for r in stops], np.array([_coords(r) for r in stops]))
+    if stored is None:
+        return None
+    ids, matrix = stored
+    position = {rid: i for i, rid in enumerate(ids)}
+    idx = [position[str(r["Retailer_ID"])] for r in located]
+    dist = np.zeros((len(idx) + 1, len(idx) + 1), dtype=matrix.dtype)
+    dist[1:, 1:] = matrix[np.ix_(idx, idx)]
+    lat, lon = zip(*(_coords(r) for r in located))
+    dist[0, 1:] = dist[1:, 0] = haversine_km(start[0], start[1], lat, lon)
+    return dist
+
+
+def replan_route(state: SalesRepState) -> Dict[str, Any]:
+    """
+    Re-sequences the unvisited stops of today's route, starting from the
+    lat/lon in the message, else the last visited store, else the next stop
+    in the current order.
+
+    The order is kept in state (Route_Replan) for "visit next", pitch
+    pre-generation and the plan view; the stored route itself is untouched.
+    """
+    from pipelines.routes import plan_path
+
+    route = beat_route(state)
+    visited = [str(v) for v in state.get("visited_retailers") or []]
+    done = set(visited)
+    remaining = [r for r in follow_replan(route, active_replan(state)) if str(r.get("Retailer_ID")) not in done]
+    located = [r for r in remaining if _coords(r) is not None]
+    if not located:
+        return {}
+
+    start, origin = rep_position(state, route)
+    if start is None:
+        start, origin = _coords(located[0]), "next_stop"
+
+    points = [_coords(r) for r in located]
+    order, km = plan_path(start, points, _stored_distances(state.get("Beat_ID"), route, start, located))
+    stops = [located[i] for i in order] + [r for r in remaining if _coords(r) is None]
+    return {
+        "Route_Replan": {
+            "Beat_ID": state.get("Beat_ID"),
+            "order": [str(r["Retailer_ID"]) for r in stops],
+            "start": list(start),
+            "origin": origin,
+            "km": round(km, 3),
+            # The same stops in the order they were in before, from the same start
+            "previous_km": round(_path_km(start, points), 3),
+        }
+    }
+
+
+ReplanRouteAgent = RunnableLambda(replan_route)
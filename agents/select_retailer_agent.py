@@ -1,119 +1,154 @@
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_openai import ChatOpenAI
+import logging
+import re
+from functools import lru_cache
+from typing import Any, Dict, Optional
 from langchain_core.runnables import RunnableLambda
 from utils.set_state import SalesRepState
-import difflib
-from dotenv import load_dotenv
-import os
-import re
-
-load_dotenv(override=True)
+from utils.retailer_matcher import CONFIDENCE_THRESHOLD, RetailerMatch, get_route_matcher
+from utils.retailer_index import get_retailer_index
+from utils.db import run_db
+from utils.state_store import beat_route
+from utils.llm_clients import get_llm
+from agents.replan_route_agent import active_replan, rep_position
 
-os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
 
-def normalize_route(route_like):
-    if isinstance(route_like, dict) and "Beat_Route_Plan" in route_like:
-        return route_like.get("Beat_Route_Plan") or []
-    return route_like or []
+logger = logging.getLogger(__name__)
 
-llm = ChatOpenAI(model="gpt-4o-mini")
+# "visit nearest" picks the closest unvisited stop on the route; with one of
+# the OFF_ROUTE phrases, the closest store that is not on it (a drop-in)
+NEAREST_WORDS = {"nearest", "closest"}
+OFF_ROUTE = ("off route", "off-route", "drop in", "drop-in", "any store")
 
-
-select_prompt = ChatPromptTemplate.from_messages([
+SELECT_MESSAGES = [
     ("system", 
      "You're a helpful assistant helping a sales rep select a store to visit from their daily route. "
      "You are given a list of retailers (with their IDs and names). Based on the user's message, identify the matching retailer."),
     ("user", "User message: {user_message}\n\nRetailer Route: {route_names}")
-])
-
-select_chain = select_prompt | llm | StrOutputParser()
-
-
-def select_retailer_node(state: SalesRepState) -> SalesRepState:
-    user_message = state.get("user_message", "")
-    # route = state.get("Beat_Route_Plan")
-    route = normalize_route(state.get("Beat_Route_Plan"))
-
-    # Defensive fallback
-    if isinstance(route, dict) and "Beat_Route_Plan" in route:
-        route = route["Beat_Route_Plan"]
-    elif not isinstance(route, list):
-        # raise ValueError("Invalid Beat_Route_Plan format. Expected a list of retailers.")
-        state["user_message"] = "Invalid Beat_Route_Plan format."
-        state["next_node"] = "get_route"
-        return state
-    
-
-    # 1) DIRECT MATCH: "visit 1" -> Visit_Sequence
-    seq_match = re.search(r"\bvisit\s*(store\s*number\s*)?(\d+)\b", user_message)
-    if seq_match:
-        seq = int(seq_match.group(2))
-        store = next((r for r in route if int(r["Visit_Sequence"]) == seq), None)
-        if store:
-            state["Store_Info"] = store
-            state["Retailer_ID"] = store["Retailer_ID"]
-            state["next_node"] = "get_retailer_info"
-            state["selection_failed"] = False
-
-            print(f"[Debug] select retailer: {state['Retailer_ID']} by Visit_Sequence {seq}")
-            return state
-        
-    # 2) DIRECT MATCH BY Retailer_ID
-    id_match = re.search(r"\b([A-Za-z0-9]{3,6})\b", user_message)
-    if id_match:
-        token = id_match.group(1).upper()
-        store = next((r for r in route if str(r["Retailer_ID"]).upper() == token), None)
-        if store:
-            state["Store_Info"] = store
-            state["Retailer_ID"] = store["Retailer_ID"]
-            state["next_node"] = "get_retailer_info"
-            state["selection_failed"] = False
-            return state
-
-    # Construct retailer names list
-    # route_names = [f"{r['Retailer_ID']} - {r['Name']} - Sequence :{r['Visit_Sequence']}" for r in route]
+]
+
+@lru_cache(maxsize=1)
+def _select_prompt():
+    # Built on the first LLM fallback: most selections resolve locally and never need it
+    from langchain_core.prompts import ChatPromptTemplate
+    return ChatPromptTemplate.from_messages(SELECT_MESSAGES)
+
+
+def select_chain():
+    from langchain_core.output_parsers import StrOutputParser
+    return _select_prompt() | get_llm("select_retailer") | StrOutputParser()
+
+
+def _by_proximity(state: SalesRepState, route, user_message: str) -> Optional[RetailerMatch]:
+    text = user_message.lower()
+    if not set(re.findall(r"[a-z]+", text)) & NEAREST_WORDS:
+        return None
+    visited = [str(v) for v in state.get("visited_retailers") or []]
+    off_route = any(phrase in text for phrase in OFF_ROUTE)
+    position, _ = rep_position(state, route)
+    if position is None:
+        if off_route:
+            return RetailerMatch(None, 0.0, "nearest")
+        # Nowhere to measure from yet: the closest stop is the next one
+        return get_route_matcher(route).match("next", visited=visited, order=active_replan(state))
+
+    by_id = {str(r["Retailer_ID"]): r for r in route}
+    index = get_retailer_index()
+    if off_route:
+        hits = index.nearest(*position, exclude=visited + list(by_id))
+    else:
+        hits = index.nearest(*position, exclude=visited, among=list(by_id))
+    if not hits:
+        return RetailerMatch(None, 0.0, "nearest")
+    store, km = hits[0]
+    store = {**by_id.get(str(store["Retailer_ID"]), store), "Distance_km": round(km, 3)}
+    if off_route:
+        store["Off_Route"] = True
+    return RetailerMatch(store, 1.0, "off_route_nearest" if off_route else "nearest")
+
+
+def _off_route_by_id(user_message: str) -> Optional[RetailerMatch]:
+    """A drop-in at a store that is not on today's route, named by Retailer_ID."""
+    index = get_retailer_index()
+    for token in re.findall(r"[A-Za-z0-9_-]+", user_message):
+        store = index.get(token.upper())
+        if store is not None:
+            return RetailerMatch({**store, "Off_Route": True}, 1.0, "off_route_id")
+    return None
+
+
+def _local_match(state: SalesRepState, route, user_message: str) -> RetailerMatch:
+    """Proximity ("nearest"), then the route matcher, then an off-route Retailer_ID."""
+    match = _by_proximity(state, route, user_message)
+    if match is not None:
+        return match
+    match = get_route_matcher(route).match(
+        user_message, visited=state.get("visited_retailers"), order=active_replan(state),
+    )
+    if match.confidence < CONFIDENCE_THRESHOLD:
+        match = _off_route_by_id(user_message) or match
+    return match
+
+
+def _select_inputs(user_message: str, route) -> dict:
     route_names = [f"{r['Visit_Sequence']}. {r['Name']} (ID: {r['Retailer_ID']})" for r in route]
-    
-    # Run LLM chain
-    selected_name = select_chain.invoke({
+    return {
         "user_message": user_message,
         "route_names": "\n".join(route_names)
-    })
+    }
 
-    # Fuzzy match with original route
-    match = []
-    attempts = 10
-    while attempts > 0 and not match:
-        match = difflib.get_close_matches(selected_name.strip(), route_names, n=1, cutoff=0.4)
-        attempts -= 1
 
-    if not match:
+def _apply_match(match: RetailerMatch, user_message: str) -> Dict[str, Any]:
+    # Only the keys selection changes, so the checkpointer does not rewrite the rest of the state
+    if match.store is None or match.confidence < CONFIDENCE_THRESHOLD:
         # raise ValueError("No matching store found. Please rephrase.")
-        state["Retailer_ID"] = None
-        state["Store_Info"] = None
-        state["user_message"] = f"No matching store found for '{user_message}'. Showing route again."
-        state["next_node"] = "get_route"
-        state["selection_failed"] = True
-        return state
+        return {
+            "Retailer_ID": None,
+            "Store_Info": None,
+            "user_message": f"No matching store found for '{user_message}'. Showing route again.",
+            "next_node": "get_route",
+            "selection_failed": True,
+        }
+
+    logger.debug("select retailer: %s by %s (%.2f)", match.store["Retailer_ID"], match.method, match.confidence)
+    return {
+        "Retailer_ID": match.store["Retailer_ID"],
+        # A copy: route stops are shared with the route store
+        "Store_Info": dict(match.store),
+        "next_node": "get_retailer_info",
+        "selection_failed": False,
+    }
+
+
+def select_retailer_node(state: SalesRepState) -> Dict[str, Any]:
+    user_message = state.get("user_message", "")
+    route = beat_route(state)
 
-    matched_id = match[0].split(" - ")[0]
+    # 1) LOCAL MATCH: nearest / sequence / ordinal / "next" / Retailer_ID / fuzzy store name / off-route ID
+    match = _local_match(state, route, user_message)
 
-    # selected_store = next((r for r in route if r["Retailer_ID"] == matched_id), None)
-    selected_store = next((r for r in route if str(r["Retailer_ID"]) == matched_id), None)
+    # 2) LLM FALLBACK only when the local match is not confident enough
+    if match.confidence < CONFIDENCE_THRESHOLD:
+        selected_name = select_chain().invoke(_select_inputs(user_message, route))
+        match = get_route_matcher(route).match_llm_output(selected_name)
 
-    state["Retailer_ID"] = matched_id
-    state["Store_Info"] = selected_store
-    state["next_node"] = "get_retailer_info"
-    state["selection_failed"] = False
-    
-    return state
+    return _apply_match(match, user_message)
 
 
+async def aselect_retailer_node(state: SalesRepState) -> Dict[str, Any]:
+    """Async variant of select_retailer_node; only the LLM fallback awaits."""
+    user_message = state.get("user_message", "")
+    # The route is normally in memory; after a restart it is reloaded from the DB
+    route = await run_db(beat_route, state)
 
-SelectRetailer = RunnableLambda(select_retailer_node)
+    # "nearest" and off-route lookups may read the retailer index's counters
+    match = await run_db(_local_match, state, route, user_message)
 
+    if match.confidence < CONFIDENCE_THRESHOLD:
+        selected_name = await select_chain().ainvoke(_select_inputs(user_message, route))
+        match = get_route_matcher(route).match_llm_output(selected_name)
 
+    return _apply_match(match, user_message)
 
 
 
+SelectRetailer = RunnableLambda(select_retailer_node, afunc=aselect_retailer_node)
@@ -1,44 +1,90 @@
 # app.py
 import uuid
 import base64
-import sqlite3
 from io import BytesIO
 from PIL import Image
 
 import streamlit as st
-from langgraph.checkpoint.memory import MemorySaver
 
-from agent_orchastrator.sales_assist_orchastrator import build_agent_graph
+from agent_orchastrator.sales_assist_orchastrator import build_agent_graph, needs_route
+from agents.replan_route_agent import active_replan, follow_replan, rep_position
 from utils.get_sales_reps import get_active_agents
 from utils.get_day import get_current_day
+from utils.db import DB_PATH, fetch_one
+from utils.migrations import apply_migrations
+from utils.checkpointer import SQLiteCheckpointSaver, rep_thread_id
+from utils.graph_diagram import get_diagram_png
+from utils.order_outbox import get_order_outbox
+from utils.retailer_index import get_retailer_index
+from utils.state_store import beat_route, retailer_bundle
+from utils.intent import VIEW_INTENTS, parse_command
+from utils.telemetry import metrics, start_metrics_server
 
 
-DB_PATH = "sales_agent_co_pilot.db"
-
 # ---------- Helpers ----------
 def get_product_price(product_id: str) -> float:
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("SELECT Price FROM products WHERE Product_ID = ?", (product_id,))
-    row = cur.fetchone()
-    conn.close()
-    return float(row[0]) if row else 0.0
+    row = fetch_one("SELECT Price FROM products WHERE Product_ID = ?", (product_id,), db_path=DB_PATH)
+    return float(row["Price"]) if row else 0.0
 
 def ensure_list(val):
     return val if isinstance(val, list) else []
 
-def normalize_route(route_like):
-    if isinstance(route_like, dict) and "Beat_Route_Plan" in route_like:
-        return route_like.get("Beat_Route_Plan") or []
-    return route_like or []
+def format_distance(km: float) -> str:
+    return f"{km * 1000:.0f} m" if km < 1 else f"{km:.1f} km"
+
+METRICS_COLUMNS = {"node": "Node", "sql": "Statement", "llm": "LLM"}
+
+def _ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+def metrics_table(rows, kind):
+    """Rows of utils.telemetry's snapshot for one kind, as the Metrics tab shows them."""
+    table = []
+    for row in rows:
+        if row["kind"] != kind or not (row["count"] or row["cache_hits"] or row["cache_misses"]):
+            continue
+        line = {METRICS_COLUMNS[kind]: row["name"], "Calls": row["count"],
+                "p50 ms": _ms(row["p50_s"]), "p95 ms": _ms(row["p95_s"]), "p99 ms": _ms(row["p99_s"]),
+                "Errors": row["errors"]}
+        if kind == "node":
+            # Share of the node's time spent in SQLite / the LLM
+            line["SQL %"] = round(100 * row["sql_seconds"] / row["seconds"], 1) if row["seconds"] else None
+            line["LLM %"] = round(100 * row["llm_seconds"] / row["seconds"], 1) if row["seconds"] else None
+        elif kind == "sql":
+            line["Rows"] = int(row["rows"])
+        else:
+            line.update({"Prompt tokens": int(row["prompt_tokens"]), "Completion tokens": int(row["completion_tokens"]),
+                         "Cache hits": int(row["cache_hits"]), "Cache misses": int(row["cache_misses"])})
+        table.append(line)
+    return table
+
+def format_store_card(store, stock, recs, pitch):
+    stock_text = "\n".join([f"- {s['Product_Name']}: {s['Available_Stock']}" for s in stock])
+    rec_text = "\n".join([f"- {r['Product_Name']}" for r in recs])
+
+    where = ""
+    if store.get("Distance_km") is not None:
+        where = f"📍 {format_distance(store['Distance_km'])} away" + (" · off route" if store.get("Off_Route") else "")
+    elif store.get("Off_Route"):
+        where = "📍 off route"
+
+    return f"""### 🏬 {store['Name']} (ID: {store['Retailer_ID']})
+{where}
+
+**Last Visit Stock:**  
+{stock_text or 'No stock data'}
+
+**Recommended Products:**  
+{rec_text or 'No recommendations'}
+
+**Suggested Pitch:**  
+{pitch or 'No pitch available.'}
+"""
 
 
 # ---------- Streamlit App State ----------
 st.set_page_config(page_title="Sales Assistant", layout="wide")
 
-if "thread_id" not in st.session_state:
-    st.session_state.thread_id = str(uuid.uuid4())
-
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
@@ -52,13 +98,66 @@ if "show_cart_ui" not in st.session_state:
     st.session_state.show_cart_ui = False
 
 # ---------- Graph Setup ----------
-memory = MemorySaver()
-builder = build_agent_graph()
-executable_graph = builder.compile(checkpointer=memory)
-config = {"configurable": {"thread_id": st.session_state.thread_id}}
+@st.cache_resource
+def load_graph():
+    """Compiled once per process and shared by every session and rerun."""
+    apply_migrations(DB_PATH)  # no-op once the schema is current
+    get_order_outbox(DB_PATH).start()  # drain orders a previous process left queued
+    start_metrics_server()  # Prometheus /metrics, when TELEMETRY_PORT is set
+    return build_agent_graph().compile(checkpointer=SQLiteCheckpointSaver())
+
+
+executable_graph = load_graph()
+# The checkpoint thread is derived server-side from the selected rep (rep_thread_id) and
+# never put in the URL, so a link cannot be used to resume, or order in, another rep's session
+config = {"configurable": {"thread_id": st.session_state.get("thread_id")}}
+
+
+def store_details(retailer_id):
+    """Last-visit stock and recommendations of a store; they live beside the graph state, not in it."""
+    bundle = retailer_bundle(retailer_id, config) or {}
+    return ensure_list(bundle.get("Last_Visit_Stock")), ensure_list(bundle.get("Product_Recommendations"))
+
+
+def stream_graph_turn(state):
+    """
+    Runs one graph turn, rendering content as soon as it exists: the store card
+    once get_retailer_info finishes, then pitch / day summary tokens as they stream.
+
+    Returns:
+        The final graph state, same as executable_graph.invoke.
+    """
+    result = state
+    slot = st.empty()
+    store_info = None
+    streamed = ""
+
+    for mode, chunk in executable_graph.stream(state, config=config, stream_mode=["updates", "custom", "values"]):
+        if mode == "values":
+            result = chunk
+            continue
+        if mode == "updates":
+            info = (chunk or {}).get("get_retailer_info")
+            if not info or "Retailer_Info" not in info:
+                continue
+            store_info = (info["Retailer_Info"], *store_details(info["Retailer_Info"]["Retailer_ID"]))
+        elif mode == "custom":
+            streamed += chunk.get("token", "")
+
+        with slot.container():
+            with st.chat_message("assistant"):
+                if store_info:
+                    st.markdown(format_store_card(
+                        *store_info,
+                        streamed + "▌" if streamed else "_Writing pitch…_",
+                    ))
+                else:
+                    st.markdown(streamed + "▌")
+
+    return result
 
 # ---------- UI Tabs ----------
-tab1, tab2 = st.tabs(["Sales Rep Assistant", "Agentic Flow"])
+tab1, tab2, tab3 = st.tabs(["Sales Rep Assistant", "Agentic Flow", "Metrics"])
 
 
 # =====================================
@@ -69,15 +168,13 @@ with tab1:
 
     # First-time greeting
     if not st.session_state.messages:
-        weekday = get_current_day()
+        weekday = st.session_state.get("weekday") or get_current_day()
         sales_reps = get_active_agents()
         st.session_state.weekday = weekday
         st.session_state.sales_reps = sales_reps
 
-        st.session_state.messages.append({
-            "role": "assistant",
-            "content": f"Hello! Today is **{weekday}**. Please select your Sales Rep to begin."
-        })
+        greeting = f"Hello! Today is **{weekday}**. Please select your Sales Rep to begin."
+        st.session_state.messages.append({"role": "assistant", "content": greeting})
 
     # Display chat history
     for msg in st.session_state.messages:
@@ -89,7 +186,20 @@ with tab1:
         selected_rep = st.selectbox("Select Sales Rep", st.session_state.sales_reps)
         if st.button("Confirm"):
             st.session_state.sales_rep_id = selected_rep
-            
+            st.session_state.thread_id = config["configurable"]["thread_id"] = rep_thread_id(selected_rep)
+
+            # Resuming the rep's session for today (after a reload, restart or on another worker)
+            saved = executable_graph.get_state(config).values
+            if saved.get("sales_rep_id") == selected_rep:
+                st.session_state.graph_state = saved
+                st.session_state.weekday = saved.get("Weekday") or st.session_state.weekday
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": f"Welcome back, **{selected_rep}**! Your session was restored. "
+                               "Type **plan** to view route or **visit <store>** to continue.",
+                })
+                st.rerun()
+
             state = {
                 "sales_rep_id": selected_rep,
                 "Weekday": st.session_state.weekday,
@@ -102,7 +212,8 @@ with tab1:
             beat_id = result.get("Beat_ID", "N/A")
             st.session_state.messages.append({
                 "role": "assistant",
-                "content": f"✅ Assigned Beat: **{beat_id}**\n\nType **plan** to view route or **visit <store>** to begin."
+                "content": f"✅ Assigned Beat: **{beat_id}**\n\nType **plan** to view route or **visit <store>** to begin "
+                           "(**refresh** reloads the beat and route if they change during the day)."
             })
             st.rerun()
 
@@ -112,40 +223,94 @@ with tab1:
 
         if user_input:
             st.session_state.messages.append({"role": "user", "content": user_input})
+            command = parse_command(user_input)
+            intent = command["intent"]
 
             prev_state = st.session_state.graph_state
-            new_state = {
-                **prev_state,
+            # Only what this turn changes: the checkpointer already holds the rest of the session's state
+            turn_input = {
                 "sales_rep_id": st.session_state.sales_rep_id,
                 "Weekday": st.session_state.weekday,
-                "user_message": user_input
+                "user_message": user_input,
+                "Command": command,
+                # Orders are submitted from the cart, never by a chat turn
+                "visit_id": None,
             }
 
-            if "visit" not in user_input.lower():
+            if intent not in ("visit", "cart"):
                 st.session_state.show_cart_ui = False
 
-            result = executable_graph.invoke(new_state, config=config)
-            st.session_state.graph_state = result
+            # Views re-render what the last turn left in state, seen with this turn's
+            # message and command (e.g. the position in "nearby <lat>, <lon>"); the graph
+            # only runs for them when the beat/route is missing or stale (e.g. a new day)
+            view_state = {**prev_state, **turn_input}
+            if intent == "cart" or (intent in VIEW_INTENTS and not needs_route(view_state)):
+                result = view_state
+            else:
+                result = stream_graph_turn(turn_input)
+                st.session_state.graph_state = result
 
             # ----- Day Summary -----
-            if "day summary" in user_input.lower():
+            if intent == "day_summary":
                 summary = result.get("Day_Summary", "No summary available.")
                 st.session_state.messages.append({"role": "assistant", "content": summary})
                 st.rerun()
 
+            # ----- Refresh -----
+            # Later turns reuse the beat and route loaded for this rep and day; "refresh" reloads them
+            if intent == "refresh":
+                route = beat_route(result)
+                msg = f"🔄 Reloaded today's beat **{result.get('Beat_ID', 'N/A')}** ({len(route)} stops)."
+                st.session_state.messages.append({"role": "assistant", "content": msg})
+                st.rerun()
+
+            # ----- Cart -----
+            if intent == "cart":
+                lines = [f"- {i['Product_Name']} x {i['Quantity']} @ {i['Price']}" for i in st.session_state.cart]
+                if lines:
+                    msg = "### 🧾 Current Order\n" + "\n".join(lines)
+                else:
+                    msg = "🛒 The cart is empty. `visit <store>` to start an order."
+                st.session_state.messages.append({"role": "assistant", "content": msg})
+                st.rerun()
+
+            # ----- Stores Nearby -----
+            if intent == "nearby":
+                radius_km = command["radius_km"]
+                route = beat_route(result)
+                position, origin = rep_position(result, route)
+                if position is None:
+                    msg = ("📡 Not sure where you are yet. Visit a store first, or send your position, "
+                           "e.g. `nearby 12.9716, 77.5946`.")
+                else:
+                    seq = {str(r.get("Retailer_ID")): r.get("Visit_Sequence") for r in route}
+                    visited = set(map(str, result.get("visited_retailers", []) or []))
+                    lines = []
+                    for store, km in get_retailer_index().within(*position, radius_km):
+                        rid = str(store["Retailer_ID"])
+                        tag = "visited" if rid in visited else (f"stop {seq[rid]}" if rid in seq else "off route")
+                        lines.append(f"- {store['Name']} (ID: {rid}) · {format_distance(km)} · {tag}")
+                    where = "your position" if origin == "position" else "your last visit"
+                    msg = f"### 📡 Stores within {format_distance(radius_km)} of {where}\n" + (
+                        "\n".join(lines) or "None.") + "\n\n`visit nearest` opens the closest unvisited stop on the route; " \
+                        "`visit nearest off route` or `visit <ID>` a drop-in."
+                st.session_state.messages.append({"role": "assistant", "content": msg})
+                st.rerun()
+
             # ----- Show Route -----
             # if "plan" in user_input.lower():
             #     route = normalize_route(result.get("Beat_Route_Plan"))
             #     plan = "\n".join([f"{r['Visit_Sequence']}. {r['Name']} (ID: {r['Retailer_ID']})" for r in route])
             #     st.session_state.messages.append({"role": "assistant", "content": f"### 📍 Route Plan\n{plan}"})
             #     st.rerun()
-            if "plan" in user_input.lower():
-                route = normalize_route(result.get("Beat_Route_Plan"))
+            if intent in ("plan", "unvisited", "replan"):
+                # In re-planned order after a "replan"; stops keep their Visit_Sequence numbers for "visit N"
+                route = follow_replan(beat_route(result), active_replan(result))
                 # visited_retailers is expected to be a list of retailer IDs in the graph state
                 visited = set(map(str, result.get("visited_retailers", []) or []))
 
                 # If user asked for unvisited/remaining, filter out visited stores
-                show_only_unvisited = any(k in user_input.lower() for k in ("unvisited", "remaining", "pending", "not visited"))
+                show_only_unvisited = intent == "unvisited"
 
                 lines = []
                 for r in route:
@@ -164,48 +329,48 @@ with tab1:
                         msg = "No stores available in the route."
                 else:
                     msg = "### 📍 Route Plan\n" + "\n".join(lines)
+                    replan = result.get("Route_Replan") or {}
+                    if active_replan(result) and intent == "replan":
+                        origin = {"position": "your position", "last_visit": "your last visit"}.get(
+                            replan.get("origin"), "the next stop")
+                        msg = (f"🔁 Re-planned the remaining stops from {origin}: "
+                               f"{replan.get('km', 0):.1f} km (was {replan.get('previous_km', 0):.1f} km). "
+                               "`visit next` follows the new order.\n\n" + msg)
 
                 st.session_state.messages.append({"role": "assistant", "content": msg})
                 st.rerun()
 
             # ----- Visit Store -----
-            if "visit" in user_input.lower():
+            if intent == "visit":
                 store = result.get("Store_Info")
 
                 if not store:
                     # No match → Show plan again
-                    route = normalize_route(result.get("Beat_Route_Plan"))
+                    route = beat_route(result)
                     hint = "⚠️ Could not match the store. Try: `visit <store name/id/sequence>`"
                     plan = "\n".join([f"{r['Visit_Sequence']}. {r['Name']} (ID: {r['Retailer_ID']})" for r in route])
                     st.session_state.messages.append({"role": "assistant", "content": f"{hint}\n\n### Route\n{plan}"})
                     st.rerun()
 
-                stock = ensure_list(result.get("Last_Visit_Stock"))
-                recs = ensure_list(result.get("Product_Recommendations"))
+                stock, recs = store_details(store["Retailer_ID"])
                 pitch = result.get("Pitch", "")
 
-                stock_text = "\n".join([f"- {s['Product_Name']}: {s['Available_Stock']}" for s in stock])
-                rec_text = "\n".join([f"- {r['Product_Name']}" for r in recs])
-
                 st.session_state.messages.append({
                     "role": "assistant",
-                    "content": f"""### 🏬 {store['Name']} (ID: {store['Retailer_ID']})
-
-**Last Visit Stock:**  
-{stock_text or 'No stock data'}
-
-**Recommended Products:**  
-{rec_text or 'No recommendations'}
-
-**Suggested Pitch:**  
-{pitch or 'No pitch available.'}
-"""
+                    "content": format_store_card(store, stock, recs, pitch)
                 })
 
                 # ✅ Rerun here to show summary first, then UI below
                 st.session_state.show_cart_ui = True
                 st.rerun()
 
+            # ----- Anything else -----
+            if intent == "chat":
+                msg = ("🤔 Not sure what you need. Try `plan`, `plan unvisited`, `visit <store>`, `replan`, "
+                       "`nearby`, `cart` or `day summary`.")
+                st.session_state.messages.append({"role": "assistant", "content": msg})
+                st.rerun()
+
 
         # -----------------------
         # ✅ SECOND-PHASE UI RENDERING (Add-To-Cart)
@@ -220,7 +385,7 @@ with tab1:
             st.subheader("🛒 Add to Cart")
 
 
-            recs = ensure_list(result.get("Product_Recommendations"))
+            _, recs = store_details(store["Retailer_ID"])
             product_options = {r["Product_Name"]: r["Product_ID"] for r in recs}
 
             if product_options:
@@ -251,14 +416,19 @@ with tab1:
                 if st.button("Submit Order ✅"):
                     visit_id = str(uuid.uuid4())
                     order_state = {
-                        **result,
                         "visit_id": visit_id,
                         "retailer_id": store["Retailer_ID"],
                         "order_products": st.session_state.cart,
-                        "feedback": feedback
+                        "feedback": feedback,
+                        # No chat message: this turn only logs the order
+                        "user_message": "",
                     }
                     result2 = executable_graph.invoke(order_state, config=config)
                     st.session_state.graph_state = result2
+                    if result2.get("order_error"):
+                        # Cart and form stay up so the rep can submit again
+                        st.session_state.messages.append({"role": "assistant", "content": f"⚠️ {result2['order_error']}"})
+                        st.rerun()
                     st.session_state.cart = []
                     st.session_state.show_cart_ui = False
                     st.success("Order submitted! Continue with `visit next` or `plan`.")
@@ -268,14 +438,17 @@ with tab1:
                     visit_id = str(uuid.uuid4())
                     st.session_state.cart = []
                     order_state = {
-                        **result,
                         "visit_id": visit_id,
                         "retailer_id": store["Retailer_ID"],
                         "order_products": st.session_state.cart,
-                        "feedback": feedback
+                        "feedback": feedback,
+                        "user_message": "",
                     }
                     result2 = executable_graph.invoke(order_state, config=config)
                     st.session_state.graph_state = result2
+                    if result2.get("order_error"):
+                        st.session_state.messages.append({"role": "assistant", "content": f"⚠️ {result2['order_error']}"})
+                        st.rerun()
                     st.session_state.show_cart_ui = False
                     st.info("No order submitted. You can continue with `visit next` or `plan`.")
                     st.rerun()
@@ -287,11 +460,35 @@ with tab1:
 # ---------- tab 2 ----------
 with tab2:
     st.title("Agentic Flow")
-    png_bytes = executable_graph.get_graph().draw_mermaid_png()
-    image = Image.open(BytesIO(png_bytes))
-    st.image(image, caption="Agentic Flow Diagram")
-
-    if st.button("Export Graph PNG"):
-        b64 = base64.b64encode(png_bytes).decode()
-        href = f'<a href="data:image/png;base64,{b64}" download="sales_graph.png">Download PNG</a>'
-        st.markdown(href, unsafe_allow_html=True)
+    # Streamlit runs every tab's body on each rerun, so only draw when asked to
+    if st.toggle("Show diagram", key="show_graph_diagram"):
+        png_bytes = get_diagram_png(executable_graph)
+        image = Image.open(BytesIO(png_bytes))
+        st.image(image, caption="Agentic Flow Diagram")
+
+        if st.button("Export Graph PNG"):
+            b64 = base64.b64encode(png_bytes).decode()
+            href = f'<a href="data:image/png;base64,{b64}" download="sales_graph.png">Download PNG</a>'
+            st.markdown(href, unsafe_allow_html=True)
+
+
+# =====================================
+# TAB 3 — METRICS
+# =====================================
+with tab3:
+    st.title("Metrics")
+    st.caption(f"Every session in this process; percentiles over the last {metrics.window} calls of each.")
+    snapshot = metrics.snapshot()
+    for kind, title in (("node", "Graph nodes"), ("sql", "SQL statements"), ("llm", "LLM calls")):
+        st.subheader(title)
+        table = metrics_table(snapshot, kind)
+        if table:
+            st.dataframe(table, hide_index=True, use_container_width=True)
+        else:
+            st.caption("Nothing recorded yet.")
+
+    with st.expander("Prometheus text"):
+        st.code(metrics.render_prometheus(), language="text")
+    if st.button("Reset metrics"):
+        metrics.reset()
+        st.rerun()
@@ -0,0 +1,83 @@
+"""
+Throughput of concurrent "visit" turns on the async graph vs. the sync graph.
+
+Runs --sessions reps at once: the sync graph on a thread each, the async graph
+as tasks on one event loop. A fake chat model sleeps --llm-delay seconds per
+call, so no OpenAI key or network is needed. Run from the repo root:
+
+    python -m benchmarks.async_concurrency --rep A001 --weekday Monday --sessions 32
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Keep the agents offline and off the shared cache
+os.environ["LLM_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "llm_cache.db")
+os.environ["LLM_CACHE_BYPASS"] = "1"
+os.environ["PITCH_LOOKAHEAD"] = "0"
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langgraph.checkpoint.memory import MemorySaver
+
+import agents.get_pitch_summary_agent as pitch_agent
+from utils.llm_clients import llm_clients
+from agent_orchastrator.sales_assist_orchastrator import build_agent_graph, build_async_agent_graph
+
+
+PITCH = "Namaste! Stock on the fast movers was low last visit, so this week is a good time to top up."
+
+
+def turn_input(args):
+    return {"sales_rep_id": args.rep, "Weekday": args.weekday, "user_message": args.store}
+
+
+def session_config():
+    return {"configurable": {"thread_id": str(uuid.uuid4())}}
+
+
+def run_sync(args):
+    graph = build_agent_graph().compile(checkpointer=MemorySaver())
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+        results = list(pool.map(lambda _: graph.invoke(turn_input(args), config=session_config()),
+                                range(args.sessions)))
+    return time.perf_counter() - start, results
+
+
+async def run_async(args):
+    graph = build_async_agent_graph().compile(checkpointer=MemorySaver())
+    start = time.perf_counter()
+    results = await asyncio.gather(*(
+        graph.ainvoke(turn_input(args), config=session_config()) for _ in range(args.sessions)
+    ))
+    return time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rep", default="A001")
+    parser.add_argument("--weekday", default="Monday")
+    parser.add_argument("--store", default="visit 1")
+    parser.add_argument("--sessions", type=int, default=32)
+    parser.add_argument("--llm-delay", type=float, default=0.002)
+    args = parser.parse_args()
+
+    fake = FakeListChatModel(responses=[PITCH], sleep=args.llm_delay)
+    llm_clients.set(pitch_agent.LLM_NAME, fake)
+
+    sync_s, sync_results = run_sync(args)
+    async_s, async_results = asyncio.run(run_async(args))
+
+    print(f"sessions={args.sessions}")
+    print(f"sync graph, thread per rep : {sync_s * 1000:8.1f} ms")
+    print(f"async graph, one loop      : {async_s * 1000:8.1f} ms")
+    pitches = {r.get("Pitch") for r in sync_results + async_results}
+    assert pitches == {PITCH}, f"sync and async graphs disagree on the pitch: {pitches}"
+
+
+if __name__ == "__main__":
+    main()
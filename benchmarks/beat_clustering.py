@@ -0,0 +1,111 @@
+"""
+Quality and run time of pipelines.beats against beat_optimization.ipynb's MILP.
+
+Scatters --retailers retailers over a Bengaluru-sized area in uneven
+neighbourhood clusters, then assigns them to beats of MIN_BEAT_SIZE to
+MAX_BEAT_SIZE three ways:
+
+  milp     : the notebook - k-means centres, a double loop over
+             haversine.haversine for the distance matrix, and a PuLP/CBC
+             binary program with retailers x beats variables
+  assign   : pipelines.beats.assign_capacitated on the same k-means centres
+             (same objective as the MILP, so total km should match it)
+  iterated : pipelines.beats.cluster_beats as run in production (split into
+             regions of --region retailers, centres re-fitted until no
+             retailer moves)
+
+and reports, for each, seconds, total and mean km from retailer to its beat
+centre, and the smallest/largest beat. milp and assign are skipped above
+--milp-max retailers (milp also if pulp/haversine are not installed).
+
+    python -m benchmarks.beat_clustering --retailers 240,1000,5000,50000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from pipelines import beats
+
+
+def make_retailers(n, seed=0):
+    rng = np.random.default_rng(seed)
+    n_areas = max(n // 200, 3)
+    area_centres = np.column_stack([rng.normal(12.97, 0.06, n_areas), rng.normal(77.59, 0.06, n_areas)])
+    area = rng.choice(n_areas, n, p=rng.dirichlet(np.ones(n_areas)))
+    return area_centres[area] + rng.normal(0, 0.012, (n, 2))
+
+
+def notebook_milp(coords, centres, min_size, max_size):
+    """Cells 12-18 of beat_optimization.ipynb; returns (labels, distance matrix seconds)."""
+    import pulp
+    from haversine import haversine, Unit
+
+    n, k = len(coords), len(centres)
+    start = time.perf_counter()
+    dist_matrix = np.zeros((n, k))
+    for i in range(n):
+        for j in range(k):
+            dist_matrix[i][j] = haversine(tuple(coords[i]), tuple(centres[j]), unit=Unit.KILOMETERS)
+    matrix_s = time.perf_counter() - start
+
+    model = pulp.LpProblem("ConstrainedClustering", pulp.LpMinimize)
+    x = [[pulp.LpVariable(f"x_{i}_{j}", cat="Binary") for j in range(k)] for i in range(n)]
+    model += pulp.lpSum(dist_matrix[i][j] * x[i][j] for i in range(n) for j in range(k))
+    for i in range(n):
+        model += pulp.lpSum(x[i][j] for j in range(k)) == 1
+    for j in range(k):
+        model += pulp.lpSum(x[i][j] for i in range(n)) >= min_size
+        model += pulp.lpSum(x[i][j] for i in range(n)) <= max_size
+    model.solve(pulp.PULP_CBC_CMD(msg=0))
+    labels = np.array([next(j for j in range(k) if pulp.value(x[i][j]) > 0.5) for i in range(n)])
+    return labels, matrix_s
+
+
+def report(name, seconds, coords, centres, labels):
+    km = beats.haversine_km(coords[:, 0], coords[:, 1], centres[labels, 0], centres[labels, 1])
+    sizes = np.bincount(labels, minlength=len(centres))
+    print(f"  {name:9}{seconds:>9.2f}s{km.sum():>13,.1f}{km.mean():>9.3f}{sizes.min():>7}{sizes.max():>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--retailers", default="240,1000,5000,50000", help="comma-separated sizes")
+    parser.add_argument("--min-size", type=int, default=beats.MIN_BEAT_SIZE)
+    parser.add_argument("--max-size", type=int, default=beats.MAX_BEAT_SIZE)
+    parser.add_argument("--region", type=int, default=beats.REGION_RETAILERS)
+    parser.add_argument("--milp-max", type=int, default=2000, help="largest size to run the MILP on")
+    args = parser.parse_args()
+
+    for n in (int(size) for size in args.retailers.split(",")):
+        coords = make_retailers(n)
+        k = beats.beat_count(n, args.min_size, args.max_size)
+        start = time.perf_counter()
+        centres = beats.initial_centres(coords, k)
+        kmeans_s = time.perf_counter() - start
+        print(f"{n} retailers, {k} beats of {args.min_size}-{args.max_size} (k-means centres {kmeans_s:.1f}s)")
+        print(f"  {'':9}{'time':>10}{'total km':>13}{'mean km':>9}{'min':>7}{'max':>7}")
+
+        if n <= args.milp_max:
+            try:
+                start = time.perf_counter()
+                labels, matrix_s = notebook_milp(coords, centres, args.min_size, args.max_size)
+                report("milp", time.perf_counter() - start, coords, centres, labels)
+                start = time.perf_counter()
+                beats.distance_matrix_km(coords, centres)
+                print(f"  {'':9}distance matrix: loop {matrix_s:.3f}s, vectorized {time.perf_counter() - start:.4f}s")
+            except ImportError as e:
+                print(f"  milp     skipped ({e.name} not installed)")
+
+            start = time.perf_counter()
+            labels = beats.assign_capacitated(coords, centres, args.min_size, args.max_size)
+            report("assign", time.perf_counter() - start, coords, centres, labels)
+
+        start = time.perf_counter()
+        clusters = beats.cluster_beats(coords, k, args.min_size, args.max_size, region_retailers=args.region)
+        report("iterated", time.perf_counter() - start, coords, clusters.centres, clusters.labels)
+        print(f"  {'':9}({clusters.iterations} rounds, k-means included)")
+
+
+if __name__ == "__main__":
+    main()
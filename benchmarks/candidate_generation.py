@@ -0,0 +1,100 @@
+"""
+Recall and cost of candidate generation against ranking the full cross join.
+
+Builds the same synthetic database as benchmarks.recommendation_pipeline,
+fits the classifier once, then ranks top-N per retailer two ways:
+
+  full       : every product for every retailer (pipelines.recommendations.top_n_blocks)
+  candidates : only pipelines.candidates.generate_candidates' pairs
+
+and reports, for each, pairs ranked, classifier rows scored, run time and
+traced peak memory, plus the recall of the candidate top-N against the full
+top-N (the share of full-pass recommendations the candidate pass also makes).
+
+    python -m benchmarks.candidate_generation --retailers 20000 --products 5000
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.recommendation_pipeline import make_db
+from pipelines import candidates, recommendations
+
+
+def run_full(fs, clf):
+    scored = recommendations.score_combos(fs, classifier=clf)
+    keys = [r.astype(np.int64) * fs.shape[1] + p for r, p, _ in recommendations.top_n_blocks(fs, scored)]
+    return np.concatenate(keys), fs.shape[0] * fs.shape[1], scored.ml_score.size
+
+
+def run_candidates(fs, clf, sales, top_city, top_channel, top_segment, co_purchase):
+    product_codes = pd.Categorical(sales["Product_ID"], categories=fs.product_ids).codes
+    edges = candidates.co_purchase_neighbours(sales["Invoice_ID"], product_codes, fs.shape[1])
+    retailers, products = candidates.generate_candidates(fs, edges, top_city, top_channel, top_segment, co_purchase)
+    needed = np.zeros((len(fs.combo_city), fs.shape[1]), dtype=bool)
+    needed[fs.retailer_combo[retailers], products] = True
+    scored = recommendations.score_combos(fs, classifier=clf, needed=needed)
+    keys = [r.astype(np.int64) * fs.shape[1] + p
+            for r, p, _ in recommendations.top_n_candidates(fs, scored, retailers, products)]
+    return np.concatenate(keys), len(retailers), int(needed.sum())
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--retailers", type=int, default=20000)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--sales", type=int, default=400000)
+    parser.add_argument("--cities", type=int, default=20)
+    parser.add_argument("--channels", type=int, default=4)
+    parser.add_argument("--trees", type=int, default=20)
+    parser.add_argument("--top-city", type=int, default=candidates.TOP_CITY_SKUS)
+    parser.add_argument("--top-channel", type=int, default=candidates.TOP_CHANNEL_SKUS)
+    parser.add_argument("--top-segment", type=int, default=candidates.TOP_SEGMENT_SKUS)
+    parser.add_argument("--co-purchase", type=int, default=candidates.CO_PURCHASE_CANDIDATES)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, "recs.db")
+    make_db(db_path, args.retailers, args.products, args.sales, args.cities, args.channels)
+    inputs = recommendations.load_inputs(db_path)
+    fs = recommendations.build_features(inputs["sales"], inputs["retailers"], inputs["products"])
+    start = time.perf_counter()
+    clf = recommendations.train_classifier(fs, {"n_estimators": args.trees})
+    print(f"{args.retailers} retailers x {args.products} products, {args.sales:,} sales; "
+          f"classifier ({args.trees} trees) trained once in {time.perf_counter() - start:.1f}s")
+
+    (full_keys, full_pairs, full_rows), full_s, full_peak = measure(run_full, fs, clf)
+    (cand_keys, cand_pairs, cand_rows), cand_s, cand_peak = measure(
+        run_candidates, fs, clf, inputs["sales"], args.top_city, args.top_channel, args.top_segment, args.co_purchase,
+    )
+    recall = np.isin(full_keys, cand_keys).mean()
+
+    print(f"{'':11}{'pairs ranked':>15}{'clf rows':>12}{'time':>10}{'peak':>12}")
+    for name, pairs, rows, seconds, peak in [
+        ("full", full_pairs, full_rows, full_s, full_peak),
+        ("candidates", cand_pairs, cand_rows, cand_s, cand_peak),
+    ]:
+        print(f"{name:11}{pairs:>15,}{rows:>12,}{seconds:>9.1f}s{peak:>9.0f} MiB")
+    print(f"candidates per retailer: {cand_pairs / args.retailers:.1f}   "
+          f"recall of full top-N: {recall:.2%} ({len(full_keys):,} recommendations)")
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
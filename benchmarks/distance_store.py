@@ -0,0 +1,93 @@
+"""
+Cost of per-beat distance matrices: recomputed every run vs pipelines.distances.
+
+Splits --retailers synthetic retailers (benchmarks.beat_clustering's
+generator) into compact beats of at most --beat-size, then times
+
+  geodesic : beat_optimization.ipynb's geopy loop, on --sample beats and
+             scaled to all of them (skipped if geopy is not installed)
+  compute  : vectorized haversine for every beat, as pipelines.routes did
+  build    : a cold DistanceStore.refresh (matrices + neighbour pairs to disk)
+  refresh  : refresh again with nothing changed, then after --moved
+             retailers moved ~50 m
+  load     : memory-mapping every beat's matrix back
+
+    python -m benchmarks.distance_store --retailers 50000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.beat_clustering import make_retailers
+from pipelines import beats, distances
+
+
+def geodesic_matrix(coords):
+    from geopy.distance import geodesic
+
+    n = len(coords)
+    dist_matrix = np.zeros((n, n))
+    for i in range(n):
+        for j in range(i + 1, n):
+            dist_matrix[i][j] = dist_matrix[j][i] = geodesic(coords[i], coords[j]).km
+    return dist_matrix
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--retailers", type=int, default=50000)
+    parser.add_argument("--beat-size", type=int, default=beats.MAX_BEAT_SIZE)
+    parser.add_argument("--sample", type=int, default=20, help="beats the geodesic loop is timed on")
+    parser.add_argument("--moved", type=int, default=10)
+    args = parser.parse_args()
+
+    coords = make_retailers(args.retailers)
+    ids = np.array([f"R{i:06d}" for i in range(args.retailers)])
+    beat_map = {
+        f"B{b + 1:05d}": (ids[idx].tolist(), coords[idx])
+        for b, idx in enumerate(beats.split_regions(coords, args.beat_size))
+    }
+    store = distances.DistanceStore(os.path.join(tempfile.mkdtemp(), "distances"))
+    print(f"{args.retailers} retailers in {len(beat_map)} beats")
+
+    try:
+        sample = list(beat_map.values())[:args.sample]
+        seconds, _ = timed(lambda: [geodesic_matrix(c) for _, c in sample])
+        print(f"  {'geodesic':10}{seconds * len(beat_map) / len(sample):>9.1f}s  (scaled from {len(sample)} beats)")
+    except ImportError as e:
+        print(f"  geodesic  skipped ({e.name} not installed)")
+
+    seconds, _ = timed(lambda: [distances.distance_matrix(c) for _, c in beat_map.values()])
+    print(f"  {'compute':10}{seconds:>9.2f}s")
+    seconds, result = timed(lambda: store.refresh(beat_map))
+    size = sum(os.path.getsize(os.path.join(store.directory, f)) for f in os.listdir(store.directory))
+    print(f"  {'build':10}{seconds:>9.2f}s  {result['built']} matrices, {size / 2**20:.1f} MiB")
+    seconds, result = timed(lambda: store.refresh(beat_map))
+    print(f"  {'refresh':10}{seconds:>9.2f}s  unchanged: {result['built']} built")
+
+    rng = np.random.default_rng(1)
+    for i in rng.choice(args.retailers, args.moved, replace=False):
+        for beat_id, (beat_ids, beat_coords) in beat_map.items():
+            if ids[i] in beat_ids:
+                moved = beat_coords.copy()
+                moved[beat_ids.index(ids[i])] += 0.0005
+                beat_map[beat_id] = (beat_ids, moved)
+    seconds, result = timed(lambda: store.refresh(beat_map))
+    print(f"  {'refresh':10}{seconds:>9.2f}s  {args.moved} moved: {result['built']} built, {result['removed']} removed")
+
+    seconds, loaded = timed(lambda: [store.load(b, *r) for b, r in beat_map.items()])
+    assert all(m is not None for m in loaded)
+    print(f"  {'load':10}{seconds:>9.2f}s  (memory-mapped)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Submit latency and durability of order logging under write contention.
+
+Copies the sales DB to a temp dir, then submits --orders orders while a
+background writer keeps taking the database write lock for --hold-ms at a
+time (a stand-in for a notebook refresh or another worker's batch). It
+compares writing straight to the database with queueing through the order
+outbox, then checks that every order landed exactly once, including
+re-submits of the same visit_id. Run from the directory holding
+sales_agent_co_pilot.db:
+
+    python -m benchmarks.order_submit --orders 200 --hold-ms 50
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+from utils.db import DB_PATH, fetch_all, fetch_one, get_pool
+from utils.order_outbox import OrderOutbox, write_order
+
+
+def make_order(rng_products, retailer_id):
+    visit_id = str(uuid.uuid4())
+    return {
+        "visit_id": visit_id,
+        "invoice_id": f"INV_{visit_id}",
+        "retailer_id": retailer_id,
+        "agent_id": "BENCH",
+        "date": time.strftime("%Y-%m-%d"),
+        "products": [
+            {"Product_ID": pid, "Quantity": 2, "Available_Stock": 5, "Price": 10.0} for pid in rng_products
+        ],
+        "feedback": "",
+    }
+
+
+def contend(db_path, hold_s, stop):
+    pool = get_pool(db_path)
+    while not stop.is_set():
+        with pool.transaction():
+            time.sleep(hold_s)
+        time.sleep(hold_s / 4)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--orders", type=int, default=200)
+    parser.add_argument("--hold-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, "sales.db")
+    shutil.copy(args.db, db_path)
+    products = [r["Product_ID"] for r in fetch_all("SELECT Product_ID FROM products LIMIT 3", db_path=db_path)]
+    retailer_id = fetch_one("SELECT Retailer_ID FROM retailers LIMIT 1", db_path=db_path)["Retailer_ID"]
+
+    stop = threading.Event()
+    threading.Thread(target=contend, args=(db_path, args.hold_ms / 1000, stop), daemon=True).start()
+
+    # Direct: the rep waits for the database write lock on every submit
+    direct = []
+    for _ in range(args.orders):
+        order = make_order(products, retailer_id)
+        start = time.perf_counter()
+        with get_pool(db_path).transaction() as conn:
+            write_order(conn, order)
+        direct.append(time.perf_counter() - start)
+
+    # Outbox: the rep waits for one insert into the local outbox file
+    outbox = OrderOutbox(db_path, os.path.join(workdir, "outbox.db"))
+    queued, visit_ids = [], []
+    for _ in range(args.orders):
+        order = make_order(products, retailer_id)
+        visit_ids.append(order["visit_id"])
+        start = time.perf_counter()
+        outbox.submit(order)
+        queued.append(time.perf_counter() - start)
+    # Double-clicked "Submit Order": same visit_id again
+    for visit_id in visit_ids[:10]:
+        outbox.submit({**make_order(products, retailer_id), "visit_id": visit_id})
+
+    deadline = time.time() + 120
+    while outbox.pending() and time.time() < deadline:
+        time.sleep(0.05)
+    stop.set()
+    outbox.stop(timeout=5)
+
+    marks = ",".join("?" * len(visit_ids))
+    landed = fetch_one(f"SELECT count(*) AS n FROM visits WHERE Visit_ID IN ({marks})", visit_ids, db_path)["n"]
+    sales = fetch_one(f"SELECT count(*) AS n FROM sales WHERE Visit_ID IN ({marks})", visit_ids, db_path)["n"]
+
+    print(f"orders={args.orders} lock hold={args.hold_ms:.0f} ms")
+    print(f"direct write   : p50 {percentile(direct, 0.5):8.2f} ms   p99 {percentile(direct, 0.99):8.2f} ms")
+    print(f"outbox submit  : p50 {percentile(queued, 0.5):8.2f} ms   p99 {percentile(queued, 0.99):8.2f} ms")
+    print(f"outbox visits landed {landed}/{args.orders}, sales rows {sales}/{args.orders * len(products)}, "
+          f"pending {outbox.pending()}")
+    assert landed == args.orders and sales == args.orders * len(products), "orders were lost or duplicated"
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
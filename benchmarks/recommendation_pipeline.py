@@ -0,0 +1,186 @@
+"""
+Run time and peak memory of the recommendation pipeline on synthetic data.
+
+Builds a throwaway SQLite database with --retailers retailers spread over
+--cities cities and --channels channels, --products products and --sales
+sales rows over the last year (product popularity is Zipf-like, so a few
+SKUs dominate as in real order books), then times pipelines.recommendations
+stage by stage. Peak memory is the tracemalloc high-water mark (numpy
+buffers included) plus the process max RSS.
+
+It then rescores --rescore random retailers one at a time, the way each
+logged order does (utils.online_recommendations), and reports the latency.
+
+--baseline also runs the notebook's approach (materialised cross join,
+row-wise apply, groupby().apply(head)) on the same data; only try it at
+small sizes, it needs the whole retailers x products frame in memory.
+
+    python -m benchmarks.recommendation_pipeline --retailers 100000 --products 5000
+    python -m benchmarks.recommendation_pipeline --retailers 2000 --products 500 --baseline
+"""
+import argparse
+import os
+import resource
+import shutil
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from pipelines import recommendations
+from utils.online_recommendations import rescore_retailer
+
+
+def make_db(path, n_retailers, n_products, n_sales, n_cities, n_channels, seed=0):
+    rng = np.random.default_rng(seed)
+    retailer_ids = np.char.add("R", np.arange(n_retailers).astype(str))
+    product_ids = np.char.add("P", np.arange(n_products).astype(str))
+    today = datetime.today()
+
+    popularity = 1.0 / np.arange(1, n_products + 1) ** 0.8
+    popularity /= popularity.sum()
+    # ~3 lines per invoice; half the lines sit next to the invoice's anchor SKU,
+    # so there is co-purchase structure to find
+    n_invoices = max(n_sales // 3, 1)
+    invoice = rng.integers(0, n_invoices, n_sales)
+    invoice_retailer = rng.integers(0, n_retailers, n_invoices)
+    invoice_anchor = rng.choice(n_products, n_invoices, p=popularity)
+    invoice_dates = pd.to_datetime(today - pd.to_timedelta(rng.integers(0, 365, n_invoices), unit="D"))
+    product = np.where(
+        rng.random(n_sales) < 0.5,
+        (invoice_anchor[invoice] + rng.integers(1, 6, n_sales)) % n_products,
+        rng.choice(n_products, n_sales, p=popularity),
+    )
+    with sqlite3.connect(path) as conn:
+        pd.DataFrame({
+            "Retailer_ID": retailer_ids,
+            "City": np.char.add("City", rng.integers(0, n_cities, n_retailers).astype(str)),
+            "Channel": np.char.add("Channel", rng.integers(0, n_channels, n_retailers).astype(str)),
+        }).to_sql("retailers", conn, index=False)
+        pd.DataFrame({"Product_ID": product_ids}).to_sql("products", conn, index=False)
+        pd.DataFrame({
+            "Invoice_ID": np.char.add("INV", invoice.astype(str)),
+            "Retailer_ID": retailer_ids[invoice_retailer[invoice]],
+            "Product_ID": product_ids[product],
+            "Date": invoice_dates[invoice].strftime("%Y-%m-%d"),
+        }).to_sql("sales", conn, index=False)
+        # Primary keys of the real tables
+        conn.execute("CREATE UNIQUE INDEX retailers_pk ON retailers (Retailer_ID)")
+        conn.execute("CREATE UNIQUE INDEX products_pk ON products (Product_ID)")
+        conn.execute(recommendations.RECS_SCHEMA.format(table=recommendations.RECS_TABLE))
+
+
+def notebook_baseline(db_path, as_of, n_estimators):
+    """product_recommendation.ipynb, condensed; returns the number of recommendations."""
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import LabelEncoder
+
+    inputs = recommendations.load_inputs(db_path)
+    sales, retailers, products = inputs["sales"], inputs["retailers"], inputs["products"]
+    sales["Date"] = pd.to_datetime(sales["Date"])
+    recent_sales = sales[sales["Date"] >= as_of - timedelta(days=recommendations.RECENT_DAYS)]
+    recent_counts = recent_sales.groupby(["Retailer_ID", "Product_ID"]).size().reset_index(name="Recent_Purchase_Count")
+    city = sales.merge(retailers[["Retailer_ID", "City"]], on="Retailer_ID", how="left")
+    city = city.groupby(["City", "Product_ID"]).size().reset_index(name="City_Purchase_Count")
+    channel = sales.merge(retailers[["Retailer_ID", "Channel"]], on="Retailer_ID", how="left")
+    channel = channel.groupby(["Channel", "Product_ID"]).size().reset_index(name="Channel_Purchase_Count")
+
+    data = pd.merge(retailers, products, how="cross")
+    data = data.merge(recent_counts, on=["Retailer_ID", "Product_ID"], how="left")
+    data = data.merge(city, on=["City", "Product_ID"], how="left")
+    data = data.merge(channel, on=["Channel", "Product_ID"], how="left")
+    data.fillna(0, inplace=True)
+
+    thresholds = {c: data[c].median() for c in ["Recent_Purchase_Count", "City_Purchase_Count", "Channel_Purchase_Count"]}
+    rules = [
+        ("Recent_Purchase_Count", 3), ("City_Purchase_Count", 2), ("Channel_Purchase_Count", 1),
+    ]
+    data["Rule_Score"] = data.apply(
+        lambda row: sum(score for column, score in rules if row[column] > thresholds[column]), axis=1
+    )
+
+    data["Purchased_Label"] = (data["Recent_Purchase_Count"] > 0).astype(int)
+    data["City_Enc"] = LabelEncoder().fit_transform(data["City"])
+    data["Channel_Enc"] = LabelEncoder().fit_transform(data["Channel"])
+    X = data[["City_Enc", "Channel_Enc", "City_Purchase_Count", "Channel_Purchase_Count"]]
+    X_train, _, y_train, _ = train_test_split(X, data["Purchased_Label"], test_size=0.2, random_state=42)
+    clf = RandomForestClassifier(n_estimators=n_estimators, random_state=42, n_jobs=-1).fit(X_train, y_train)
+    data["ML_Score"] = clf.predict_proba(X)[:, 1]
+    data["Final_Score"] = 0.5 * data["ML_Score"] + 0.5 * (data["Rule_Score"] / data["Rule_Score"].max())
+
+    sku_counts = recent_sales.groupby("Retailer_ID")["Product_ID"].nunique().reset_index()
+    sku_counts.columns = ["Retailer_ID", "Unique_SKUs_Purchased"]
+    data = data.merge(sku_counts, on="Retailer_ID", how="left")
+    data["Unique_SKUs_Purchased"] = data["Unique_SKUs_Purchased"].fillna(5)
+    data["TopN"] = data["Unique_SKUs_Purchased"].apply(lambda x: int(min(round(x * 1.2), 10)))
+    data = data.sort_values(["Retailer_ID", "Final_Score"], ascending=[True, False])
+    recs = data.groupby("Retailer_ID").apply(lambda x: x.head(int(x["TopN"].iloc[0])))
+    return len(recs)
+
+
+def measure(fn, *args, **kwargs):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--retailers", type=int, default=100000)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--sales", type=int, default=2000000)
+    parser.add_argument("--cities", type=int, default=20)
+    parser.add_argument("--channels", type=int, default=4)
+    parser.add_argument("--trees", type=int, default=recommendations.CLASSIFIER_PARAMS["n_estimators"])
+    parser.add_argument("--chunk", type=int, default=recommendations.CHUNK_RETAILERS)
+    parser.add_argument("--rescore", type=int, default=50, help="single-retailer rescores to time")
+    parser.add_argument("--baseline", action="store_true", help="also run the notebook approach (small sizes only)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, "recs.db")
+    start = time.perf_counter()
+    make_db(db_path, args.retailers, args.products, args.sales, args.cities, args.channels)
+    print(f"synthetic db: {args.retailers} retailers x {args.products} products "
+          f"({args.retailers * args.products:,} pairs), {args.sales:,} sales "
+          f"[{time.perf_counter() - start:.1f}s to generate]")
+
+    as_of = datetime.today()
+    result, elapsed, peak = measure(
+        recommendations.run_pipeline, db_path, as_of,
+        classifier_params={"n_estimators": args.trees}, chunk_retailers=args.chunk,
+    )
+    print(f"pipeline : {elapsed:8.1f} s   peak traced {peak:8.0f} MiB   "
+          f"{result['recommendations']:,} recommendations")
+    print("  stages : " + ", ".join(f"{k} {v:.1f}s" for k, v in result["timings"].items()))
+
+    if args.rescore:
+        rng = np.random.default_rng(1)
+        latencies = []
+        for retailer, product in zip(rng.integers(0, args.retailers, args.rescore), rng.integers(0, args.products, args.rescore)):
+            start = time.perf_counter()
+            rescore_retailer(db_path, f"R{retailer}", [f"P{product}"])
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        print(f"rescore one retailer: p50 {latencies[len(latencies) // 2]:.1f} ms   "
+              f"p99 {latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)]:.1f} ms")
+
+    if args.baseline:
+        rows, elapsed, peak = measure(notebook_baseline, db_path, as_of, args.trees)
+        print(f"notebook : {elapsed:8.1f} s   peak traced {peak:8.0f} MiB   {rows:,} recommendations")
+
+    print(f"process max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Lookup latency of utils.retailer_index against scanning `retailers`.
+
+Writes --retailers synthetic retailers (the generator from
+benchmarks.beat_clustering) to a scratch SQLite file with migration 4's
+change counters, then times, from random points in the city:
+
+  scan    : SELECT every retailer's coordinates and rank by vectorized haversine
+  index   : get_retailer_index(...).nearest / .within, including the
+            per-lookup freshness check
+
+and the cost of picking up --appended new retailers (side list, no rebuild)
+against a full rebuild. Run from the repo root:
+
+    python -m benchmarks.retailer_index --retailers 50000
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.beat_clustering import make_retailers
+from pipelines.beats import haversine_km
+from utils.db import get_pool
+from utils.migrations import MIGRATIONS
+from utils.retailer_index import drop_retailer_index, get_retailer_index
+
+
+def make_db(path, coords):
+    with get_pool(path).transaction() as conn:
+        conn.execute(
+            "CREATE TABLE retailers (Retailer_ID TEXT PRIMARY KEY, Name TEXT, City TEXT, Channel TEXT, "
+            "Latitude REAL, Longitude REAL)"
+        )
+        for statement in next(s for v, _, s in MIGRATIONS if v == 4):
+            conn.execute(statement)
+        conn.executemany(
+            "INSERT INTO retailers VALUES (?, ?, 'Bengaluru', 'GT', ?, ?)",
+            [(f"R{i:06d}", f"Store {i}", float(lat), float(lon)) for i, (lat, lon) in enumerate(coords)],
+        )
+
+
+def scan_nearest(path, lat, lon, radius_km):
+    with get_pool(path).connection() as conn:
+        rows = conn.execute("SELECT Retailer_ID, Latitude, Longitude FROM retailers").fetchall()
+    km = haversine_km(lat, lon, [r["Latitude"] for r in rows], [r["Longitude"] for r in rows])
+    return rows[int(km.argmin())]["Retailer_ID"], int((km <= radius_km).sum())
+
+
+def timed(fn, points):
+    samples, results = [], []
+    for lat, lon in points:
+        start = time.perf_counter()
+        results.append(fn(lat, lon))
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), sorted(samples)[int(len(samples) * 0.99) - 1], results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--retailers", type=int, default=50000)
+    parser.add_argument("--lookups", type=int, default=500)
+    parser.add_argument("--radius", type=float, default=0.5, help="km for the radius query")
+    parser.add_argument("--appended", type=int, default=50)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "retailers.db")
+    coords = make_retailers(args.retailers)
+    make_db(path, coords)
+    rng = np.random.default_rng(1)
+    points = np.column_stack([
+        rng.uniform(coords[:, 0].min(), coords[:, 0].max(), args.lookups),
+        rng.uniform(coords[:, 1].min(), coords[:, 1].max(), args.lookups),
+    ])
+
+    start = time.perf_counter()
+    get_retailer_index(path)
+    print(f"{args.retailers} retailers, index built in {(time.perf_counter() - start) * 1000:.0f} ms")
+    print(f"  {'':16}{'p50 ms':>9}{'p99 ms':>9}")
+
+    p50, p99, scanned = timed(lambda lat, lon: scan_nearest(path, lat, lon, args.radius), points)
+    print(f"  {'scan':16}{p50:>9.3f}{p99:>9.3f}")
+    p50, p99, nearest = timed(lambda lat, lon: get_retailer_index(path).nearest(lat, lon)[0][0]["Retailer_ID"], points)
+    print(f"  {'index nearest':16}{p50:>9.3f}{p99:>9.3f}")
+    p50, p99, within = timed(lambda lat, lon: len(get_retailer_index(path).within(lat, lon, args.radius)), points)
+    print(f"  {'index within':16}{p50:>9.3f}{p99:>9.3f}")
+    agree = sum(s == (n, w) for s, n, w in zip(scanned, nearest, within))
+    print(f"  index agrees with the scan on {agree}/{len(points)} lookups")
+
+    new = make_retailers(args.appended, seed=1)
+    with get_pool(path).transaction() as conn:
+        conn.executemany(
+            "INSERT INTO retailers VALUES (?, ?, 'Bengaluru', 'GT', ?, ?)",
+            [(f"N{i:06d}", f"New {i}", float(lat), float(lon)) for i, (lat, lon) in enumerate(new)],
+        )
+    start = time.perf_counter()
+    index = get_retailer_index(path)
+    appended_ms = (time.perf_counter() - start) * 1000
+    drop_retailer_index(path)
+    start = time.perf_counter()
+    get_retailer_index(path)
+    rebuild_ms = (time.perf_counter() - start) * 1000
+    print(f"  {args.appended} new retailers: appended in {appended_ms:.1f} ms "
+          f"({len(index) - index.indexed} in the side list), full rebuild {rebuild_ms:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Latency and accuracy of the local retailer matcher on a corpus of rep phrasings.
+
+Builds synthetic routes with Faker-style company names and asks the matcher to
+resolve sequence numbers, ordinals, IDs, full / partial names and typos.
+Reports how many selections are resolved locally (confidence >= threshold),
+how many of those are correct, and per-selection latency. Run from the repo root:
+
+    python -m benchmarks.retailer_selection --routes 50 --stops 30
+"""
+import argparse
+import random
+import statistics
+import time
+
+from utils.retailer_matcher import CONFIDENCE_THRESHOLD, ORDINALS, RouteMatcher, get_route_matcher
+
+
+SURNAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez",
+    "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore",
+    "Jackson", "Martin", "Lee", "Perez", "Thompson", "White", "Harris", "Sanchez", "Clark", "Ramirez",
+    "Lewis", "Robinson", "Walker", "Young", "Allen", "King", "Wright", "Scott", "Torres", "Nguyen",
+    "Hill", "Flores", "Green", "Adams", "Nelson", "Baker", "Hall", "Rivera", "Campbell", "Mitchell",
+    "Carter", "Roberts", "Patel", "Sharma", "Reddy", "Iyer", "Nair", "Kapoor", "Mehta", "Rao",
+]
+SUFFIXES = ["LLC", "Inc", "Ltd", "Group", "PLC", "and Sons", "Traders", "Medicals", "Stores"]
+ORDINAL_WORDS = {v: k for k, v in ORDINALS.items() if k.endswith(("st", "nd", "rd", "th"))}
+
+
+def company_name(rng):
+    style = rng.random()
+    a, b, c = rng.sample(SURNAMES, 3)
+    if style < 0.35:
+        return f"{a} {rng.choice(SUFFIXES)}"
+    if style < 0.65:
+        return f"{a}-{b}"
+    if style < 0.85:
+        return f"{a}, {b} and {c}"
+    return f"{a} {b} {rng.choice(SUFFIXES)}"
+
+
+def make_route(rng, stops):
+    ids = rng.sample(range(1, 5000), stops)
+    return [
+        {"Retailer_ID": f"R{rid:04d}", "Name": company_name(rng), "Visit_Sequence": seq + 1}
+        for seq, rid in enumerate(ids)
+    ]
+
+
+def typo(rng, word):
+    if len(word) < 5:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    edit = rng.choice(["drop", "swap", "sub"])
+    if edit == "drop":
+        return word[:i] + word[i + 1:]
+    if edit == "swap":
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    return word[:i] + rng.choice("aeiou") + word[i + 1:]
+
+
+def distinctive_token(route, stop):
+    """A name token no other stop on the route shares, if any."""
+    others = {t.lower() for r in route if r is not stop for t in r["Name"].replace(",", " ").replace("-", " ").split()}
+    for token in stop["Name"].replace(",", " ").replace("-", " ").split():
+        if token.lower() not in others and len(token) >= 4:
+            return token
+    return None
+
+
+def phrasings(rng, route):
+    """Yields (message, visited, expected_stop, kind)."""
+    visited = [r["Retailer_ID"] for r in route[: rng.randrange(0, len(route) // 2)]]
+    nxt = route[len(visited)] if len(visited) < len(route) else None
+    for stop in route:
+        seq, rid, name = stop["Visit_Sequence"], stop["Retailer_ID"], stop["Name"]
+        yield f"visit {seq}", [], stop, "sequence"
+        yield f"visit store number {seq}", [], stop, "sequence"
+        if seq in ORDINAL_WORDS:
+            yield f"let's go to the {ORDINAL_WORDS[seq]} store", [], stop, "ordinal"
+        yield f"visit {rid}", [], stop, "id"
+        yield f"open {rid.lower().replace('r0', 'r', 1).lstrip('0')}", [], stop, "id"
+        yield f"visit {name}", [], stop, "name"
+        yield f"take me to {name.lower()}", [], stop, "name"
+        token = distinctive_token(route, stop)
+        if token:
+            yield f"visit {token}", [], stop, "partial"
+            yield f"visit {typo(rng, token)}", [], stop, "typo"
+            yield f"go to {typo(rng, name)}", [], stop, "typo"
+    if nxt:
+        yield "visit next", visited, nxt, "next"
+        yield "visit the next store", visited, nxt, "next"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--routes", type=int, default=50)
+    parser.add_argument("--stops", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    build_times, latencies = [], []
+    by_kind = {}
+    for _ in range(args.routes):
+        route = make_route(rng, args.stops)
+        start = time.perf_counter()
+        RouteMatcher(route)
+        build_times.append(time.perf_counter() - start)
+
+        for message, visited, expected, kind in phrasings(rng, route):
+            start = time.perf_counter()
+            found = get_route_matcher(route).match(message, visited=visited)
+            latencies.append(time.perf_counter() - start)
+
+            stats = by_kind.setdefault(kind, {"total": 0, "local": 0, "correct": 0, "wrong": 0})
+            stats["total"] += 1
+            if found.confidence >= CONFIDENCE_THRESHOLD:
+                stats["local"] += 1
+                ok = found.store is not None and found.store["Retailer_ID"] == expected["Retailer_ID"]
+                stats["correct" if ok else "wrong"] += 1
+
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1e6
+    p95 = latencies[int(len(latencies) * 0.95)] * 1e6
+    print(f"routes={args.routes} stops/route={args.stops} selections={len(latencies)}")
+    print(f"index build : median {statistics.median(build_times) * 1e6:8.1f} us")
+    print(f"selection   : p50 {p50:8.1f} us   p95 {p95:8.1f} us")
+    print(f"{'kind':<10}{'total':>8}{'local %':>10}{'accuracy %':>12}{'wrong':>8}")
+    totals = {"total": 0, "local": 0, "correct": 0, "wrong": 0}
+    for kind, stats in by_kind.items():
+        for k in totals:
+            totals[k] += stats[k]
+        local = 100 * stats["local"] / stats["total"]
+        accuracy = 100 * stats["correct"] / stats["local"] if stats["local"] else 0.0
+        print(f"{kind:<10}{stats['total']:>8}{local:>10.1f}{accuracy:>12.1f}{stats['wrong']:>8}")
+    local = 100 * totals["local"] / totals["total"]
+    accuracy = 100 * totals["correct"] / totals["local"] if totals["local"] else 0.0
+    print(f"{'all':<10}{totals['total']:>8}{local:>10.1f}{accuracy:>12.1f}{totals['wrong']:>8}")
+    print("Selections below the threshold fall back to the LLM selector.")
+
+
+if __name__ == "__main__":
+    main()
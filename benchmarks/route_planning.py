@@ -0,0 +1,87 @@
+"""
+Tour length and run time of pipelines.routes against beat_optimization.ipynb.
+
+Clusters --retailers synthetic retailers into beats with pipelines.beats
+(the same generator as benchmarks.beat_clustering), then orders each beat:
+
+  notebook : compute_tsp_route - geopy.geodesic distance matrix in Python
+             loops, networkx complete graph, greedy_tsp from the first
+             retailer of the beat
+  routes   : pipelines.routes.plan_beats - vectorized distances, greedy
+             start at the outermost retailer, 2-opt + Or-opt, across
+             --workers processes
+
+Tour lengths are all measured with the same haversine distances. The
+notebook is skipped above --notebook-max retailers (or if networkx/geopy
+are not installed).
+
+    python -m benchmarks.route_planning --retailers 5000 --workers 4
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.beat_clustering import make_retailers
+from pipelines import beats, routes
+
+
+def notebook_tour(coords):
+    """compute_tsp_route from beat_optimization.ipynb, returning the visit order."""
+    import networkx as nx
+    from geopy.distance import geodesic
+    from networkx.algorithms.approximation import greedy_tsp
+
+    n = len(coords)
+    dist_matrix = np.zeros((n, n))
+    for i in range(n):
+        for j in range(i + 1, n):
+            d = geodesic(coords[i], coords[j]).km
+            dist_matrix[i][j] = dist_matrix[j][i] = d
+    G = nx.complete_graph(n)
+    for i in range(n):
+        for j in range(n):
+            if i != j:
+                G[i][j]["weight"] = dist_matrix[i][j]
+    return np.array(greedy_tsp(G, weight="weight")[:-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--retailers", type=int, default=5000)
+    parser.add_argument("--workers", type=int, help="processes (default: one per CPU)")
+    parser.add_argument("--notebook-max", type=int, default=5000, help="largest size to run the notebook on")
+    args = parser.parse_args()
+
+    coords = make_retailers(args.retailers)
+    clusters = beats.cluster_beats(coords, max_iter=3)
+    beat_list = [
+        (f"B{b + 1:03d}", [str(i) for i in idx], coords[idx], None)
+        for b in range(len(clusters.centres))
+        for idx in [np.flatnonzero(clusters.labels == b)]
+    ]
+    print(f"{args.retailers} retailers in {len(beat_list)} beats of "
+          f"{clusters.sizes.min()}-{clusters.sizes.max()}")
+    print(f"  {'':10}{'time':>9}{'total km':>12}{'mean km':>10}")
+
+    if args.retailers <= args.notebook_max:
+        try:
+            start = time.perf_counter()
+            tours = [notebook_tour(c) for _, _, c, _ in beat_list]
+            elapsed = time.perf_counter() - start
+            lengths = [routes.tour_length(routes.distance_matrix(c), t) for (_, _, c, _), t in zip(beat_list, tours)]
+            print(f"  {'notebook':10}{elapsed:>8.2f}s{sum(lengths):>12.1f}{np.mean(lengths):>10.2f}")
+        except ImportError as e:
+            print(f"  notebook  skipped ({e.name} not installed)")
+
+    start = time.perf_counter()
+    planned = list(routes.plan_beats(beat_list, args.workers))
+    elapsed = time.perf_counter() - start
+    lengths = [length for _, length, _ in planned]
+    greedy = [g for _, _, g in planned]
+    print(f"  {'greedy':10}{'':>9}{sum(greedy):>12.1f}{np.mean(greedy):>10.2f}   (routes' starting tours)")
+    print(f"  {'routes':10}{elapsed:>8.2f}s{sum(lengths):>12.1f}{np.mean(lengths):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Cold-start time of the app: module imports, and import to first Streamlit render.
+
+Each sample runs in a fresh interpreter so nothing is warm in sys.modules.
+"import" times importing the graph module and compiling the graph; "render"
+runs app.py once through Streamlit's AppTest harness, the same work a
+container does before the first page is served. No OpenAI key is needed:
+LLM clients are only built on the first LLM call. Run from the directory
+holding sales_agent_co_pilot.db, with the repo on PYTHONPATH:
+
+    python -m benchmarks.startup --samples 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+from agent_orchastrator.sales_assist_orchastrator import build_agent_graph
+imported = time.perf_counter()
+build_agent_graph().compile()
+print(imported - start, time.perf_counter() - start)
+"""
+
+RENDER_SNIPPET = """
+import time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file({app!r}, default_timeout=120)
+app.run()
+assert not app.exception, app.exception
+print(time.perf_counter() - start)
+"""
+
+
+def sample(snippet: str, env: dict) -> list:
+    out = subprocess.run(
+        [sys.executable, "-c", snippet], env=env, capture_output=True, text=True, check=True
+    ).stdout.strip().splitlines()[-1]
+    return [float(x) for x in out.split()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--skip-render", action="store_true", help="only time imports (no Streamlit needed)")
+    args = parser.parse_args()
+
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [REPO_ROOT, os.getenv("PYTHONPATH")]))}
+    # Startup must not depend on the key being present
+    env.pop("OPENAI_API_KEY", None)
+
+    imports = [sample(IMPORT_SNIPPET, env) for _ in range(args.samples)]
+    print(f"samples={args.samples}")
+    print(f"import graph module      : median {statistics.median(i[0] for i in imports) * 1000:8.1f} ms")
+    print(f"import + compile graph   : median {statistics.median(i[1] for i in imports) * 1000:8.1f} ms")
+
+    if not args.skip_render:
+        snippet = RENDER_SNIPPET.format(app=os.path.join(REPO_ROOT, "app.py"))
+        renders = [sample(snippet, env)[0] for _ in range(args.samples)]
+        print(f"import to first render   : median {statistics.median(renders) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
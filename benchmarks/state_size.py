@@ -0,0 +1,135 @@
+"""
+Graph state and checkpoint size over one rep's day.
+
+Plays a day the way app.py does - "plan", then "visit next" and an order
+for each stop on the route, then "day summary" - on the sync graph with the
+SQLite checkpointer in a temp file, and reports per kind of turn
+
+  written : bytes the checkpointer wrote (channel blobs, checkpoints, writes)
+  state   : size of the serialized graph state after the turn
+  copy    : time to deep-copy that state (what a snapshot of it costs)
+
+--input full sends the whole previous state back as the turn's input, the
+way app.py used to ({**prev_state, ...}); --input delta sends only the keys
+the turn changes, as app.py does now. Both run the current, slim
+SalesRepState, so the difference is the input alone, not the state schema.
+Fake chat models stand in for OpenAI. Orders go through the outbox into the
+co-pilot database, which is migrated first (as app.py does). Run from the
+repo root:
+
+    python -m benchmarks.state_size --rep A001 --weekday Monday
+"""
+import argparse
+import copy
+import os
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+
+# Keep the agents offline and off the shared cache
+os.environ["LLM_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "llm_cache.db")
+os.environ["LLM_CACHE_BYPASS"] = "1"
+os.environ["PITCH_LOOKAHEAD"] = "0"
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from utils.checkpointer import SQLiteCheckpointSaver
+from utils.db import DB_PATH
+from utils.llm_clients import llm_clients
+from utils.migrations import apply_migrations
+from utils.state_store import beat_route
+from agent_orchastrator.sales_assist_orchastrator import build_agent_graph
+
+
+PITCH = "Namaste! Stock on the fast movers was low last visit, so this week is a good time to top up."
+
+WRITTEN_QUERY = """
+    SELECT (SELECT coalesce(sum(length(Blob)), 0) FROM checkpoint_blobs)
+         + (SELECT coalesce(sum(length(Checkpoint) + length(Metadata)), 0) FROM checkpoints)
+         + (SELECT coalesce(sum(length(Value)), 0) FROM checkpoint_writes) AS Bytes
+"""
+
+
+def written_bytes(saver):
+    with saver._pool().connection() as conn:
+        return conn.execute(WRITTEN_QUERY).fetchone()["Bytes"]
+
+
+def state_bytes(saver, state):
+    return len(saver.serde.dumps_typed(state)[1])
+
+
+def copy_seconds(state, repeat=5):
+    # Best of a few: the pitch and outbox threads would otherwise add their own noise
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        copy.deepcopy(state)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def play_day(args, mode):
+    saver = SQLiteCheckpointSaver(os.path.join(tempfile.mkdtemp(), "checkpoints.db"), keep_last=10**6)
+    graph = build_agent_graph().compile(checkpointer=saver)
+    config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+    stats = defaultdict(list)
+    state = {}
+
+    def turn(kind, delta):
+        nonlocal state
+        before = written_bytes(saver)
+        start = time.perf_counter()
+        result = graph.invoke({**state, **delta} if mode == "full" else delta, config=config)
+        seconds = time.perf_counter() - start
+        stats[kind].append((
+            written_bytes(saver) - before, state_bytes(saver, result), copy_seconds(result), seconds,
+        ))
+        state = result
+        return result
+
+    result = turn("start", {"sales_rep_id": args.rep, "Weekday": args.weekday, "user_message": ""})
+    for _ in range(min(len(beat_route(result)), args.stops)):
+        turn("plan", {"user_message": "plan"})
+        result = turn("visit", {"user_message": "visit next"})
+        turn("order", {
+            "visit_id": str(uuid.uuid4()),
+            "order_products": [{"Product_ID": "P001", "Product_Name": "-", "Quantity": 2, "Price": 10.0,
+                                "Available_Stock": 5}],
+            "feedback": "",
+            "user_message": "",
+        })
+    turn("day summary", {"user_message": "day summary"})
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rep", default="A001")
+    parser.add_argument("--weekday", default="Monday")
+    parser.add_argument("--stops", type=int, default=1000, help="stops to visit (at most the whole route)")
+    parser.add_argument("--input", choices=["full", "delta", "both"], default="both")
+    args = parser.parse_args()
+
+    # The day summary reads the daily rollups the migrations create
+    apply_migrations(DB_PATH)
+    for name in ("pitch", "select_retailer", "day_summary"):
+        llm_clients.set(name, FakeListChatModel(responses=[PITCH]))
+
+    for mode in (["full", "delta"] if args.input == "both" else [args.input]):
+        stats = play_day(args, mode)
+        print(f"--input {mode}")
+        print(f"  {'turn':12}{'n':>4}{'written KiB':>13}{'state KiB':>11}{'copy us':>9}{'turn ms':>9}")
+        total = 0
+        for kind, rows in stats.items():
+            n = len(rows)
+            total += sum(r[0] for r in rows)
+            print(f"  {kind:12}{n:>4}{sum(r[0] for r in rows) / n / 1024:>13.1f}{sum(r[1] for r in rows) / n / 1024:>11.1f}"
+                  f"{sum(r[2] for r in rows) / n * 1e6:>9.1f}{sum(r[3] for r in rows) / n * 1000:>9.1f}")
+        first, last = stats["start"][0][1], stats["day summary"][-1][1]
+        print(f"  day total: {total / 1024:.0f} KiB written; state {first / 1024:.1f} -> {last / 1024:.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
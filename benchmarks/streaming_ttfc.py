@@ -0,0 +1,79 @@
+"""
+Time-to-first-content of a "visit" turn with streaming vs. a blocking invoke.
+
+Uses a fake chat model that emits one character every --token-delay seconds,
+so no OpenAI key or network is needed. Run from the repo root:
+
+    python -m benchmarks.streaming_ttfc --rep A001 --weekday Monday
+"""
+import argparse
+import os
+import tempfile
+import time
+import uuid
+
+# Keep the agents offline and off the shared cache
+os.environ["LLM_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "llm_cache.db")
+os.environ["LLM_CACHE_BYPASS"] = "1"
+os.environ["PITCH_LOOKAHEAD"] = "0"
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langgraph.checkpoint.memory import MemorySaver
+
+import agents.get_pitch_summary_agent as pitch_agent
+from utils.llm_clients import llm_clients
+from agent_orchastrator.sales_assist_orchastrator import build_agent_graph
+
+
+PITCH = (
+    "Namaste! Your last visit showed low stock on the fast movers, so this is a good week to "
+    "top up. I have three products your customers keep asking for, and they sell well here."
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rep", default="A001")
+    parser.add_argument("--weekday", default="Monday")
+    parser.add_argument("--store", default="visit 1")
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    args = parser.parse_args()
+
+    fake = FakeListChatModel(responses=[PITCH], sleep=args.token_delay)
+    llm_clients.set(pitch_agent.LLM_NAME, fake)
+
+    graph = build_agent_graph().compile(checkpointer=MemorySaver())
+    config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+    state = graph.invoke({"sales_rep_id": args.rep, "Weekday": args.weekday, "user_message": ""}, config=config)
+    turn = {**state, "user_message": args.store}
+
+    # Blocking: nothing can be shown until invoke returns
+    start = time.perf_counter()
+    graph.invoke(turn, config=config)
+    blocking_s = time.perf_counter() - start
+    # Forget the pitch recorded by the blocking run so the streaming run calls the model again
+    pitch_agent.pitch_pregenerator.cancel(config["configurable"]["thread_id"])
+
+    # Streaming: store card on the get_retailer_info update, then pitch tokens
+    start = time.perf_counter()
+    first_card = first_token = None
+    tokens = 0
+    for mode, chunk in graph.stream(turn, config=config, stream_mode=["updates", "custom"]):
+        now = time.perf_counter() - start
+        if mode == "updates" and "get_retailer_info" in chunk and first_card is None:
+            first_card = now
+        elif mode == "custom":
+            tokens += 1
+            first_token = first_token if first_token is not None else now
+    streaming_s = time.perf_counter() - start
+
+    print(f"blocking invoke          : {blocking_s * 1000:8.1f} ms to first content")
+    print(f"streaming store card     : {(first_card or 0) * 1000:8.1f} ms")
+    print(f"streaming first token    : {(first_token or 0) * 1000:8.1f} ms")
+    print(f"streaming complete       : {streaming_s * 1000:8.1f} ms ({tokens} chunks)")
+    assert first_card is not None and first_card < blocking_s, "store card was not streamed ahead of the pitch"
+    assert tokens > 1, "pitch was not streamed token by token"
+
+
+if __name__ == "__main__":
+    main()
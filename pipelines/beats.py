@@ -0,0 +1,382 @@
+import argparse
+import sqlite3
+import time
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.db import DB_PATH, get_pool
+
+
+# Same objective as the MILP in beat_optimization.ipynb - every retailer goes to
+# one beat, beats hold MIN_BEAT_SIZE..MAX_BEAT_SIZE retailers, total haversine
+# distance to the beat centres is minimised - without a binary variable per
+# (retailer, beat). For fixed centres that program is a transportation problem,
+# whose LP relaxation already has an integral optimum, so it is solved as a
+# sparse LP, starting from each retailer's nearest few beats and adding pairs
+# only while they can still lower the total. Centres then move to their
+# members' mean and the assignment is re-solved (a capacitated k-means). Large
+# maps are first cut into regions of REGION_RETAILERS, clustered one by one.
+# The notebook's 12 beats for 240 retailers is what beat_count gives by default.
+MIN_BEAT_SIZE = 16
+MAX_BEAT_SIZE = 24
+# Pairs the assignment LP starts from (each retailer's nearest beats) and adds
+# per retailer per pricing round; the result is exact either way, this only
+# trades LP size against rounds
+CANDIDATE_BEATS = 8
+# Retailers priced per block; memory is PRICING_BLOCK x n_beats float64s
+PRICING_BLOCK = 2000
+# Beyond this many retailers, the map is split into regions solved one by one:
+# the LP is exact but its cost grows faster than linearly
+REGION_RETAILERS = 1000
+# Re-centre / re-assign rounds; 1 keeps the k-means centres, like the notebook
+MAX_ITER = 10
+SEED = 42
+
+# Mean Earth radius, as in the haversine package the notebook used
+EARTH_RADIUS_KM = 6371.0088
+
+BEAT_MAP_TABLE = "retailer_beat_map_optimized"
+BEAT_MAP_SCHEMA = f"CREATE TABLE IF NOT EXISTS {BEAT_MAP_TABLE} (Retailer_ID TEXT, Beat_ID TEXT)"
+
+
+@dataclass
+class BeatClusters:
+    """Capacitated clustering of retailers into beats."""
+    # Per retailer: index of its beat (row of `centres`)
+    labels: np.ndarray
+    # (n_beats, 2) latitude/longitude of each beat's centre
+    centres: np.ndarray
+    # Per retailer: haversine km to its beat's centre
+    distance_km: np.ndarray
+    iterations: int
+
+    @property
+    def sizes(self) -> np.ndarray:
+        return np.bincount(self.labels, minlength=len(self.centres))
+
+
+# ---------- Distances ----------
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Great-circle km between points given in degrees; arguments broadcast like numpy arrays."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def distance_matrix_km(points: np.ndarray, centres: np.ndarray) -> np.ndarray:
+    """(n_points, n_centres) haversine km between (lat, lon) rows."""
+    return haversine_km(points[:, None, 0], points[:, None, 1], centres[None, :, 0], centres[None, :, 1])
+
+
+def _planar_km(coords: np.ndarray, origin: np.ndarray) -> np.ndarray:
+    """Equirectangular x/y km around `origin`; close enough to rank neighbours within a city."""
+    lat0 = np.radians(origin[0])
+    rad = np.radians(coords - origin)
+    return EARTH_RADIUS_KM * np.column_stack([rad[:, 1] * np.cos(lat0), rad[:, 0]])
+
+
+def nearest(points: np.ndarray, targets: np.ndarray, k: int, origin: np.ndarray) -> np.ndarray:
+    """(n_points, k) indices of each point's k nearest targets, nearest first."""
+    from scipy.spatial import cKDTree
+
+    k = min(k, len(targets))
+    _, idx = cKDTree(_planar_km(targets, origin)).query(_planar_km(points, origin), k=k)
+    return idx.reshape(len(points), k)
+
+
+# ---------- Clustering ----------
+def beat_count(n_retailers: int, min_size: int = MIN_BEAT_SIZE, max_size: int = MAX_BEAT_SIZE) -> int:
+    """Beats of about (min_size + max_size) / 2 retailers, within what the size bounds allow."""
+    lowest, highest = -(-n_retailers // max_size), n_retailers // min_size
+    if lowest > highest:
+        raise ValueError(f"{n_retailers} retailers cannot be split into beats of {min_size}-{max_size}")
+    return int(np.clip(round(n_retailers * 2 / (min_size + max_size)), lowest, highest))
+
+
+def initial_centres(coords: np.ndarray, num_beats: int, seed: int = SEED) -> np.ndarray:
+    """K-means centres, as the notebook seeds its MILP."""
+    from sklearn.cluster import KMeans
+
+    return KMeans(n_clusters=num_beats, random_state=seed).fit(coords).cluster_centers_
+
+
+def candidate_pairs(coords: np.ndarray, centres: np.ndarray, candidates: int, max_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (retailer, beat) pairs the assignment LP starts from: each retailer's
+    `candidates` nearest beats, plus each beat's 2 * max_size nearest
+    retailers so an outlying centre can be filled without pricing rounds.
+
+    Returns:
+        Retailer and beat indices, sorted by retailer then beat.
+    """
+    origin = coords.mean(axis=0)
+    k = len(centres)
+    by_retailer = nearest(coords, centres, candidates, origin)
+    by_beat = nearest(centres, coords, 2 * max_size, origin)
+    keys = np.unique(np.concatenate([
+        np.arange(len(coords))[:, None] * k + by_retailer,
+        by_beat * k + np.arange(k)[:, None],
+    ], axis=None))
+    return keys // k, keys % k
+
+
+def _price_pairs(
+    coords: np.ndarray, centres: np.ndarray, retailer_dual: np.ndarray, beat_dual: np.ndarray, per_retailer: int
+) -> np.ndarray:
+    """
+    (retailer * n_beats + beat) keys of pairs whose reduced cost is negative,
+    at most `per_retailer` (the most negative) per retailer.
+    """
+    k = len(centres)
+    found = []
+    for lo in range(0, len(coords), PRICING_BLOCK):
+        block = coords[lo:lo + PRICING_BLOCK]
+        reduced = distance_matrix_km(block, centres) - retailer_dual[lo:lo + PRICING_BLOCK, None] - beat_dual
+        best = np.argsort(reduced, axis=1)[:, :per_retailer]
+        rows = np.arange(len(block))[:, None]
+        improving = reduced[rows, best] < -1e-9
+        found.append(((rows + lo) * k + best)[improving])
+    return np.concatenate(found)
+
+
+def assign_capacitated(
+    coords: np.ndarray,
+    centres: np.ndarray,
+    min_size: int = MIN_BEAT_SIZE,
+    max_size: int = MAX_BEAT_SIZE,
+    candidates: int = CANDIDATE_BEATS,
+) -> np.ndarray:
+    """
+    Minimum total distance assignment of retailers to the fixed `centres`,
+    every beat holding min_size..max_size retailers - the notebook MILP's
+    optimum.
+
+    The LP starts from candidate_pairs, with penalised slack so it is always
+    feasible, and pairs whose reduced cost (from the LP duals) is negative
+    are added until there are none: the restricted optimum is then optimal
+    over every (retailer, beat) pair.
+
+    Returns:
+        Per retailer, the index of its centre.
+    """
+    from scipy import sparse
+    from scipy.optimize import linprog
+
+    n, k = len(coords), len(centres)
+    if not k * min_size <= n <= k * max_size:
+        raise ValueError(f"{n} retailers cannot fill {k} beats of {min_size}-{max_size}")
+
+    # Costlier than any chain of reassignments, so slack is only used if the bounds are infeasible
+    span = haversine_km(*coords.min(axis=0), *coords.max(axis=0))
+    penalty = (k + 1) * (span + 1.0)
+    retailer, beat = candidate_pairs(coords, centres, candidates, max_size)
+    while True:
+        m = len(retailer)
+        variables = np.arange(m)
+        ones = np.ones(m)
+        # Columns: one per pair, then "retailer i unassigned", then "beat j short of min_size"
+        one_beat_each = sparse.hstack([
+            sparse.csr_matrix((ones, (retailer, variables)), shape=(n, m)),
+            sparse.identity(n),
+            sparse.csr_matrix((n, k)),
+        ])
+        beat_size = sparse.csr_matrix((ones, (beat, variables)), shape=(k, m))
+        a_ub = sparse.vstack([
+            sparse.hstack([beat_size, sparse.csr_matrix((k, n + k))]),
+            sparse.hstack([-beat_size, sparse.csr_matrix((k, n)), -sparse.identity(k)]),
+        ])
+        result = linprog(
+            np.concatenate([
+                haversine_km(coords[retailer, 0], coords[retailer, 1], centres[beat, 0], centres[beat, 1]),
+                np.full(n + k, penalty),
+            ]),
+            A_ub=a_ub,
+            b_ub=np.concatenate([np.full(k, max_size), np.full(k, -min_size)]),
+            A_eq=one_beat_each,
+            b_eq=np.ones(n),
+            bounds=(0, None),
+            method="highs-ds",
+        )
+        if result.status != 0:
+            raise ValueError(f"Beat assignment failed: {result.message}")
+
+        # Reduced cost of pair (i, j): distance - dual(i assigned once) - dual(j <= max) + dual(j >= min)
+        duals = result.ineqlin.marginals
+        new = _price_pairs(coords, centres, result.eqlin.marginals, duals[:k] - duals[k:], candidates)
+        new = new[~np.isin(new, retailer * k + beat)]
+        if not len(new):
+            break
+        retailer, beat = np.concatenate([retailer, new // k]), np.concatenate([beat, new % k])
+
+    if result.x[m:].max() > 0.5:
+        raise ValueError(f"{n} retailers cannot fill {k} beats of {min_size}-{max_size}")
+    # Transportation problem: the simplex vertex it returns is already 0/1
+    chosen = result.x[:m] > 0.5
+    labels = np.empty(n, dtype=np.int64)
+    labels[retailer[chosen]] = beat[chosen]
+    return labels
+
+
+def split_regions(coords: np.ndarray, max_retailers: int = REGION_RETAILERS) -> List[np.ndarray]:
+    """Indices of compact regions of at most max_retailers, by halving the longer side at its median."""
+    xy = _planar_km(coords, coords.mean(axis=0))
+    regions, pending = [], [np.arange(len(coords))]
+    while pending:
+        idx = pending.pop()
+        if len(idx) <= max_retailers:
+            regions.append(idx)
+            continue
+        axis = np.ptp(xy[idx], axis=0).argmax()
+        idx = idx[np.argsort(xy[idx, axis], kind="stable")]
+        pending += [idx[:len(idx) // 2], idx[len(idx) // 2:]]
+    return regions
+
+
+def _beats_per_region(sizes: np.ndarray, num_beats: Optional[int], min_size: int, max_size: int) -> np.ndarray:
+    if num_beats is None:
+        return np.array([beat_count(n, min_size, max_size) for n in sizes])
+    # Proportional to retailers, largest remainders first
+    quota = num_beats * sizes / sizes.sum()
+    beats = np.floor(quota).astype(int)
+    beats[np.argsort(beats - quota)[:num_beats - beats.sum()]] += 1
+    if np.any(beats * min_size > sizes) or np.any(beats * max_size < sizes):
+        raise ValueError(f"{sizes.sum()} retailers cannot be split into {num_beats} beats of {min_size}-{max_size}")
+    return beats
+
+
+def _cluster_region(
+    coords: np.ndarray, num_beats: int, min_size: int, max_size: int, max_iter: int, candidates: int, seed: int,
+) -> Tuple[np.ndarray, np.ndarray, int]:
+    centres = initial_centres(coords, num_beats, seed)
+    labels, iterations = None, 0
+    for iterations in range(1, max(max_iter, 1) + 1):
+        previous, labels = labels, assign_capacitated(coords, centres, min_size, max_size, candidates)
+        if previous is not None and np.array_equal(previous, labels):
+            break
+        if iterations < max_iter:
+            sizes = np.bincount(labels, minlength=num_beats)[:, None]
+            centres = np.column_stack([
+                np.bincount(labels, weights=coords[:, 0], minlength=num_beats),
+                np.bincount(labels, weights=coords[:, 1], minlength=num_beats),
+            ]) / sizes
+    return labels, centres, iterations
+
+
+def cluster_beats(
+    coords: np.ndarray,
+    num_beats: Optional[int] = None,
+    min_size: int = MIN_BEAT_SIZE,
+    max_size: int = MAX_BEAT_SIZE,
+    max_iter: int = MAX_ITER,
+    candidates: int = CANDIDATE_BEATS,
+    region_retailers: int = REGION_RETAILERS,
+    seed: int = SEED,
+) -> BeatClusters:
+    """
+    Splits retailers into compact beats of min_size..max_size.
+
+    Args:
+        coords (np.ndarray): (n, 2) latitude/longitude per retailer.
+        num_beats (int): Number of beats; by default sized from the bounds (see beat_count).
+        max_iter (int): Assignment rounds; stops early once no retailer changes beat.
+        region_retailers (int): Larger inputs are split into regions of at most this many
+            retailers, clustered independently (no beat crosses a region border).
+
+    Returns:
+        The beat of each retailer, the beat centres and per-retailer distances.
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    regions = split_regions(coords, region_retailers)
+    region_beats = _beats_per_region(np.array([len(r) for r in regions]), num_beats, min_size, max_size)
+
+    labels = np.empty(len(coords), dtype=np.int64)
+    centres, iterations, offset = [], 0, 0
+    for idx, beats in zip(regions, region_beats):
+        region_labels, region_centres, rounds = _cluster_region(
+            coords[idx], beats, min_size, max_size, max_iter, candidates, seed,
+        )
+        labels[idx] = region_labels + offset
+        centres.append(region_centres)
+        iterations, offset = max(iterations, rounds), offset + beats
+    centres = np.concatenate(centres)
+
+    distance = haversine_km(coords[:, 0], coords[:, 1], centres[labels, 0], centres[labels, 1])
+    return BeatClusters(labels, centres, distance, iterations)
+
+
+# ---------- Load / write ----------
+def load_retailers(db_path: str = DB_PATH) -> pd.DataFrame:
+    with closing(sqlite3.connect(db_path)) as conn:
+        return pd.read_sql_query("SELECT Retailer_ID, Latitude, Longitude FROM retailers ORDER BY rowid", conn)
+
+
+def beat_ids(labels: np.ndarray) -> np.ndarray:
+    """B001, B002, ... as the notebook numbers its beats."""
+    return np.char.add("B", np.char.zfill((labels + 1).astype(str), 3))
+
+
+def write_beat_map(db_path: str, retailer_ids: np.ndarray, labels: np.ndarray) -> int:
+    """Replaces retailer_beat_map_optimized in one transaction."""
+    rows = list(zip(retailer_ids.tolist(), beat_ids(labels).tolist()))
+    with get_pool(db_path).transaction() as conn:
+        conn.execute(BEAT_MAP_SCHEMA)
+        conn.execute(f"DELETE FROM {BEAT_MAP_TABLE}")
+        conn.executemany(f"INSERT INTO {BEAT_MAP_TABLE} (Retailer_ID, Beat_ID) VALUES (?, ?)", rows)
+    return len(rows)
+
+
+# ---------- Pipeline ----------
+def run_beats(
+    db_path: str = DB_PATH,
+    num_beats: Optional[int] = None,
+    min_size: int = MIN_BEAT_SIZE,
+    max_size: int = MAX_BEAT_SIZE,
+    max_iter: int = MAX_ITER,
+) -> Dict[str, Any]:
+    """
+    Rebuilds retailer_beat_map_optimized from the retailers' coordinates.
+
+    Retailers without coordinates are left out of the map.
+
+    Returns:
+        Beat count and sizes, distance to centre stats and seconds taken.
+    """
+    start = time.perf_counter()
+    retailers = load_retailers(db_path).dropna(subset=["Latitude", "Longitude"])
+    clusters = cluster_beats(retailers[["Latitude", "Longitude"]].to_numpy(), num_beats, min_size, max_size, max_iter)
+    written = write_beat_map(db_path, retailers["Retailer_ID"].to_numpy(), clusters.labels)
+    return {
+        "retailers": written,
+        "beats": len(clusters.centres),
+        "min_size": int(clusters.sizes.min()),
+        "max_size": int(clusters.sizes.max()),
+        "total_km": float(clusters.distance_km.sum()),
+        "mean_km": float(clusters.distance_km.mean()),
+        "iterations": clusters.iterations,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=f"Rebuild {BEAT_MAP_TABLE} (capacitated beat clustering).")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--beats", type=int, help="number of beats (default: sized from --min-size/--max-size)")
+    parser.add_argument("--min-size", type=int, default=MIN_BEAT_SIZE)
+    parser.add_argument("--max-size", type=int, default=MAX_BEAT_SIZE)
+    parser.add_argument("--iterations", type=int, default=MAX_ITER, help="re-centre/re-assign rounds")
+    args = parser.parse_args()
+
+    result = run_beats(args.db, args.beats, args.min_size, args.max_size, args.iterations)
+    print(
+        f"{args.db}: {result['retailers']} retailers in {result['beats']} beats "
+        f"of {result['min_size']}-{result['max_size']}, {result['mean_km']:.2f} km mean to centre "
+        f"({result['iterations']} rounds, {result['seconds']:.1f}s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
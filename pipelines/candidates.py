@@ -0,0 +1,144 @@
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+from pipelines.recommendations import CHUNK_RETAILERS, FeatureSet, buyers_per_combo
+
+
+# Candidate generation ahead of scoring: instead of ranking every product for
+# every retailer, each retailer only gets a bounded set to score -
+#   - everything it bought recently (these carry the biggest rule score),
+#   - the best sellers of its city and of its channel (what the popularity
+#     rules favour), and the SKUs most retailers of its City x Channel segment
+#     bought recently (what the classifier is trained to predict),
+#   - products often bought in the same invoice as its recent purchases.
+# Work and memory then grow with retailers x candidates, not retailers x SKUs.
+TOP_CITY_SKUS = 15
+TOP_CHANNEL_SKUS = 15
+TOP_SEGMENT_SKUS = 15
+# Neighbours kept per product, and co-purchase candidates kept per retailer
+CO_PURCHASE_NEIGHBOURS = 20
+CO_PURCHASE_CANDIDATES = 10
+
+
+def top_skus(counts: np.ndarray, k: int) -> np.ndarray:
+    """(n_groups, k) indices of each row's k largest counts, in no particular order."""
+    k = min(k, counts.shape[1])
+    if k == counts.shape[1]:
+        return np.broadcast_to(np.arange(k), (counts.shape[0], k))
+    return np.argpartition(-counts, k - 1, axis=1)[:, :k]
+
+
+def _rank_within(groups: np.ndarray) -> np.ndarray:
+    """Position of each element within its run, for an array sorted by group."""
+    return np.arange(len(groups)) - np.searchsorted(groups, groups)
+
+
+def co_purchase_neighbours(
+    invoices: pd.Series, product_codes: np.ndarray, n_products: int, k: int = CO_PURCHASE_NEIGHBOURS
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    The k products most often on the same invoice as each product.
+
+    Returns:
+        (product, neighbour, invoices in common) edges, sorted by product.
+    """
+    from scipy import sparse
+
+    known = product_codes >= 0
+    invoice_codes = pd.factorize(invoices[known])[0]
+    if not len(invoice_codes):
+        empty = np.zeros(0, dtype=np.int32)
+        return empty, empty, np.zeros(0, dtype=np.float32)
+
+    baskets = sparse.csr_matrix(
+        (np.ones(len(invoice_codes), dtype=np.float32), (invoice_codes, product_codes[known])),
+        shape=(invoice_codes.max() + 1, n_products),
+    )
+    # A product on an invoice twice is still one basket
+    baskets.data[:] = 1.0
+    together = (baskets.T @ baskets).tocoo()
+
+    off_diagonal = together.row != together.col
+    product, neighbour, weight = together.row[off_diagonal], together.col[off_diagonal], together.data[off_diagonal]
+    order = np.lexsort((neighbour, -weight, product))
+    product, neighbour, weight = product[order], neighbour[order], weight[order]
+    keep = _rank_within(product) < k
+    return product[keep].astype(np.int32), neighbour[keep].astype(np.int32), weight[keep]
+
+
+def _co_purchase_candidates(
+    fs: FeatureSet, edges: Tuple[np.ndarray, np.ndarray, np.ndarray], k: int, chunk_retailers: int = CHUNK_RETAILERS
+) -> np.ndarray:
+    """(retailer * n_products + product) keys of each retailer's k strongest co-purchase neighbours."""
+    n_retailers, n_products = fs.shape
+    edge_product, edge_neighbour, edge_weight = edges
+    recent_keys = fs.recent_retailer.astype(np.int64) * n_products + fs.recent_product
+    bounds = np.searchsorted(fs.recent_retailer, np.arange(0, n_retailers + chunk_retailers, chunk_retailers))
+
+    # A block of retailers at a time: expanding every recent purchase into its
+    # neighbours at once would cost more memory than the candidates themselves
+    picked = []
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        products = fs.recent_product[lo:hi]
+        starts = np.searchsorted(edge_product, products, side="left")
+        counts = np.searchsorted(edge_product, products, side="right") - starts
+        total = int(counts.sum())
+        if not total:
+            continue
+
+        # Every (retailer, neighbour of one of its recent products) edge, flattened
+        offsets = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(total)
+        retailer = np.repeat(fs.recent_retailer[lo:hi].astype(np.int64), counts)
+        keys = retailer * n_products + edge_neighbour[offsets]
+
+        # Score a neighbour by its co-purchases summed over the retailer's recent
+        # products; ones it already bought are candidates anyway
+        keys, inverse = np.unique(keys, return_inverse=True)
+        weight = np.bincount(inverse, weights=edge_weight[offsets])
+        new = ~np.isin(keys, recent_keys[lo:hi], assume_unique=True)
+        keys, weight = keys[new], weight[new]
+
+        order = np.lexsort((keys, -weight, keys // n_products))
+        keys = keys[order]
+        picked.append(keys[_rank_within(keys // n_products) < k])
+    return np.concatenate(picked) if picked else np.zeros(0, dtype=np.int64)
+
+
+def generate_candidates(
+    fs: FeatureSet,
+    co_purchase_edges: Tuple[np.ndarray, np.ndarray, np.ndarray] = None,
+    top_city: int = TOP_CITY_SKUS,
+    top_channel: int = TOP_CHANNEL_SKUS,
+    top_segment: int = TOP_SEGMENT_SKUS,
+    co_purchase: int = CO_PURCHASE_CANDIDATES,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The (retailer, product) pairs worth scoring, at most
+    recent purchases + top_city + top_channel + top_segment + co_purchase per retailer.
+
+    Recent purchases are always included; scoring relies on it to patch in
+    their Recent_Purchase_Count.
+
+    Returns:
+        Retailer and product indices, sorted by retailer then product.
+    """
+    n_retailers, n_products = fs.shape
+    retailers = np.arange(n_retailers, dtype=np.int64)[:, None]
+    city_top = top_skus(fs.city_counts, top_city)[fs.combo_city[fs.retailer_combo]]
+    channel_top = top_skus(fs.channel_counts, top_channel)[fs.combo_channel[fs.retailer_combo]]
+    segment_buyers = buyers_per_combo(fs).reshape(len(fs.combo_city), n_products)
+    segment_top = top_skus(segment_buyers, top_segment)[fs.retailer_combo]
+
+    parts = [
+        fs.recent_retailer.astype(np.int64) * n_products + fs.recent_product,
+        (retailers * n_products + city_top).ravel(),
+        (retailers * n_products + channel_top).ravel(),
+        (retailers * n_products + segment_top).ravel(),
+    ]
+    if co_purchase_edges is not None and co_purchase:
+        parts.append(_co_purchase_candidates(fs, co_purchase_edges, co_purchase))
+
+    keys = np.unique(np.concatenate(parts))
+    return (keys // n_products).astype(np.int32), (keys % n_products).astype(np.int32)
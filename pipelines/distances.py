@@ -0,0 +1,204 @@
+import argparse
+import hashlib
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from pipelines.beats import BEAT_MAP_TABLE, haversine_km, nearest
+from utils.db import DB_PATH
+
+
+# Pairwise haversine km per beat, computed once and kept on disk as float32
+# .npy files that planners open memory-mapped (np.load(mmap_mode="r")), so
+# route planning, re-planning and worker processes share the OS page cache
+# instead of each recomputing and holding their own copy.
+#
+# Each file is keyed by its beat and a hash of the beat's retailer set - the
+# sorted (Retailer_ID, Latitude, Longitude) rows - and rows/columns follow
+# that sorted order. A retailer that moves or joins a beat changes only that
+# beat's key, so a refresh rebuilds that beat (and its pairs) and keeps every
+# other file. Besides the square per-beat matrices, each beat gets a
+# rectangular matrix against each of its NEIGHBOUR_BEATS nearest beats (by
+# centroid), for planners that weigh moving stores across a beat border.
+DISTANCE_DIR = os.getenv("DISTANCE_MATRIX_DIR", ".distance_matrices")
+NEIGHBOUR_BEATS = 3
+# float32 keeps ~0.1 m resolution at city scale at half the size of float64
+DTYPE = np.float32
+
+BeatRetailers = Tuple[List[str], np.ndarray]
+
+
+# ---------- Keys ----------
+def in_key_order(ids: Iterable[str], coords: np.ndarray) -> Tuple[List[str], np.ndarray]:
+    """Retailer ids and (lat, lon) rows sorted by Retailer_ID, the order stored matrices use."""
+    ids = [str(i) for i in ids]
+    order = sorted(range(len(ids)), key=ids.__getitem__)
+    return [ids[i] for i in order], np.asarray(coords, dtype=np.float64).reshape(-1, 2)[order]
+
+
+def retailer_set_key(ids: Iterable[str], coords: np.ndarray) -> str:
+    """Version of one beat's retailer set; changes when a retailer joins, leaves or moves."""
+    ids, coords = in_key_order(ids, coords)
+    digest = hashlib.sha256("\n".join(ids).encode("utf-8"))
+    digest.update(np.ascontiguousarray(coords).tobytes())
+    return digest.hexdigest()[:16]
+
+
+# ---------- Store ----------
+class DistanceStore:
+    """
+    Directory of per-beat distance matrices.
+
+    Files are `<beat>.<key>.npy` (square, the beat's retailers in key order)
+    and `<beat>+<other>.<key>.<other key>.npy` (the beat's retailers x the
+    neighbouring beat's). They are written to a temp file and renamed, so a
+    planner never maps a half-written matrix.
+    """
+
+    def __init__(self, directory: str = DISTANCE_DIR):
+        self.directory = directory
+
+    def beat_path(self, beat_id: str, key: str) -> str:
+        return os.path.join(self.directory, f"{beat_id}.{key}.npy")
+
+    def pair_path(self, beat_id: str, other_id: str, key: str, other_key: str) -> str:
+        return os.path.join(self.directory, f"{beat_id}+{other_id}.{key}.{other_key}.npy")
+
+    def load(self, beat_id: str, ids: Iterable[str], coords: np.ndarray) -> Optional[Tuple[List[str], np.ndarray]]:
+        """
+        The stored matrix for this beat's current retailers, memory-mapped.
+
+        Returns:
+            (Retailer_IDs in matrix order, read-only (n, n) float32 memmap),
+            or None if no matrix matches the retailers as given.
+        """
+        ordered, _ = in_key_order(ids, coords)
+        path = self.beat_path(beat_id, retailer_set_key(ids, coords))
+        if not os.path.exists(path):
+            return None
+        return ordered, np.load(path, mmap_mode="r")
+
+    def load_pair(
+        self, beat_id: str, beat: BeatRetailers, other_id: str, other: BeatRetailers,
+    ) -> Optional[np.ndarray]:
+        """(len(beat), len(other)) km between two neighbouring beats' retailers (key order), or None."""
+        forward = self.pair_path(beat_id, other_id, retailer_set_key(*beat), retailer_set_key(*other))
+        if os.path.exists(forward):
+            return np.load(forward, mmap_mode="r")
+        backward = self.pair_path(other_id, beat_id, retailer_set_key(*other), retailer_set_key(*beat))
+        if os.path.exists(backward):
+            return np.load(backward, mmap_mode="r").T
+        return None
+
+    def _write(self, path: str, matrix: np.ndarray) -> None:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, matrix.astype(DTYPE, copy=False))
+        os.replace(tmp_path, path)
+
+    def refresh(self, beats: Dict[str, BeatRetailers], neighbours: int = NEIGHBOUR_BEATS) -> Dict[str, int]:
+        """
+        Writes the matrices `beats` needs that are not on disk yet and removes
+        the rest (old keys, beats that no longer exist).
+
+        Args:
+            beats (Dict[str, BeatRetailers]): Beat_ID -> (Retailer_IDs, (n, 2) lat/lon).
+            neighbours (int): Nearest beats to store a cross matrix with; 0 for none.
+
+        Returns:
+            Matrices built and kept, and stale files removed.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        keyed = {b: (retailer_set_key(*r), *in_key_order(*r)) for b, r in beats.items() if len(r[0])}
+        wanted, built = set(), 0
+
+        for beat_id, (key, _, coords) in keyed.items():
+            path = self.beat_path(beat_id, key)
+            wanted.add(os.path.basename(path))
+            if not os.path.exists(path):
+                self._write(path, distance_matrix(coords))
+                built += 1
+
+        for beat_id, other_id in neighbour_pairs({b: k[2] for b, k in keyed.items()}, neighbours):
+            (key, _, coords), (other_key, _, other_coords) = keyed[beat_id], keyed[other_id]
+            path = self.pair_path(beat_id, other_id, key, other_key)
+            wanted.add(os.path.basename(path))
+            if not os.path.exists(path):
+                self._write(path, cross_matrix(coords, other_coords))
+                built += 1
+
+        removed = 0
+        for name in os.listdir(self.directory):
+            if name.endswith(".npy") and name not in wanted:
+                os.remove(os.path.join(self.directory, name))
+                removed += 1
+        return {"built": built, "kept": len(wanted) - built, "removed": removed}
+
+
+# ---------- Matrices ----------
+def distance_matrix(coords: np.ndarray) -> np.ndarray:
+    """(n, n) float32 haversine km between (lat, lon) rows."""
+    return cross_matrix(coords, coords)
+
+
+def cross_matrix(coords: np.ndarray, other: np.ndarray) -> np.ndarray:
+    """(n, m) float32 haversine km between two sets of (lat, lon) rows."""
+    return haversine_km(coords[:, None, 0], coords[:, None, 1], other[None, :, 0], other[None, :, 1]).astype(DTYPE)
+
+
+def neighbour_pairs(beat_coords: Dict[str, np.ndarray], neighbours: int = NEIGHBOUR_BEATS) -> List[Tuple[str, str]]:
+    """Unordered (Beat_ID, Beat_ID) pairs, each beat with its `neighbours` nearest beats by centroid."""
+    beat_ids = sorted(beat_coords)
+    if neighbours <= 0 or len(beat_ids) < 2:
+        return []
+    centroids = np.array([beat_coords[b].mean(axis=0) for b in beat_ids])
+    closest = nearest(centroids, centroids, neighbours + 1, centroids.mean(axis=0))
+    pairs = {
+        tuple(sorted((beat_ids[i], beat_ids[j])))
+        for i, row in enumerate(closest) for j in row if j != i
+    }
+    return sorted(pairs)
+
+
+# ---------- Pipeline ----------
+def load_beats(db_path: str = DB_PATH, beat_map: str = BEAT_MAP_TABLE) -> Dict[str, BeatRetailers]:
+    from pipelines.routes import load_beat_retailers
+
+    return {
+        beat_id: (group["Retailer_ID"].astype(str).tolist(), group[["Latitude", "Longitude"]].to_numpy())
+        for beat_id, group in load_beat_retailers(db_path, beat_map).groupby("Beat_ID", sort=True)
+    }
+
+
+def run_distances(
+    db_path: str = DB_PATH,
+    beat_map: str = BEAT_MAP_TABLE,
+    directory: str = DISTANCE_DIR,
+    neighbours: int = NEIGHBOUR_BEATS,
+) -> Dict[str, Any]:
+    """Brings the distance store in `directory` up to date with `beat_map` and the retailers' coordinates."""
+    start = time.perf_counter()
+    beats = load_beats(db_path, beat_map)
+    result = DistanceStore(directory).refresh(beats, neighbours)
+    return {"beats": len(beats), **result, "seconds": time.perf_counter() - start}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build / refresh the per-beat distance matrices.")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--beat-map", default=BEAT_MAP_TABLE, help="table mapping Retailer_ID to Beat_ID")
+    parser.add_argument("--dir", default=DISTANCE_DIR)
+    parser.add_argument("--neighbours", type=int, default=NEIGHBOUR_BEATS, help="cross matrices per beat (0: none)")
+    args = parser.parse_args()
+
+    result = run_distances(args.db, args.beat_map, args.dir, args.neighbours)
+    print(
+        f"{args.dir}: {result['beats']} beats, {result['built']} matrices built, {result['kept']} kept, "
+        f"{result['removed']} stale removed in {result['seconds']:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
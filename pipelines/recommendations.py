@@ -0,0 +1,627 @@
+import argparse
+import sqlite3
+import time
+from contextlib import closing
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.db import DB_PATH, get_pool
+from utils.online_recommendations import FEATURE_TABLES, replay_sales_since, rescore_retailer, save_model
+
+
+# Same scoring as product_recommendation.ipynb, without materialising the
+# retailer x product cross join. Everything the notebook derives per row is a
+# function of (City, Channel, Product) except Recent_Purchase_Count, which is
+# non-zero for only a sliver of pairs. So rules and the classifier are scored
+# once per (City, Channel, Product) combo, the sparse recent purchases are
+# patched on top, and top-N is picked per block of retailers.
+RECENT_DAYS = 90
+MAX_TOP_N = 10
+# Retailers with no recent purchases are treated as if they bought this many SKUs
+FALLBACK_SKUS = 5
+TOP_N_FACTOR = 1.2
+ML_WEIGHT = 0.5
+# Retailers scored per block; peak memory is a few float64 arrays of CHUNK_RETAILERS x n_products
+CHUNK_RETAILERS = 2000
+INSERT_BATCH = 50000
+
+RECENT, CITY, CHANNEL = "Recent_Purchase_Count", "City_Purchase_Count", "Channel_Purchase_Count"
+
+# Each rule adds `score` where `column <op> threshold`; "median" thresholds are
+# taken over the full cross join, as in the notebook.
+RULES: List[Dict[str, Any]] = [
+    {"column": RECENT, "op": ">", "threshold": "median", "score": 3},
+    {"column": CITY, "op": ">", "threshold": "median", "score": 2},
+    {"column": CHANNEL, "op": ">", "threshold": "median", "score": 1},
+]
+
+RULE_OPS: Dict[str, Callable[[np.ndarray, float], np.ndarray]] = {
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+    "==": np.equal,
+}
+
+CLASSIFIER_PARAMS: Dict[str, Any] = {"n_estimators": 100, "random_state": 42, "n_jobs": -1}
+
+RECS_TABLE = "product_recommendations_ml"
+STAGING_TABLE = f"{RECS_TABLE}_new"
+RECS_SCHEMA = """
+    CREATE TABLE {table} (
+        Retailer_ID TEXT,
+        Product_ID TEXT,
+        Final_Score REAL,
+        Recommendation_Timestamp TEXT
+    )
+"""
+# Same name as migration 1, so `--reapply` sees it as already there
+RECS_INDEX = f"CREATE INDEX IF NOT EXISTS idx_recs_retailer_score ON {RECS_TABLE} (Retailer_ID, Final_Score)"
+
+
+@dataclass
+class FeatureSet:
+    """Sparse/compact form of the notebook's cross join features."""
+    retailer_ids: np.ndarray
+    product_ids: np.ndarray
+    # Per retailer: index into `combo_city` / `combo_channel`
+    retailer_combo: np.ndarray
+    combo_city: np.ndarray
+    combo_channel: np.ndarray
+    cities: np.ndarray
+    channels: np.ndarray
+    # (n_cities | n_channels, n_products) purchase counts over all sales
+    city_counts: np.ndarray
+    channel_counts: np.ndarray
+    # Non-zero recent (retailer, product) counts, sorted by retailer
+    recent_retailer: np.ndarray
+    recent_product: np.ndarray
+    recent_count: np.ndarray
+    top_n: np.ndarray
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return len(self.retailer_ids), len(self.product_ids)
+
+
+@dataclass
+class ScoredCombos:
+    """Final score of every (combo, product) pair with no recent purchases, plus what it took to get there."""
+    base_score: np.ndarray
+    ml_score: np.ndarray
+    # RULES with thresholds resolved: (column, op, threshold, score)
+    rules: List[Tuple[str, str, float, float]]
+    rule_max: float
+    classifier: Any
+
+
+# ---------- Load ----------
+def load_inputs(db_path: str = DB_PATH) -> Dict[str, Any]:
+    """
+    Sales, retailers and products as of now, plus `sales_rowid`: the last
+    sales row read. Orders landing while the pipeline runs come after it and
+    are replayed at the swap (utils.online_recommendations.replay_sales_since).
+    """
+    with closing(sqlite3.connect(db_path)) as conn:
+        sales_rowid = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM sales").fetchone()[0]
+        return {
+            "sales": pd.read_sql_query(
+                "SELECT Invoice_ID, Retailer_ID, Product_ID, Date FROM sales WHERE rowid <= ?", conn,
+                params=(sales_rowid,),
+            ),
+            "sales_rowid": sales_rowid,
+            # Table order, as the notebook's SELECT * reads it; ties in Final_Score keep it
+            "retailers": pd.read_sql_query("SELECT Retailer_ID, City, Channel FROM retailers ORDER BY rowid", conn),
+            "products": pd.read_sql_query("SELECT Product_ID FROM products ORDER BY rowid", conn),
+        }
+
+
+# ---------- Features ----------
+def build_features(
+    sales: pd.DataFrame,
+    retailers: pd.DataFrame,
+    products: pd.DataFrame,
+    as_of: Optional[datetime] = None,
+) -> FeatureSet:
+    """
+    Purchase counts per (retailer, product), (city, product) and (channel, product).
+
+    City/channel popularity counts every sale; recent counts only those on or
+    after `as_of - RECENT_DAYS`. Sales for retailers or products missing from
+    their tables are ignored, like the notebook's left merges do.
+    """
+    as_of = as_of or datetime.today()
+    retailer_ids = retailers["Retailer_ID"].to_numpy()
+    product_ids = products["Product_ID"].to_numpy()
+    n_products = len(product_ids)
+
+    # LabelEncoder order (sorted classes), so encodings match the notebook
+    city_codes = pd.Categorical(retailers["City"], categories=np.unique(retailers["City"])).codes
+    channel_codes = pd.Categorical(retailers["Channel"], categories=np.unique(retailers["Channel"])).codes
+    cities, channels = np.unique(retailers["City"]), np.unique(retailers["Channel"])
+
+    combo_key = city_codes.astype(np.int64) * len(channels) + channel_codes
+    combo_keys, retailer_combo = np.unique(combo_key, return_inverse=True)
+
+    r = pd.Categorical(sales["Retailer_ID"], categories=retailer_ids).codes.astype(np.int64)
+    p = pd.Categorical(sales["Product_ID"], categories=product_ids).codes.astype(np.int64)
+    known = (r >= 0) & (p >= 0)
+    recent_mask = known & (pd.to_datetime(sales["Date"]) >= as_of - timedelta(days=RECENT_DAYS)).to_numpy()
+    r_all, p_all = r[known], p[known]
+
+    def popularity(codes: np.ndarray, n_groups: int) -> np.ndarray:
+        flat = codes[r_all].astype(np.int64) * n_products + p_all
+        return np.bincount(flat, minlength=n_groups * n_products).reshape(n_groups, n_products).astype(np.int32)
+
+    pairs, counts = np.unique(r[recent_mask] * n_products + p[recent_mask], return_counts=True)
+    recent_retailer = (pairs // n_products).astype(np.int32)
+
+    top_n = top_n_size(np.bincount(recent_retailer, minlength=len(retailer_ids)), n_products)
+
+    return FeatureSet(
+        retailer_ids=retailer_ids,
+        product_ids=product_ids,
+        retailer_combo=retailer_combo.astype(np.int32),
+        combo_city=(combo_keys // len(channels)).astype(np.int32),
+        combo_channel=(combo_keys % len(channels)).astype(np.int32),
+        cities=cities,
+        channels=channels,
+        city_counts=popularity(city_codes, len(cities)),
+        channel_counts=popularity(channel_codes, len(channels)),
+        recent_retailer=recent_retailer,
+        recent_product=(pairs % n_products).astype(np.int32),
+        recent_count=counts.astype(np.int32),
+        top_n=top_n,
+    )
+
+
+def top_n_size(unique_skus: np.ndarray, n_products: int) -> np.ndarray:
+    """How many products to recommend, from the SKUs each retailer bought recently."""
+    skus = np.where(unique_skus > 0, unique_skus, FALLBACK_SKUS)
+    # np.round rounds half to even, like the notebook's round()
+    return np.minimum(np.round(skus * TOP_N_FACTOR), min(MAX_TOP_N, n_products)).astype(np.int32)
+
+
+def ml_features(city: np.ndarray, channel: np.ndarray, city_count: np.ndarray, channel_count: np.ndarray) -> np.ndarray:
+    """Classifier input, in the notebook's column order: City_Enc, Channel_Enc, City/Channel_Purchase_Count."""
+    return np.column_stack([city, channel, city_count, channel_count]).astype(np.float32)
+
+
+def recent_purchase_days(sales: pd.DataFrame, as_of: Optional[datetime] = None) -> pd.DataFrame:
+    """Sales rows per (retailer, product, day) inside the recent window, for the online counters."""
+    as_of = as_of or datetime.today()
+    dates = pd.to_datetime(sales["Date"])
+    recent = sales[dates >= as_of - timedelta(days=RECENT_DAYS)]
+    days = recent["Date"].str.slice(0, 10)
+    return recent.groupby([recent["Retailer_ID"], recent["Product_ID"], days]).size().reset_index(name="Purchases")
+
+
+def _weighted_median(values: np.ndarray, weights: np.ndarray) -> float:
+    """Median of `values` repeated `weights` times (averaging the middle pair, like pandas)."""
+    order = np.argsort(values, kind="stable")
+    values, cumulative = values[order], np.cumsum(weights[order])
+    total = int(cumulative[-1])
+    lower = values[np.searchsorted(cumulative, (total - 1) // 2, side="right")]
+    upper = values[np.searchsorted(cumulative, total // 2, side="right")]
+    return float((lower + upper) / 2)
+
+
+def cross_join_medians(fs: FeatureSet) -> Dict[str, float]:
+    """Medians of the three counts over every (retailer, product) pair."""
+    n_retailers, n_products = fs.shape
+    retailer_city = fs.combo_city[fs.retailer_combo]
+    retailer_channel = fs.combo_channel[fs.retailer_combo]
+    zeros = n_retailers * n_products - len(fs.recent_count)
+    return {
+        RECENT: _weighted_median(
+            np.append(fs.recent_count, 0), np.append(np.ones(len(fs.recent_count), dtype=np.int64), zeros)
+        ),
+        CITY: _weighted_median(
+            fs.city_counts.ravel(), np.repeat(np.bincount(retailer_city, minlength=len(fs.cities)), n_products)
+        ),
+        CHANNEL: _weighted_median(
+            fs.channel_counts.ravel(), np.repeat(np.bincount(retailer_channel, minlength=len(fs.channels)), n_products)
+        ),
+    }
+
+
+# ---------- Scoring ----------
+def resolve_rules(rules: List[Dict[str, Any]], medians: Dict[str, float]) -> List[Tuple[str, str, float, float]]:
+    resolved = []
+    for rule in rules:
+        threshold = rule.get("threshold", "median")
+        if threshold == "median":
+            threshold = medians[rule["column"]]
+        resolved.append((rule["column"], rule.get("op", ">"), float(threshold), float(rule["score"])))
+    return resolved
+
+
+def rule_score(columns: Dict[str, np.ndarray], rules: List[Tuple[str, str, float, float]]) -> np.ndarray:
+    """Vectorised `dynamic_rule_score`: sums each rule's score where its condition holds."""
+    score = np.zeros(np.shape(next(iter(columns.values()))), dtype=np.float64)
+    for column, op, threshold, points in rules:
+        score += np.where(RULE_OPS[op](columns[column], threshold), points, 0.0)
+    return score
+
+
+def buyers_per_combo(fs: FeatureSet) -> np.ndarray:
+    """Retailers in each combo with a recent purchase of each product, flattened (combo, product)."""
+    n_combos, n_products = len(fs.combo_city), fs.shape[1]
+    return np.bincount(
+        fs.retailer_combo[fs.recent_retailer].astype(np.int64) * n_products + fs.recent_product,
+        minlength=n_combos * n_products,
+    )
+
+
+def combo_features(fs: FeatureSet) -> np.ndarray:
+    """Classifier input for every (combo, product) pair, combo-major."""
+    n_products = fs.shape[1]
+    return ml_features(
+        np.repeat(fs.combo_city, n_products),
+        np.repeat(fs.combo_channel, n_products),
+        fs.city_counts[fs.combo_city].ravel(),
+        fs.channel_counts[fs.combo_channel].ravel(),
+    )
+
+
+def train_classifier(fs: FeatureSet, classifier_params: Optional[Dict[str, Any]] = None):
+    """
+    Fits the purchase classifier on one weighted row per (combo, product, label).
+
+    The notebook's features (city, channel and their popularity counts) are the
+    same for every retailer in a combo, so each combo contributes a positive
+    row weighted by its retailers with a recent purchase of the product and a
+    negative row weighted by the rest. This is the cross join with duplicate
+    rows collapsed.
+
+    Returns:
+        The fitted classifier.
+    """
+    from sklearn.ensemble import RandomForestClassifier
+
+    n_combos, n_products = len(fs.combo_city), fs.shape[1]
+    features = combo_features(fs)
+
+    retailers_per_combo = np.bincount(fs.retailer_combo, minlength=n_combos)
+    positives = buyers_per_combo(fs)
+    negatives = np.repeat(retailers_per_combo, n_products) - positives
+
+    X = np.concatenate([features[positives > 0], features[negatives > 0]])
+    y = np.concatenate([np.ones((positives > 0).sum()), np.zeros((negatives > 0).sum())])
+    weights = np.concatenate([positives[positives > 0], negatives[negatives > 0]])
+
+    clf = RandomForestClassifier(**{**CLASSIFIER_PARAMS, **(classifier_params or {})})
+    clf.fit(X, y, sample_weight=weights)
+    return clf
+
+
+def positive_proba(clf, X: np.ndarray) -> np.ndarray:
+    proba = clf.predict_proba(X)
+    classes = list(clf.classes_)
+    return proba[:, classes.index(1.0)] if 1.0 in classes else np.zeros(len(X))
+
+
+def score_combos(
+    fs: FeatureSet,
+    rules: List[Dict[str, Any]] = RULES,
+    classifier_params: Optional[Dict[str, Any]] = None,
+    needed: Optional[np.ndarray] = None,
+    classifier: Any = None,
+) -> ScoredCombos:
+    """
+    Scores every (combo, product) pair as if the retailer had no recent purchase of it.
+
+    With a boolean (n_combos, n_products) `needed` mask, only those pairs go
+    through the classifier; the others score nan. A fitted `classifier` skips
+    training.
+    """
+    n_combos, n_products = len(fs.combo_city), fs.shape[1]
+    medians = cross_join_medians(fs)
+    resolved = resolve_rules(rules, medians)
+
+    clf = classifier if classifier is not None else train_classifier(fs, classifier_params)
+    features = combo_features(fs)
+    if needed is None:
+        ml_score = positive_proba(clf, features).reshape(n_combos, n_products)
+    else:
+        ml_score = np.full(n_combos * n_products, np.nan)
+        ml_score[needed.ravel()] = positive_proba(clf, features[needed.ravel()])
+        ml_score = ml_score.reshape(n_combos, n_products)
+
+    city = fs.city_counts[fs.combo_city]
+    channel = fs.channel_counts[fs.combo_channel]
+    base_rule = rule_score({RECENT: np.zeros_like(city), CITY: city, CHANNEL: channel}, resolved)
+
+    # Rule_Score.max() over the cross join: pairs with a recent purchase, plus
+    # the no-purchase score of every combo that has a retailer without one
+    patched = _recent_rule_score(fs, resolved)
+    retailers_per_combo = np.bincount(fs.retailer_combo, minlength=n_combos)
+    buyers = buyers_per_combo(fs).reshape(n_combos, n_products)
+    has_zero = buyers < retailers_per_combo[:, None]
+    rule_max = max(base_rule[has_zero].max(initial=0.0), patched.max(initial=0.0))
+    # The notebook divides by zero here; no rule firing anywhere means no rule signal
+    rule_max = rule_max or 1.0
+
+    return ScoredCombos(
+        base_score=ML_WEIGHT * ml_score + (1 - ML_WEIGHT) * base_rule / rule_max,
+        ml_score=ml_score,
+        rules=resolved,
+        rule_max=rule_max,
+        classifier=clf,
+    )
+
+
+def _recent_rule_score(fs: FeatureSet, resolved, rows: slice = slice(None)) -> np.ndarray:
+    retailers, products = fs.recent_retailer[rows], fs.recent_product[rows]
+    combos = fs.retailer_combo[retailers]
+    return rule_score({
+        RECENT: fs.recent_count[rows],
+        CITY: fs.city_counts[fs.combo_city[combos], products],
+        CHANNEL: fs.channel_counts[fs.combo_channel[combos], products],
+    }, resolved)
+
+
+# ---------- Top-N ----------
+def top_n_blocks(
+    fs: FeatureSet,
+    scored: ScoredCombos,
+    chunk_retailers: int = CHUNK_RETAILERS,
+) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Yields (retailer index, product index, Final_Score) for each block of retailers.
+
+    Within a retailer, products are ranked by Final_Score, ties broken by
+    product order (the notebook's stable sort).
+    """
+    n_retailers, n_products = fs.shape
+    k = int(min(MAX_TOP_N, n_products))
+    if k == 0:
+        return
+    ranks = np.arange(k)
+    bounds = np.searchsorted(fs.recent_retailer, np.arange(0, n_retailers + chunk_retailers, chunk_retailers))
+
+    for block, start in enumerate(range(0, n_retailers, chunk_retailers)):
+        stop = min(start + chunk_retailers, n_retailers)
+        final = scored.base_score[fs.retailer_combo[start:stop]]
+
+        rows = slice(bounds[block], bounds[block + 1])
+        retailers, products = fs.recent_retailer[rows], fs.recent_product[rows]
+        combos = fs.retailer_combo[retailers]
+        final[retailers - start, products] = (
+            ML_WEIGHT * scored.ml_score[combos, products]
+            + (1 - ML_WEIGHT) * _recent_rule_score(fs, scored.rules, rows) / scored.rule_max
+        )
+
+        # The k best per row: everything above the kth-largest score, then ties
+        # at that score in product order (argpartition alone breaks ties arbitrarily)
+        kth = np.partition(final, n_products - k, axis=1)[:, n_products - k, None]
+        above = final > kth
+        at_kth = final == kth
+        take = above | (at_kth & (np.cumsum(at_kth, axis=1) <= k - above.sum(axis=1, keepdims=True)))
+        candidates = np.nonzero(take)[1].reshape(-1, k)
+        values = np.take_along_axis(final, candidates, axis=1)
+        order = np.lexsort((candidates, -values), axis=1)
+        candidates = np.take_along_axis(candidates, order, axis=1)
+        values = np.take_along_axis(values, order, axis=1)
+
+        keep = ranks < fs.top_n[start:stop, None]
+        retailer_idx = np.broadcast_to(np.arange(start, stop)[:, None], keep.shape)
+        yield retailer_idx[keep], candidates[keep], values[keep]
+
+
+def top_n_candidates(
+    fs: FeatureSet, scored: ScoredCombos, retailers: np.ndarray, products: np.ndarray
+) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Like top_n_blocks, but ranks only the given (retailer, product) candidates.
+
+    Candidates must be sorted by retailer then product and include every
+    recent purchase (pipelines.candidates.generate_candidates does both).
+    """
+    n_products = fs.shape[1]
+    combos = fs.retailer_combo[retailers]
+    final = scored.base_score[combos, products]
+
+    keys = retailers.astype(np.int64) * n_products + products
+    at = np.searchsorted(keys, fs.recent_retailer.astype(np.int64) * n_products + fs.recent_product)
+    final[at] = (
+        ML_WEIGHT * scored.ml_score[combos[at], products[at]]
+        + (1 - ML_WEIGHT) * _recent_rule_score(fs, scored.rules) / scored.rule_max
+    )
+
+    # Same ranking as the full pass: score, then product order, within each retailer
+    order = np.lexsort((products, -final, retailers))
+    retailers, products, final = retailers[order], products[order], final[order]
+    keep = np.arange(len(order)) - np.searchsorted(retailers, retailers) < fs.top_n[retailers]
+    yield retailers[keep], products[keep], final[keep]
+
+
+# ---------- Write ----------
+def swap_in_recommendations(
+    db_path: str,
+    blocks: Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]],
+    fs: FeatureSet,
+    timestamp: Optional[str] = None,
+    on_swap: Optional[Callable[[sqlite3.Connection], None]] = None,
+) -> int:
+    """
+    Loads the recommendations into a staging table, then replaces the live one.
+
+    The staging table is filled in batches, each its own short transaction, so
+    order writes can interleave. The swap (drop, rename, re-index, plus
+    `on_swap`) is one transaction: readers see either the old table or the
+    new one, never an empty or half-written one.
+
+    Returns:
+        The number of recommendations written.
+    """
+    timestamp = timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    pool = get_pool(db_path)
+    insert = f"INSERT INTO {STAGING_TABLE} (Retailer_ID, Product_ID, Final_Score, Recommendation_Timestamp) VALUES (?, ?, ?, ?)"
+
+    with pool.transaction() as conn:
+        conn.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+        conn.execute(RECS_SCHEMA.format(table=STAGING_TABLE))
+
+    written, batch = 0, []
+    for retailers, products, scores in blocks:
+        batch.extend(zip(
+            fs.retailer_ids[retailers].tolist(), fs.product_ids[products].tolist(),
+            scores.tolist(), [timestamp] * len(scores),
+        ))
+        if len(batch) >= INSERT_BATCH:
+            with pool.transaction() as conn:
+                conn.executemany(insert, batch)
+            written, batch = written + len(batch), []
+    with pool.transaction() as conn:
+        conn.executemany(insert, batch)
+        written += len(batch)
+
+        if on_swap is not None:
+            on_swap(conn)
+        conn.execute(f"DROP TABLE IF EXISTS {RECS_TABLE}")
+        conn.execute(f"ALTER TABLE {STAGING_TABLE} RENAME TO {RECS_TABLE}")
+        conn.execute(RECS_INDEX)
+    return written
+
+
+def write_feature_aggregates(
+    conn: sqlite3.Connection, fs: FeatureSet, scored: ScoredCombos, recent_days: pd.DataFrame
+) -> None:
+    """Replaces the aggregates that utils.online_recommendations keeps current between runs."""
+    for statement in FEATURE_TABLES:
+        conn.execute(statement)
+    for table in ("rec_city_popularity", "rec_channel_popularity", "rec_recent_purchases", "rec_combo_scores"):
+        conn.execute(f"DELETE FROM {table}")
+
+    city, product = np.nonzero(fs.city_counts)
+    conn.executemany("INSERT INTO rec_city_popularity VALUES (?, ?, ?)", zip(
+        fs.cities[city].tolist(), fs.product_ids[product].tolist(), fs.city_counts[city, product].tolist(),
+    ))
+    channel, product = np.nonzero(fs.channel_counts)
+    conn.executemany("INSERT INTO rec_channel_popularity VALUES (?, ?, ?)", zip(
+        fs.channels[channel].tolist(), fs.product_ids[product].tolist(), fs.channel_counts[channel, product].tolist(),
+    ))
+    conn.executemany(
+        "INSERT INTO rec_recent_purchases VALUES (?, ?, ?, ?)", recent_days.itertuples(index=False, name=None)
+    )
+    # Pairs never scored in candidate mode are left out; the online rescore fills them on demand
+    combo, product = np.nonzero(~np.isnan(scored.ml_score))
+    conn.executemany("INSERT INTO rec_combo_scores VALUES (?, ?, ?, ?)", zip(
+        fs.cities[fs.combo_city[combo]].tolist(), fs.channels[fs.combo_channel[combo]].tolist(),
+        fs.product_ids[product].tolist(), scored.ml_score[combo, product].tolist(),
+    ))
+
+
+# ---------- Pipeline ----------
+def run_pipeline(
+    db_path: str = DB_PATH,
+    as_of: Optional[datetime] = None,
+    rules: List[Dict[str, Any]] = RULES,
+    classifier_params: Optional[Dict[str, Any]] = None,
+    chunk_retailers: int = CHUNK_RETAILERS,
+    candidates: bool = False,
+) -> Dict[str, Any]:
+    """
+    Rebuilds product_recommendations_ml from sales, retailers and products.
+
+    With `candidates`, each retailer only ranks the bounded candidate set from
+    pipelines.candidates instead of every product. Orders that land while it
+    runs are folded into the new feature aggregates at the swap and their
+    retailers rescored, so no per-order update is lost.
+
+    Returns:
+        Row counts, the resolved rule thresholds and seconds spent per stage.
+    """
+    timings, start = {}, time.perf_counter()
+
+    def lap(stage: str) -> None:
+        nonlocal start
+        now = time.perf_counter()
+        timings[stage] = now - start
+        start = now
+
+    inputs = load_inputs(db_path)
+    sales_rowid = inputs["sales_rowid"]
+    lap("load")
+    fs = build_features(inputs["sales"], inputs["retailers"], inputs["products"], as_of)
+    recent_days = recent_purchase_days(inputs["sales"], as_of)
+    pairs = needed = None
+    if candidates:
+        from pipelines.candidates import co_purchase_neighbours, generate_candidates
+
+        product_codes = pd.Categorical(inputs["sales"]["Product_ID"], categories=fs.product_ids).codes
+        edges = co_purchase_neighbours(inputs["sales"]["Invoice_ID"], product_codes, fs.shape[1])
+        pairs = generate_candidates(fs, edges)
+        needed = np.zeros((len(fs.combo_city), fs.shape[1]), dtype=bool)
+        needed[fs.retailer_combo[pairs[0]], pairs[1]] = True
+    del inputs
+    lap("features")
+    scored = score_combos(fs, rules, classifier_params, needed)
+    lap("score")
+    ranked = top_n_candidates(fs, scored, *pairs) if candidates else top_n_blocks(fs, scored, chunk_retailers)
+    late_orders: Dict[str, List[str]] = {}
+
+    def on_swap(conn: sqlite3.Connection) -> None:
+        write_feature_aggregates(conn, fs, scored, recent_days)
+        # Orders that landed since the load already bumped the old aggregates; count them again.
+        # The swap holds the write lock, so none can slip in between.
+        late_orders.update(replay_sales_since(conn, sales_rowid))
+
+    written = swap_in_recommendations(db_path, ranked, fs, on_swap=on_swap)
+    lap("top_n_and_write")
+    # For rescoring single retailers as their orders come in (utils.online_recommendations)
+    save_model(db_path, {
+        "classifier": scored.classifier,
+        "rules": scored.rules,
+        "rule_max": scored.rule_max,
+        "cities": fs.cities.tolist(),
+        "channels": fs.channels.tolist(),
+        "trained_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    })
+    lap("save_model")
+    # Their rescored rows went with the old table; rank them again from the replayed counters
+    for retailer_id, product_ids in late_orders.items():
+        rescore_retailer(db_path, retailer_id, product_ids)
+    lap("rescore_late_orders")
+
+    return {
+        "retailers": fs.shape[0],
+        "products": fs.shape[1],
+        "recommendations": written,
+        "late_order_retailers": len(late_orders),
+        "scored_pairs": len(pairs[0]) if candidates else fs.shape[0] * fs.shape[1],
+        "thresholds": {column: threshold for column, _, threshold, _ in scored.rules},
+        "timings": timings,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild product_recommendations_ml (hybrid rule + ML scores).")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--as-of", help="YYYY-MM-DD reference date for recent purchases (default: now)")
+    parser.add_argument("--chunk", type=int, default=CHUNK_RETAILERS, help="retailers scored per block")
+    parser.add_argument("--trees", type=int, default=CLASSIFIER_PARAMS["n_estimators"])
+    parser.add_argument("--candidates", action="store_true", help="rank a bounded candidate set per retailer")
+    args = parser.parse_args()
+
+    as_of = datetime.strptime(args.as_of, "%Y-%m-%d") if args.as_of else None
+    result = run_pipeline(
+        args.db, as_of, classifier_params={"n_estimators": args.trees}, chunk_retailers=args.chunk,
+        candidates=args.candidates,
+    )
+    print(
+        f"{args.db}: {result['recommendations']} recommendations for "
+        f"{result['retailers']} retailers x {result['products']} products "
+        f"({result['scored_pairs']} pairs ranked)"
+    )
+    print("thresholds: " + ", ".join(f"{k}={v:g}" for k, v in result["thresholds"].items()))
+    print("timings: " + ", ".join(f"{k} {v:.2f}s" for k, v in result["timings"].items()))
+
+
+if __name__ == "__main__":
+    main()
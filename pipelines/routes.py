@@ -0,0 +1,322 @@
+import argparse
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from functools import partial
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from pipelines.beats import BEAT_MAP_TABLE, haversine_km
+from pipelines.distances import DISTANCE_DIR, NEIGHBOUR_BEATS, DistanceStore, in_key_order
+from utils.db import DB_PATH, get_pool
+
+
+# Visit order per beat, replacing compute_tsp_route in beat_optimization.ipynb
+# (geodesic distances in Python loops + networkx greedy_tsp). Tours are closed
+# loops as before - the last Visit_Sequence returns to the first stop, which
+# the route-plan query leaves out - but start at a chosen retailer (by default
+# the one farthest from the beat centre, as the notebook meant to), begin
+# with a nearest-neighbour tour and are then improved with 2-opt and Or-opt
+# moves until neither shortens them. With a distance_dir, distances come from
+# the memory-mapped per-beat matrices of pipelines.distances instead.
+ROUTE_TABLE = "beat_route_plan"
+ROUTE_SCHEMA = f"CREATE TABLE IF NOT EXISTS {ROUTE_TABLE} (Beat_ID TEXT, Retailer_ID TEXT, Visit_Sequence INTEGER)"
+# Longest run of consecutive stops an Or-opt move relocates
+OR_OPT_SEGMENT = 3
+# Beats handed to a worker process at a time
+BEATS_PER_TASK = 16
+# Improvements smaller than this (km, i.e. 10 cm) are treated as ties, so search
+# always terminates - also on float32 stored matrices, whose rounding is far smaller
+EPSILON_KM = 1e-4
+
+
+# ---------- Tours ----------
+def distance_matrix(coords: np.ndarray) -> np.ndarray:
+    """(n, n) haversine km between (lat, lon) rows."""
+    return haversine_km(coords[:, None, 0], coords[:, None, 1], coords[None, :, 0], coords[None, :, 1])
+
+
+def tour_length(dist: np.ndarray, tour: np.ndarray) -> float:
+    """Length of the closed loop visiting `tour` in order and returning to its first stop."""
+    return float(dist[tour, np.roll(tour, -1)].sum(dtype=np.float64))
+
+
+def outermost(coords: np.ndarray) -> int:
+    """Index of the retailer farthest from the beat's centre."""
+    centre = coords.mean(axis=0)
+    return int(haversine_km(coords[:, 0], coords[:, 1], centre[0], centre[1]).argmax())
+
+
+def nearest_neighbour_tour(dist: np.ndarray, start: int = 0) -> np.ndarray:
+    """Greedy tour: from `start`, always on to the closest unvisited stop."""
+    n = len(dist)
+    tour = np.empty(n, dtype=np.int64)
+    tour[0] = start
+    visited = np.zeros(n, dtype=bool)
+    visited[start] = True
+    for step in range(1, n):
+        tour[step] = np.where(visited, np.inf, dist[tour[step - 1]]).argmin()
+        visited[tour[step]] = True
+    return tour
+
+
+def two_opt(dist: np.ndarray, tour: np.ndarray, fixed_end: bool = False) -> bool:
+    """
+    Applies the best segment reversal, in place; tour[0] (and with
+    `fixed_end`, tour[-1]) stays put.
+
+    Returns:
+        Whether the tour got shorter.
+    """
+    n = len(tour)
+    if n < 4:
+        return False
+    prev, nxt = np.roll(tour, 1), np.roll(tour, -1)
+    # Reversing tour[i..j] swaps edges (prev[i], tour[i]) + (tour[j], nxt[j])
+    # for (prev[i], tour[j]) + (tour[i], nxt[j])
+    gain = (
+        dist[prev[:, None], tour[None, :]] + dist[tour[:, None], nxt[None, :]]
+        - dist[prev, tour][:, None] - dist[tour, nxt][None, :]
+    )
+    gain[np.tril_indices(n)] = np.inf
+    gain[0] = np.inf
+    if fixed_end:
+        gain[:, -1] = np.inf
+    i, j = np.unravel_index(gain.argmin(), gain.shape)
+    if gain[i, j] >= -EPSILON_KM:
+        return False
+    tour[i:j + 1] = tour[i:j + 1][::-1]
+    return True
+
+
+def or_opt(dist: np.ndarray, tour: np.ndarray, max_segment: int = OR_OPT_SEGMENT, fixed_end: bool = False) -> bool:
+    """
+    Moves the first run of up to max_segment stops found whose relocation
+    (either way round) shortens the tour, in place; tour[0] (and with
+    `fixed_end`, tour[-1]) stays put.
+
+    Returns:
+        Whether the tour got shorter.
+    """
+    n = len(tour)
+    movable = n - 1 if fixed_end else n
+    for length in range(1, min(max_segment, n - 2) + 1):
+        for i in range(1, movable - length + 1):
+            first, last = tour[i], tour[i + length - 1]
+            before, after = tour[i - 1], tour[(i + length) % n]
+            removed = dist[before, first] + dist[last, after] - dist[before, after]
+
+            rest = np.concatenate([tour[:i], tour[i + length:]])
+            left, right = rest, np.roll(rest, -1)
+            forward = dist[left, first] + dist[last, right] - dist[left, right]
+            backward = dist[left, last] + dist[first, right] - dist[left, right]
+            # Putting it back where it came from is no move
+            forward[i - 1] = backward[i - 1] = np.inf
+            if fixed_end:
+                # Between the last stop and the first would make it not last
+                forward[-1] = backward[-1] = np.inf
+
+            p = int(np.minimum(forward, backward).argmin())
+            if min(forward[p], backward[p]) - removed >= -EPSILON_KM:
+                continue
+            segment = tour[i:i + length] if forward[p] <= backward[p] else tour[i:i + length][::-1]
+            tour[:] = np.concatenate([rest[:p + 1], segment, rest[p + 1:]])
+            return True
+    return False
+
+
+def plan_route(
+    coords: np.ndarray, start: Optional[int] = None, dist: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, float, float]:
+    """
+    Visit order for one beat.
+
+    Args:
+        coords (np.ndarray): (n, 2) latitude/longitude per retailer.
+        start (int): Index of the first stop; defaults to the outermost retailer.
+        dist (np.ndarray): (n, n) km between the retailers, e.g. a stored matrix;
+            computed from coords when not given.
+
+    Returns:
+        The tour (indices into coords, starting with `start`), its length in km
+        and the length of the greedy tour it was improved from.
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    if len(coords) == 0:
+        return np.zeros(0, dtype=np.int64), 0.0, 0.0
+    dist = distance_matrix(coords) if dist is None else dist
+    tour = nearest_neighbour_tour(dist, outermost(coords) if start is None else start)
+    greedy = tour_length(dist, tour)
+    while two_opt(dist, tour) or or_opt(dist, tour):
+        pass
+    return tour, tour_length(dist, tour), greedy
+
+
+def plan_path(
+    start: Tuple[float, float], coords: np.ndarray, dist: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, float]:
+    """
+    Shortest-found open path from the point `start` through every stop (it
+    ends wherever is best), e.g. the rest of a route from the rep's position.
+
+    Args:
+        dist (np.ndarray): (n + 1, n + 1) km between `start` (first) and the
+            stops, e.g. sliced from a stored matrix; computed when not given.
+
+    Returns:
+        The visit order (indices into coords) and its length in km, from `start`.
+    """
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    n = len(coords)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64), 0.0
+    # Node 0 is the start, nodes 1..n the stops, node n + 1 a free end zero km
+    # from everything: a closed tour that keeps it last is an open path
+    known = distance_matrix(np.vstack([start, coords])) if dist is None else dist
+    dist = np.zeros((n + 2, n + 2), dtype=known.dtype)
+    dist[:n + 1, :n + 1] = known
+    tour = np.append(nearest_neighbour_tour(dist[:n + 1, :n + 1], 0), n + 1)
+    while two_opt(dist, tour, fixed_end=True) or or_opt(dist, tour, fixed_end=True):
+        pass
+    return tour[1:-1] - 1, tour_length(dist, tour)
+
+
+# ---------- Beats ----------
+BeatInput = Tuple[str, List[str], np.ndarray, Optional[int]]
+
+
+def _plan_beat(beat: BeatInput, distance_dir: Optional[str] = None) -> Tuple[List[Tuple[str, str, int]], float, float]:
+    beat_id, retailer_ids, coords, start = beat
+    stored = DistanceStore(distance_dir).load(beat_id, retailer_ids, coords) if distance_dir else None
+    dist = None
+    if stored is not None:
+        # Stored matrices are in Retailer_ID order
+        start_id = retailer_ids[start] if start is not None else None
+        retailer_ids, coords = in_key_order(retailer_ids, coords)
+        start = retailer_ids.index(start_id) if start_id is not None else None
+        dist = stored[1]
+    tour, length, greedy = plan_route(coords, start, dist)
+    stops = [retailer_ids[i] for i in tour]
+    # Same rows as the notebook: back to the first stop at the end
+    rows = [(beat_id, retailer_id, seq) for seq, retailer_id in enumerate(stops + stops[:1], start=1)]
+    return rows, length, greedy
+
+
+def plan_beats(
+    beats: Iterable[BeatInput], workers: Optional[int] = None, distance_dir: Optional[str] = None,
+) -> Iterable[Tuple[List[Tuple[str, str, int]], float, float]]:
+    """
+    Plans every beat, across `workers` processes (default: one per CPU).
+
+    Beats are independent and each takes milliseconds, so they are sent to
+    the pool in batches of BEATS_PER_TASK; with one worker they run inline.
+    With `distance_dir`, each beat maps its stored matrix when it is current
+    (only the directory crosses the process boundary, not the matrices).
+    """
+    workers = workers or os.cpu_count() or 1
+    plan = partial(_plan_beat, distance_dir=distance_dir)
+    if workers <= 1:
+        yield from map(plan, beats)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(plan, beats, chunksize=BEATS_PER_TASK)
+
+
+# ---------- Load / write ----------
+def load_beat_retailers(db_path: str = DB_PATH, beat_map: str = BEAT_MAP_TABLE) -> pd.DataFrame:
+    with closing(sqlite3.connect(db_path)) as conn:
+        return pd.read_sql_query(
+            f"""
+            SELECT m.Beat_ID, r.Retailer_ID, r.Latitude, r.Longitude
+            FROM {beat_map} m
+            JOIN retailers r ON r.Retailer_ID = m.Retailer_ID
+            WHERE r.Latitude IS NOT NULL AND r.Longitude IS NOT NULL
+            ORDER BY m.Beat_ID, r.rowid
+            """,
+            conn,
+        )
+
+
+def beat_inputs(retailers: pd.DataFrame, starts: Optional[Dict[str, str]] = None) -> List[BeatInput]:
+    """Per beat (Beat_ID, retailer ids, coordinates, index of the start retailer or None)."""
+    starts = starts or {}
+    beats = []
+    for beat_id, group in retailers.groupby("Beat_ID", sort=True):
+        ids = group["Retailer_ID"].tolist()
+        start = ids.index(starts[beat_id]) if starts.get(beat_id) in ids else None
+        beats.append((beat_id, ids, group[["Latitude", "Longitude"]].to_numpy(), start))
+    return beats
+
+
+def write_route_plan(db_path: str, rows: List[Tuple[str, str, int]]) -> int:
+    """Replaces beat_route_plan in one transaction; its index (migration 1) is kept."""
+    with get_pool(db_path).transaction() as conn:
+        conn.execute(ROUTE_SCHEMA)
+        conn.execute(f"DELETE FROM {ROUTE_TABLE}")
+        conn.executemany(f"INSERT INTO {ROUTE_TABLE} (Beat_ID, Retailer_ID, Visit_Sequence) VALUES (?, ?, ?)", rows)
+    return len(rows)
+
+
+# ---------- Pipeline ----------
+def run_routes(
+    db_path: str = DB_PATH,
+    beat_map: str = BEAT_MAP_TABLE,
+    starts: Optional[Dict[str, str]] = None,
+    workers: Optional[int] = None,
+    distance_dir: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Rebuilds beat_route_plan from `beat_map` and the retailers' coordinates.
+
+    Args:
+        starts (Dict[str, str]): Beat_ID -> Retailer_ID to start that beat at;
+            other beats start at their outermost retailer.
+        distance_dir (str): Distance store to refresh (only changed beats are
+            rebuilt) and plan from. By default distances are computed in
+            memory, which for beats of a few dozen stops is quicker than
+            mapping a file per beat.
+
+    Returns:
+        Beats and stops planned, total tour km against the greedy tours, and seconds taken.
+    """
+    start = time.perf_counter()
+    beats = beat_inputs(load_beat_retailers(db_path, beat_map), starts)
+    if distance_dir:
+        DistanceStore(distance_dir).refresh({b[0]: (b[1], b[2]) for b in beats}, NEIGHBOUR_BEATS)
+    rows, total_km, greedy_km = [], 0.0, 0.0
+    for beat_rows, length, greedy in plan_beats(beats, workers, distance_dir):
+        rows.extend(beat_rows)
+        total_km += length
+        greedy_km += greedy
+    write_route_plan(db_path, rows)
+    return {
+        "beats": len(beats),
+        "stops": sum(len(b[1]) for b in beats),
+        "total_km": total_km,
+        "greedy_km": greedy_km,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=f"Rebuild {ROUTE_TABLE} (per-beat visit order).")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--beat-map", default=BEAT_MAP_TABLE, help="table mapping Retailer_ID to Beat_ID")
+    parser.add_argument("--workers", type=int, help="processes (default: one per CPU)")
+    parser.add_argument("--distance-dir", help=f"refresh and plan from this distance store (e.g. {DISTANCE_DIR})")
+    args = parser.parse_args()
+
+    result = run_routes(args.db, args.beat_map, workers=args.workers, distance_dir=args.distance_dir)
+    print(
+        f"{args.db}: {result['stops']} stops in {result['beats']} beats, "
+        f"{result['total_km']:.1f} km of tours (greedy {result['greedy_km']:.1f} km) "
+        f"in {result['seconds']:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
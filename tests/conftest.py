@@ -0,0 +1,40 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+# Modules import as `utils.db`, `pipelines.recommendations`, ... from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.db import close_all_pools  # noqa: E402
+
+
+# Tables as data_creation.ipynb / product_recommendation.ipynb write them
+SALES_SCHEMA = [
+    "CREATE TABLE retailers (Retailer_ID TEXT PRIMARY KEY, Name TEXT, City TEXT, Channel TEXT, Latitude REAL, Longitude REAL)",
+    "CREATE TABLE products (Product_ID TEXT PRIMARY KEY, Product_Name TEXT, Category TEXT, Price REAL, Pack_Size TEXT)",
+    "CREATE TABLE sales_agents (Agent_ID TEXT PRIMARY KEY, Name TEXT, Mobile TEXT, Email TEXT)",
+    "CREATE TABLE beats (Beat_ID TEXT PRIMARY KEY, Beat_Name TEXT, City TEXT, Assigned_Agent TEXT, Beat_day TEXT)",
+    "CREATE TABLE retailer_beat_map_optimized (Retailer_ID TEXT, Beat_ID TEXT)",
+    "CREATE TABLE visits (Visit_ID TEXT PRIMARY KEY, Retailer_ID TEXT, Date TEXT, Products_Suggested TEXT, "
+    "Feedback TEXT, Order_Placed INTEGER, Agent_ID TEXT)",
+    "CREATE TABLE visit_stock (Visit_ID TEXT, Product_ID TEXT, Retailer_ID TEXT, Available_Stock INTEGER, "
+    "PRIMARY KEY (Visit_ID, Product_ID))",
+    "CREATE TABLE sales (Invoice_ID TEXT, Visit_ID TEXT, Retailer_ID TEXT, Product_ID TEXT, Quantity INTEGER, "
+    "Date TEXT, Total_Amount REAL, PRIMARY KEY (Invoice_ID, Product_ID))",
+    "CREATE TABLE beat_route_plan (Beat_ID TEXT, Retailer_ID TEXT, Visit_Sequence INTEGER)",
+]
+RECS_SCHEMA = ("CREATE TABLE product_recommendations_ml (Retailer_ID TEXT, Product_ID TEXT, Final_Score REAL, "
+               "Recommendation_Timestamp TEXT)")
+
+
+@pytest.fixture
+def sales_db(tmp_path):
+    """Path of an empty co-pilot database with the notebook-created tables (recommendations included)."""
+    path = str(tmp_path / "sales.db")
+    with sqlite3.connect(path) as conn:
+        for statement in SALES_SCHEMA + [RECS_SCHEMA]:
+            conn.execute(statement)
+    yield path
+    close_all_pools()
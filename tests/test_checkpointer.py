@@ -0,0 +1,42 @@
+import operator
+from typing import Annotated, List
+
+from langgraph.graph import END, START, StateGraph
+from typing_extensions import TypedDict
+
+from utils.checkpointer import SQLiteCheckpointSaver, rep_thread_id
+
+
+class State(TypedDict, total=False):
+    count: int
+    log: Annotated[List[str], operator.add]
+    note: str
+
+
+def _step(state: State) -> State:
+    return {"count": state.get("count", 0) + 1, "log": [f"turn {state.get('count', 0) + 1}"]}
+
+
+def _graph(path):
+    builder = StateGraph(State)
+    builder.add_node("step", _step)
+    builder.add_edge(START, "step")
+    builder.add_edge("step", END)
+    return builder.compile(checkpointer=SQLiteCheckpointSaver(path))
+
+
+def test_state_survives_a_new_saver(tmp_path):
+    path = str(tmp_path / "checkpoints.db")
+    config = {"configurable": {"thread_id": rep_thread_id("A001", "2025-01-01")}}
+    graph = _graph(path)
+    graph.invoke({"note": "hello"}, config)
+    graph.invoke({}, config)
+
+    # A restarted process reads every channel back from the file
+    values = _graph(path).get_state(config).values
+    assert values == {"count": 2, "log": ["turn 1", "turn 2"], "note": "hello"}
+
+
+def test_thread_is_per_rep_and_day():
+    assert rep_thread_id("A001", "2025-01-01") != rep_thread_id("A002", "2025-01-01")
+    assert rep_thread_id("A001", "2025-01-01") != rep_thread_id("A001", "2025-01-02")
@@ -0,0 +1,57 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils.llm_clients import LLMClientRegistry
+
+
+class _ChatCompletions(BaseHTTPRequestHandler):
+    """Answers POST /v1/chat/completions like the OpenAI API, over keep-alive connections."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps({
+            "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": "gpt-4o-mini",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "ok"}}],
+            "usage": {"prompt_tokens": 3, "completion_tokens": 1, "total_tokens": 4},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ChatCompletions)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    yield LLMClientRegistry({"pitch": {"model": "gpt-4o-mini", "base_url": base_url, "max_retries": 0}})
+    server.shutdown()
+
+
+def test_async_calls_work_across_event_loops(registry):
+    async def call():
+        return (await registry.get("pitch").ainvoke("hi")).content
+
+    # Each asyncio.run is a new loop; a client pooled on the first one must not leak into the next
+    assert [asyncio.run(call()) for _ in range(3)] == ["ok", "ok", "ok"]
+    assert registry.get("pitch").invoke("hi").content == "ok"
+
+
+def test_models_are_shared_within_a_loop(registry):
+    async def pair():
+        return registry.get("pitch"), registry.get("pitch")
+
+    first, second = asyncio.run(pair())
+    assert first is second
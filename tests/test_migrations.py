@@ -0,0 +1,51 @@
+import sqlite3
+
+import pytest
+
+from utils.db import get_pool
+from utils.migrations import SCHEMA_VERSION, apply_migrations, assert_no_full_scans, table_exists
+
+
+def _indexes(path):
+    with sqlite3.connect(path) as conn:
+        return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+
+def test_request_path_queries_use_indexes(sales_db):
+    assert apply_migrations(sales_db) == SCHEMA_VERSION
+    assert_no_full_scans(sales_db)
+
+
+def test_plan_check_ignores_table_statistics(sales_db):
+    apply_migrations(sales_db)
+    # A small sample: one rep's beats, so ANALYZE rates idx_beats_agent_day as useless
+    with get_pool(sales_db).transaction() as conn:
+        conn.executemany(
+            "INSERT INTO beats VALUES (?, ?, 'City', 'A001', 'Monday')", [(f"B{i:03}", f"Beat {i}") for i in range(12)]
+        )
+        conn.execute("ANALYZE")
+    assert_no_full_scans(sales_db)
+
+
+def test_missing_index_is_reported(sales_db):
+    apply_migrations(sales_db)
+    with get_pool(sales_db).transaction() as conn:
+        conn.execute("DROP INDEX idx_beats_agent_day")
+    with pytest.raises(AssertionError, match="assigned_beats"):
+        assert_no_full_scans(sales_db)
+
+
+def test_recommendations_table_is_left_to_its_owner(sales_db):
+    with get_pool(sales_db).transaction() as conn:
+        conn.execute("DROP TABLE product_recommendations_ml")
+
+    apply_migrations(sales_db)
+    with get_pool(sales_db).connection() as conn:
+        assert not table_exists(conn, "product_recommendations_ml")
+    assert "idx_recs_retailer_score" not in _indexes(sales_db)
+
+    # Once the notebook / pipeline has written it, --reapply indexes it
+    with get_pool(sales_db).transaction() as conn:
+        conn.execute("CREATE TABLE product_recommendations_ml (Retailer_ID TEXT, Product_ID TEXT, Final_Score REAL)")
+    apply_migrations(sales_db, reapply=True)
+    assert "idx_recs_retailer_score" in _indexes(sales_db)
@@ -0,0 +1,65 @@
+import sqlite3
+
+import pytest
+
+import utils.order_outbox as order_outbox
+from utils.migrations import apply_migrations
+from utils.order_outbox import OrderOutbox
+
+
+def _order(visit_id, **extra):
+    return {"visit_id": visit_id, "retailer_id": "R0001", "date": "2025-01-02 10:00:00", "agent_id": "A01",
+            "invoice_id": f"INV-{visit_id}", "products": [{"Product_ID": "P001", "Quantity": 2, "Price": 5.0,
+                                                            "Available_Stock": 1}], **extra}
+
+
+@pytest.fixture
+def outbox(sales_db, tmp_path, monkeypatch):
+    apply_migrations(sales_db)
+    monkeypatch.setattr(order_outbox, "OUTBOX_MAX_ATTEMPTS", 3)
+    outbox = OrderOutbox(sales_db, str(tmp_path / "outbox.db"))
+    # Flushed by hand below, not by the background thread
+    monkeypatch.setattr(outbox, "_ensure_flusher", lambda: None)
+    return outbox
+
+
+def test_bad_order_does_not_block_the_queue(outbox):
+    outbox.submit(_order("V1"))
+    # No products key: write_order raises KeyError, not sqlite3.Error
+    outbox.submit({k: v for k, v in _order("V2").items() if k != "products"})
+    outbox.submit(_order("V3"))
+
+    assert outbox.flush() == 2
+    assert outbox.status("V1")["Flushed_At"] and outbox.status("V3")["Flushed_At"]
+    failed = outbox.status("V2")
+    assert failed["Attempts"] == 1 and failed["Last_Error"].startswith("KeyError")
+    assert outbox.pending() == 1
+
+
+def test_order_is_quarantined_after_max_attempts(outbox):
+    outbox.submit({k: v for k, v in _order("V1").items() if k != "products"})
+    for _ in range(5):
+        outbox.flush()
+
+    assert outbox.status("V1")["Attempts"] == 3
+    assert outbox.pending() == 0
+    assert [row["Visit_ID"] for row in outbox.quarantined()] == ["V1"]
+
+    assert outbox.requeue("V1")
+    assert outbox.pending() == 1 and outbox.quarantined() == []
+
+
+def test_submit_retries_a_busy_outbox(outbox, monkeypatch):
+    monkeypatch.setattr(order_outbox.time, "sleep", lambda s: None)
+    pool, calls = outbox._pool, []
+
+    def busy_once():
+        calls.append(1)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return pool()
+
+    monkeypatch.setattr(outbox, "_pool", busy_once)
+    assert outbox.submit(_order("V1"))
+    monkeypatch.setattr(outbox, "_pool", pool)
+    assert outbox.pending() == 1
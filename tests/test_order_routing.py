@@ -0,0 +1,46 @@
+import sqlite3
+
+import pytest
+
+import agent_orchastrator.sales_assist_orchastrator as orchestrator
+import agents.order_logging_agent as order_logging
+from agents.order_logging_agent import OrderLoggingAgent
+from utils.intent import parse_command
+
+
+@pytest.fixture
+def route_loaded(monkeypatch):
+    # Beat and route already in state, caches warm
+    monkeypatch.setattr(orchestrator, "needs_route", lambda state: False)
+    monkeypatch.setattr(orchestrator, "_warm_node", lambda state, config: "pregenerate_pitches")
+
+
+def _turn(message, **state):
+    return {"sales_rep_id": "A001", "user_message": message, "Command": parse_command(message), **state}
+
+
+def test_submitted_order_goes_to_log_order(route_loaded):
+    state = _turn("", visit_id="V1", order_products=[])
+    assert orchestrator.route_entry(state) == "log_order"
+    assert orchestrator.fan_out_entry(state) == ["log_order"]
+
+
+def test_leftover_visit_id_does_not_swallow_the_next_message(route_loaded):
+    state = _turn("visit 3", visit_id="V1")
+    assert orchestrator.route_entry(state) == "pregenerate_pitches"
+    assert orchestrator.fan_out_entry(state) == ["pregenerate_pitches", "SelectRetailer"]
+    assert orchestrator.fan_out_entry(_turn("day summary", visit_id="V1")) == ["pregenerate_pitches", "day_summary"]
+
+
+class _UnwritableOutbox:
+    def submit(self, order):
+        raise sqlite3.OperationalError("unable to open database file")
+
+
+def test_failed_submit_clears_visit_id_and_reports(monkeypatch):
+    monkeypatch.setattr(order_logging, "get_order_outbox", lambda db_path: _UnwritableOutbox())
+    update = OrderLoggingAgent().log_order({"visit_id": "V1", "Retailer_ID": "R0001", "order_products": []})
+
+    assert update["visit_id"] is None
+    assert "unable to open database file" in update["order_error"]
+    assert "visited_retailers" not in update
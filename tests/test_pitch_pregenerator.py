@@ -0,0 +1,48 @@
+import threading
+import time
+
+from utils.pitch_pregenerator import PitchPregenerator
+
+
+ROUTE = [{"Retailer_ID": "R1", "Visit_Sequence": 1}, {"Retailer_ID": "R2", "Visit_Sequence": 2}]
+
+
+def _bundle(stock):
+    return {"Retailer_Info": {"Retailer_ID": "R1", "Name": "Shop"}, "Last_Visit_Stock": stock,
+            "Product_Recommendations": []}
+
+
+def _wait(pregen, session_id, retailer_id):
+    with pregen._lock:
+        _, job = pregen._sessions[session_id].jobs[retailer_id]
+    job.result(timeout=5)
+
+
+def test_pitch_is_only_served_for_the_bundle_it_was_written_from():
+    pregen = PitchPregenerator(generate=lambda b: f"pitch for {len(b['Last_Visit_Stock'])} items", lookahead=1)
+    before = _bundle([{"Product_ID": "P1", "Available_Stock": 2}])
+    pregen.schedule("s", ROUTE, [], load_bundle=lambda rid: before)
+    _wait(pregen, "s", "R1")
+    assert pregen.get_ready("s", "R1", before) == "pitch for 1 items"
+
+    # An order refreshed the stock: the old pitch is dropped, not served
+    after = _bundle([])
+    assert pregen.get_ready("s", "R1", after) is None
+    pregen.set_ready("s", "R1", after, "fresh pitch")
+    assert pregen.get_ready("s", "R1", after) == "fresh pitch"
+    assert pregen.get_ready("s", "R1", before) is None
+    pregen.shutdown()
+
+
+def test_hung_job_does_not_block_the_visit():
+    release = threading.Event()
+    pregen = PitchPregenerator(generate=lambda b: release.wait(10) and "late", lookahead=1)
+    bundle = _bundle([])
+    pregen.schedule("s", ROUTE, [], load_bundle=lambda rid: bundle)
+    time.sleep(0.05)  # let the job start running
+
+    start = time.perf_counter()
+    assert pregen.get_ready("s", "R1", bundle, timeout=0.1) is None
+    assert time.perf_counter() - start < 1
+    release.set()
+    pregen.shutdown()
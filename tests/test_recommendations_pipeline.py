@@ -0,0 +1,65 @@
+import sqlite3
+from datetime import date
+
+import pytest
+
+from benchmarks.recommendation_pipeline import make_db
+from pipelines import recommendations
+from pipelines.recommendations import RECS_TABLE, run_pipeline
+from utils.db import close_all_pools, get_pool
+from utils.online_recommendations import record_purchase_features
+
+
+@pytest.mark.parametrize("candidates", [False, True])
+def test_pipeline_runs_end_to_end(tmp_path, candidates):
+    path = str(tmp_path / "recs.db")
+    make_db(path, 2000, 300, 20000, 5, 3)
+
+    run_pipeline(path, candidates=candidates)
+
+    with sqlite3.connect(path) as conn:
+        assert conn.execute(f"SELECT count(*) FROM {RECS_TABLE}").fetchone()[0] > 0
+        combos, lo, hi = conn.execute("SELECT count(*), min(ML_Score), max(ML_Score) FROM rec_combo_scores").fetchone()
+        assert combos > 0 and 0.0 <= lo <= hi <= 1.0
+        # Candidate mode scores a subset of the (city, channel) x product grid
+        assert combos <= 5 * 3 * 300
+
+
+def test_orders_during_the_run_survive_the_swap(tmp_path, monkeypatch):
+    path = str(tmp_path / "recs.db")
+    make_db(path, 500, 100, 5000, 3, 2)
+    # The aggregates (and the model) orders update between runs
+    run_pipeline(path)
+    with sqlite3.connect(path) as conn:
+        retailer_id, city = conn.execute("SELECT Retailer_ID, City FROM retailers LIMIT 1").fetchone()
+
+    score_combos = recommendations.score_combos
+
+    def order_lands_mid_run(*args, **kwargs):
+        # An outbox flush after load_inputs: the sales row plus its online counter updates
+        order = {"retailer_id": retailer_id, "date": date.today().isoformat(), "products": [{"Product_ID": "P7"}]}
+        with get_pool(path).transaction() as conn:
+            conn.execute("INSERT INTO sales (Invoice_ID, Retailer_ID, Product_ID, Date) VALUES ('INV-late', ?, 'P7', ?)",
+                         (retailer_id, order["date"]))
+            record_purchase_features(conn, order)
+        return score_combos(*args, **kwargs)
+
+    monkeypatch.setattr(recommendations, "score_combos", order_lands_mid_run)
+    result = run_pipeline(path)
+    close_all_pools()
+
+    assert result["late_order_retailers"] == 1
+    with sqlite3.connect(path) as conn:
+        counted = conn.execute(
+            "SELECT Purchase_Count FROM rec_city_popularity WHERE City = ? AND Product_ID = 'P7'", (city,)
+        ).fetchone()[0]
+        in_sales = conn.execute(
+            "SELECT count(*) FROM sales s JOIN retailers r USING (Retailer_ID) WHERE r.City = ? AND s.Product_ID = 'P7'",
+            (city,),
+        ).fetchone()[0]
+        recent = conn.execute(
+            "SELECT Purchases FROM rec_recent_purchases WHERE Retailer_ID = ? AND Product_ID = 'P7' AND Date = ?",
+            (retailer_id, date.today().isoformat()),
+        ).fetchone()
+    assert counted == in_sales
+    assert recent is not None and recent[0] >= 1
@@ -0,0 +1,30 @@
+from utils.retailer_matcher import RouteMatcher
+
+
+ROUTE = [
+    {"Retailer_ID": "R0001", "Name": "Sharma General Store", "Visit_Sequence": 1},
+    {"Retailer_ID": "R0002", "Name": "Next Door Mart", "Visit_Sequence": 2},
+    {"Retailer_ID": "R0003", "Name": "Three Brothers Store", "Visit_Sequence": 3},
+    {"Retailer_ID": "R0004", "Name": "Gupta Kirana", "Visit_Sequence": 4},
+]
+
+
+def _pick(message, visited=()):
+    return RouteMatcher(ROUTE).match(message, visited=list(visited)).store["Retailer_ID"]
+
+
+def test_store_names_win_over_positional_words():
+    assert _pick("visit Next Door Mart", visited=["R0001", "R0002"]) == "R0002"
+    assert _pick("visit next door") == "R0002"
+    assert _pick("visit Three Brothers Store") == "R0003"
+    assert _pick("visit last sharma store") == "R0001"
+
+
+def test_positional_words_alone_go_by_position():
+    assert _pick("visit next", visited=["R0001"]) == "R0002"
+    assert _pick("visit the next store", visited=["R0001", "R0002"]) == "R0003"
+    assert _pick("visit last") == "R0004"
+    assert _pick("visit third") == "R0003"
+    assert _pick("visit 4") == "R0004"
+    assert _pick("visit r3") == "R0003"
+    assert _pick("visit gupt kirana") == "R0004"
@@ -0,0 +1,453 @@
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from datetime import date
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+from utils.db import get_pool, run_db
+
+
+CHECKPOINT_DB_PATH = os.getenv("CHECKPOINT_DB_PATH", "checkpoints.db")
+# Checkpoints kept per thread once compacted; only the latest is needed to resume
+CHECKPOINT_KEEP_LAST = int(os.getenv("CHECKPOINT_KEEP_LAST", "5"))
+# Threads untouched for this long are deleted outright
+CHECKPOINT_IDLE_TTL_S = float(os.getenv("CHECKPOINT_IDLE_TTL_S", str(7 * 24 * 3600)))
+# Compact a thread every N checkpoints; sweep idle threads at most this often
+COMPACT_EVERY = 20
+EVICT_INTERVAL_S = 3600.0
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS checkpoints (
+        Thread_ID TEXT NOT NULL,
+        Checkpoint_NS TEXT NOT NULL DEFAULT '',
+        Checkpoint_ID TEXT NOT NULL,
+        Parent_Checkpoint_ID TEXT,
+        Type TEXT,
+        Checkpoint BLOB,
+        Metadata_Type TEXT,
+        Metadata BLOB,
+        PRIMARY KEY (Thread_ID, Checkpoint_NS, Checkpoint_ID)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS checkpoint_blobs (
+        Thread_ID TEXT NOT NULL,
+        Checkpoint_NS TEXT NOT NULL DEFAULT '',
+        Channel TEXT NOT NULL,
+        Version TEXT NOT NULL,
+        Type TEXT NOT NULL,
+        Blob BLOB,
+        PRIMARY KEY (Thread_ID, Checkpoint_NS, Channel, Version)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS checkpoint_writes (
+        Thread_ID TEXT NOT NULL,
+        Checkpoint_NS TEXT NOT NULL DEFAULT '',
+        Checkpoint_ID TEXT NOT NULL,
+        Task_ID TEXT NOT NULL,
+        Idx INTEGER NOT NULL,
+        Channel TEXT NOT NULL,
+        Type TEXT,
+        Value BLOB,
+        Task_Path TEXT NOT NULL DEFAULT '',
+        PRIMARY KEY (Thread_ID, Checkpoint_NS, Checkpoint_ID, Task_ID, Idx)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS checkpoint_threads (
+        Thread_ID TEXT PRIMARY KEY,
+        Last_Seen REAL NOT NULL,
+        Puts_Since_Compact INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_checkpoint_threads_last_seen ON checkpoint_threads (Last_Seen)",
+]
+
+
+def rep_thread_id(sales_rep_id: str, day: Optional[str] = None) -> str:
+    """
+    Checkpoint thread of a rep's session for one day.
+
+    Derived on the server from the rep selected in the app, never taken from
+    the client (e.g. a URL), so a shared link cannot resume someone else's
+    session. A reload, restart or another worker lands on the same thread.
+    """
+    return f"rep:{sales_rep_id}:{day or date.today().isoformat()}"
+
+
+def _thread_config(thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> RunnableConfig:
+    return {
+        "configurable": {
+            "thread_id": thread_id,
+            "checkpoint_ns": checkpoint_ns,
+            "checkpoint_id": checkpoint_id,
+        }
+    }
+
+
+class SQLiteCheckpointSaver(BaseCheckpointSaver[str]):
+    """
+    LangGraph checkpointer persisted in a SQLite file, keyed by thread_id.
+
+    Channel values are stored once per (channel, version) like the in-memory
+    saver, so a checkpoint only writes the channels that changed. Every
+    `COMPACT_EVERY` checkpoints a thread is compacted down to its last
+    `keep_last` checkpoints, and threads idle for longer than `idle_ttl_s` are
+    evicted. The file is in WAL mode, so several Streamlit workers can share it.
+    """
+
+    def __init__(
+        self,
+        db_path: str = CHECKPOINT_DB_PATH,
+        keep_last: int = CHECKPOINT_KEEP_LAST,
+        idle_ttl_s: float = CHECKPOINT_IDLE_TTL_S,
+        *,
+        serde=None,
+    ):
+        super().__init__(serde=serde)
+        self.db_path = db_path
+        self.keep_last = max(keep_last, 1)
+        self.idle_ttl_s = idle_ttl_s
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+        self._last_evict = 0.0
+
+    def _pool(self):
+        pool = get_pool(self.db_path)
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    with pool.transaction() as conn:
+                        for statement in SCHEMA:
+                            conn.execute(statement)
+                    self._schema_ready = True
+        return pool
+
+    # ---------- Reads ----------
+    def _to_tuple(self, conn, row: Dict[str, Any]) -> CheckpointTuple:
+        thread_id, checkpoint_ns, checkpoint_id = row["Thread_ID"], row["Checkpoint_NS"], row["Checkpoint_ID"]
+        checkpoint: Checkpoint = self.serde.loads_typed((row["Type"], row["Checkpoint"]))
+
+        channel_values = {}
+        versions = list(checkpoint["channel_versions"].items())
+        if versions:
+            # Every channel's blob in one statement: one index seek per (channel, version)
+            blobs = conn.execute(
+                f"""
+                WITH wanted (Channel, Version) AS (VALUES {", ".join(["(?, ?)"] * len(versions))})
+                SELECT b.Channel, b.Type, b.Blob FROM wanted w
+                JOIN checkpoint_blobs b
+                  ON b.Thread_ID = ? AND b.Checkpoint_NS = ? AND b.Channel = w.Channel AND b.Version = w.Version
+                """,
+                [value for channel, version in versions for value in (channel, str(version))]
+                + [thread_id, checkpoint_ns],
+            ).fetchall()
+            for blob in blobs:
+                if blob["Type"] != "empty":
+                    channel_values[blob["Channel"]] = self.serde.loads_typed((blob["Type"], blob["Blob"]))
+
+        writes = conn.execute(
+            """
+            SELECT Task_ID, Channel, Type, Value FROM checkpoint_writes
+            WHERE Thread_ID = ? AND Checkpoint_NS = ? AND Checkpoint_ID = ?
+            ORDER BY Task_ID, Idx
+            """,
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+
+        parent_id = row["Parent_Checkpoint_ID"]
+        return CheckpointTuple(
+            config=_thread_config(thread_id, checkpoint_ns, checkpoint_id),
+            checkpoint={**checkpoint, "channel_values": channel_values},
+            metadata=self.serde.loads_typed((row["Metadata_Type"], row["Metadata"])),
+            parent_config=_thread_config(thread_id, checkpoint_ns, parent_id) if parent_id else None,
+            pending_writes=[
+                (w["Task_ID"], w["Channel"], self.serde.loads_typed((w["Type"], w["Value"]))) for w in writes
+            ],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+
+        with self._pool().connection() as conn:
+            if checkpoint_id:
+                row = conn.execute(
+                    """
+                    SELECT * FROM checkpoints
+                    WHERE Thread_ID = ? AND Checkpoint_NS = ? AND Checkpoint_ID = ?
+                    """,
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                # Checkpoint IDs are time-ordered UUIDs, so the max is the latest
+                row = conn.execute(
+                    """
+                    SELECT * FROM checkpoints
+                    WHERE Thread_ID = ? AND Checkpoint_NS = ?
+                    ORDER BY Checkpoint_ID DESC LIMIT 1
+                    """,
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+            return self._to_tuple(conn, row) if row else None
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        clauses, params = [], []
+        if config:
+            clauses.append("Thread_ID = ?")
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                clauses.append("Checkpoint_NS = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if get_checkpoint_id(config):
+                clauses.append("Checkpoint_ID = ?")
+                params.append(get_checkpoint_id(config))
+        if before and get_checkpoint_id(before):
+            clauses.append("Checkpoint_ID < ?")
+            params.append(get_checkpoint_id(before))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        with self._pool().connection() as conn:
+            rows = conn.execute(
+                f"SELECT * FROM checkpoints {where} ORDER BY Checkpoint_ID DESC", params
+            ).fetchall()
+            results = []
+            for row in rows:
+                if limit is not None and len(results) >= limit:
+                    break
+                if filter:
+                    metadata = self.serde.loads_typed((row["Metadata_Type"], row["Metadata"]))
+                    if not all(metadata.get(k) == v for k, v in filter.items()):
+                        continue
+                results.append(self._to_tuple(conn, row))
+        yield from results
+
+    # ---------- Writes ----------
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        stored = checkpoint.copy()
+        values = stored.pop("channel_values")
+
+        blobs = [
+            (thread_id, checkpoint_ns, channel, str(version),
+             *(self.serde.dumps_typed(values[channel]) if channel in values else ("empty", b"")))
+            for channel, version in new_versions.items()
+        ]
+        checkpoint_type, checkpoint_blob = self.serde.dumps_typed(stored)
+        metadata_type, metadata_blob = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+
+        with self._pool().transaction() as conn:
+            conn.executemany("INSERT OR REPLACE INTO checkpoint_blobs VALUES (?, ?, ?, ?, ?, ?)", blobs)
+            conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                 checkpoint_type, checkpoint_blob, metadata_type, metadata_blob),
+            )
+            puts = conn.execute(
+                """
+                INSERT INTO checkpoint_threads (Thread_ID, Last_Seen, Puts_Since_Compact) VALUES (?, ?, 1)
+                ON CONFLICT (Thread_ID) DO UPDATE
+                SET Last_Seen = excluded.Last_Seen, Puts_Since_Compact = Puts_Since_Compact + 1
+                RETURNING Puts_Since_Compact
+                """,
+                (thread_id, time.time()),
+            ).fetchone()["Puts_Since_Compact"]
+            if puts >= COMPACT_EVERY:
+                self._compact_thread(conn, thread_id)
+
+        self._maybe_evict()
+        return _thread_config(thread_id, checkpoint_ns, checkpoint["id"])
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            value_type, value_blob = self.serde.dumps_typed(value)
+            rows.append((thread_id, checkpoint_ns, checkpoint_id, task_id,
+                         WRITES_IDX_MAP.get(channel, idx), channel, value_type, value_blob, task_path))
+
+        # Special writes (errors, interrupts) have negative indexes and may be overwritten;
+        # regular ones are written once per task, matching the in-memory saver
+        with self._pool().transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO checkpoint_writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [r for r in rows if r[4] < 0],
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO checkpoint_writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [r for r in rows if r[4] >= 0],
+            )
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._pool().transaction() as conn:
+            self._delete_threads(conn, [thread_id])
+
+    # ---------- Async ----------
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await run_db(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        for item in await run_db(lambda: list(self.list(config, filter=filter, before=before, limit=limit))):
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions) -> RunnableConfig:
+        return await run_db(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path: str = "") -> None:
+        await run_db(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await run_db(self.delete_thread, thread_id)
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # ---------- Compaction / eviction ----------
+    def _compact_thread(self, conn, thread_id: str) -> int:
+        """Drops all but the last `keep_last` checkpoints of a thread, plus orphaned writes and blobs."""
+        removed = 0
+        namespaces = [r["Checkpoint_NS"] for r in conn.execute(
+            "SELECT DISTINCT Checkpoint_NS FROM checkpoints WHERE Thread_ID = ?", (thread_id,)
+        ).fetchall()]
+        for ns in namespaces:
+            kept = conn.execute(
+                """
+                SELECT Checkpoint_ID, Type, Checkpoint FROM checkpoints
+                WHERE Thread_ID = ? AND Checkpoint_NS = ?
+                ORDER BY Checkpoint_ID DESC LIMIT ?
+                """,
+                (thread_id, ns, self.keep_last),
+            ).fetchall()
+            if not kept:
+                continue
+            oldest_kept = kept[-1]["Checkpoint_ID"]
+            removed += conn.execute(
+                "DELETE FROM checkpoints WHERE Thread_ID = ? AND Checkpoint_NS = ? AND Checkpoint_ID < ?",
+                (thread_id, ns, oldest_kept),
+            ).rowcount
+            conn.execute(
+                "DELETE FROM checkpoint_writes WHERE Thread_ID = ? AND Checkpoint_NS = ? AND Checkpoint_ID < ?",
+                (thread_id, ns, oldest_kept),
+            )
+
+            # Keep only channel versions some surviving checkpoint still points at
+            live = set()
+            for row in kept:
+                versions = self.serde.loads_typed((row["Type"], row["Checkpoint"]))["channel_versions"]
+                live.update((channel, str(version)) for channel, version in versions.items())
+            blobs = conn.execute(
+                "SELECT Channel, Version FROM checkpoint_blobs WHERE Thread_ID = ? AND Checkpoint_NS = ?",
+                (thread_id, ns),
+            ).fetchall()
+            conn.executemany(
+                """
+                DELETE FROM checkpoint_blobs
+                WHERE Thread_ID = ? AND Checkpoint_NS = ? AND Channel = ? AND Version = ?
+                """,
+                [(thread_id, ns, b["Channel"], b["Version"]) for b in blobs
+                 if (b["Channel"], b["Version"]) not in live],
+            )
+        conn.execute("UPDATE checkpoint_threads SET Puts_Since_Compact = 0 WHERE Thread_ID = ?", (thread_id,))
+        return removed
+
+    @staticmethod
+    def _delete_threads(conn, thread_ids: List[str]) -> None:
+        rows = [(t,) for t in thread_ids]
+        for table in ("checkpoints", "checkpoint_blobs", "checkpoint_writes", "checkpoint_threads"):
+            conn.executemany(f"DELETE FROM {table} WHERE Thread_ID = ?", rows)
+
+    def compact(self) -> int:
+        """Compacts every thread. Returns the number of checkpoints removed."""
+        with self._pool().transaction() as conn:
+            threads = [r["Thread_ID"] for r in conn.execute("SELECT Thread_ID FROM checkpoint_threads").fetchall()]
+            return sum(self._compact_thread(conn, t) for t in threads)
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """Deletes threads not written for `idle_ttl_s`. Returns how many were evicted."""
+        cutoff = (now or time.time()) - self.idle_ttl_s
+        with self._pool().transaction() as conn:
+            idle = [r["Thread_ID"] for r in conn.execute(
+                "SELECT Thread_ID FROM checkpoint_threads WHERE Last_Seen < ?", (cutoff,)
+            ).fetchall()]
+            self._delete_threads(conn, idle)
+        return len(idle)
+
+    def _maybe_evict(self) -> None:
+        now = time.time()
+        if now - self._last_evict < EVICT_INTERVAL_S:
+            return
+        self._last_evict = now
+        self.evict_idle(now)
+
+    def stats(self) -> Dict[str, int]:
+        with self._pool().connection() as conn:
+            return {
+                table: conn.execute(f"SELECT count(*) AS n FROM {table}").fetchone()["n"]
+                for table in ("checkpoint_threads", "checkpoints", "checkpoint_blobs", "checkpoint_writes")
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact and evict persisted graph checkpoints.")
+    parser.add_argument("--db", default=CHECKPOINT_DB_PATH)
+    parser.add_argument("--compact", action="store_true", help="keep only the last checkpoints of every thread")
+    parser.add_argument("--evict", action="store_true", help="delete threads idle past CHECKPOINT_IDLE_TTL_S")
+    args = parser.parse_args()
+
+    saver = SQLiteCheckpointSaver(args.db)
+    if args.evict:
+        print(f"Evicted {saver.evict_idle()} idle thread(s)")
+    if args.compact:
+        print(f"Removed {saver.compact()} checkpoint(s)")
+    print(json.dumps(saver.stats()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import argparse
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from utils.db import DB_PATH, get_pool
+
+
+# Per-rep, per-day rollups of visits and sales. Written in the same transaction
+# as the order itself (utils.order_outbox.write_order), so the day summary reads
+# one row plus a handful of product rows instead of scanning visits and sales.
+DAILY_METRICS_QUERY = """
+    SELECT Actual_Visits, Orders, Revenue
+    FROM agent_daily_metrics
+    WHERE Agent_ID = ? AND Date = ?
+"""
+
+DAILY_TOP_PRODUCTS_QUERY = """
+    SELECT p.Product_Name, q.Quantity AS qty
+    FROM agent_daily_product_qty q
+    JOIN products p ON p.Product_ID = q.Product_ID
+    WHERE q.Agent_ID = ? AND q.Date = ?
+    ORDER BY q.Quantity DESC LIMIT 3
+"""
+
+# A retailer counts once per rep per day, however many visits were logged
+SEEN_RETAILER_QUERY = """
+    SELECT 1 FROM visits
+    WHERE Agent_ID = ? AND Date >= ? AND Date < ? AND Retailer_ID = ? AND Visit_ID <> ?
+    LIMIT 1
+"""
+
+_METRICS_UPSERT = """
+    INSERT INTO agent_daily_metrics (Agent_ID, Date, Actual_Visits, Orders, Revenue)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (Agent_ID, Date) DO UPDATE SET
+        Actual_Visits = Actual_Visits + excluded.Actual_Visits,
+        Orders = Orders + excluded.Orders,
+        Revenue = Revenue + excluded.Revenue
+"""
+
+_PRODUCT_QTY_UPSERT = """
+    INSERT INTO agent_daily_product_qty (Agent_ID, Date, Product_ID, Quantity)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (Agent_ID, Date, Product_ID) DO UPDATE SET Quantity = Quantity + excluded.Quantity
+"""
+
+
+def day_bounds(date: str) -> Tuple[str, str]:
+    """Returns the half-open [date, next day) range for a YYYY-MM-DD date."""
+    start = datetime.strptime(date[:10], "%Y-%m-%d")
+    return start.strftime("%Y-%m-%d"), (start + timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+def record_order(conn: sqlite3.Connection, order: Dict[str, Any]) -> None:
+    """
+    Folds one newly written order into the daily rollups, inside the caller's transaction.
+
+    Must only be called for an order whose visit row was just inserted, so
+    replays do not count twice.
+    """
+    agent_id, retailer_id = order.get("agent_id"), order["retailer_id"]
+    date, next_day = day_bounds(order["date"])
+    products = order["products"]
+
+    seen = conn.execute(
+        SEEN_RETAILER_QUERY, (agent_id, date, next_day, retailer_id, order["visit_id"])
+    ).fetchone()
+    revenue = sum(p["Quantity"] * p.get("Price", 0.0) for p in products)
+    conn.execute(_METRICS_UPSERT, (agent_id, date, 0 if seen else 1, 1 if products else 0, revenue))
+    conn.executemany(_PRODUCT_QTY_UPSERT, [
+        (agent_id, date, p["Product_ID"], p["Quantity"]) for p in products
+    ])
+
+
+def fetch_daily_metrics(conn: sqlite3.Connection, agent_id: str, date: str) -> Dict[str, Any]:
+    """Primary-key lookup of a rep's rollup for one day (zeros if nothing was logged)."""
+    row = conn.execute(DAILY_METRICS_QUERY, (agent_id, date[:10])).fetchone() or {}
+    top_products = conn.execute(DAILY_TOP_PRODUCTS_QUERY, (agent_id, date[:10])).fetchall()
+    return {
+        "total_actual_visits": row.get("Actual_Visits") or 0,
+        "total_orders": row.get("Orders") or 0,
+        "total_revenue": row.get("Revenue") or 0.0,
+        "top_products": [f"{p['Product_Name']} ({p['qty']})" for p in top_products],
+    }
+
+
+# Backfill from the raw tables; {where} narrows it to one day
+REBUILD_METRICS_SQL = """
+    INSERT INTO agent_daily_metrics (Agent_ID, Date, Actual_Visits, Orders, Revenue)
+    SELECT v.Agent_ID, substr(v.Date, 1, 10),
+           COUNT(DISTINCT v.Retailer_ID),
+           COUNT(DISTINCT s.Invoice_ID),
+           COALESCE(SUM(s.Total_Amount), 0.0)
+    FROM visits v
+    LEFT JOIN sales s ON s.Visit_ID = v.Visit_ID
+    {where}
+    GROUP BY v.Agent_ID, substr(v.Date, 1, 10)
+"""
+
+REBUILD_PRODUCT_QTY_SQL = """
+    INSERT INTO agent_daily_product_qty (Agent_ID, Date, Product_ID, Quantity)
+    SELECT v.Agent_ID, substr(v.Date, 1, 10), s.Product_ID, SUM(s.Quantity)
+    FROM visits v
+    JOIN sales s ON s.Visit_ID = v.Visit_ID
+    {where}
+    GROUP BY v.Agent_ID, substr(v.Date, 1, 10), s.Product_ID
+"""
+
+
+def rebuild_daily_metrics(db_path: str = DB_PATH, date: Optional[str] = None) -> int:
+    """
+    Recomputes the rollups from visits and sales, for one day or the whole history.
+
+    Use after bulk loads that bypass the order path (e.g. the data notebooks).
+
+    Returns:
+        The number of (rep, day) rows written.
+    """
+    if date:
+        where, params, scope = "WHERE v.Date >= ? AND v.Date < date(?, '+1 day')", (date, date), "WHERE Date = ?"
+    else:
+        where, params, scope = "", (), ""
+
+    with get_pool(db_path).transaction() as conn:
+        conn.execute(f"DELETE FROM agent_daily_metrics {scope}", params[:1])
+        conn.execute(f"DELETE FROM agent_daily_product_qty {scope}", params[:1])
+        written = conn.execute(REBUILD_METRICS_SQL.format(where=where), params).rowcount
+        conn.execute(REBUILD_PRODUCT_QTY_SQL.format(where=where), params)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill the per-rep daily metrics rollups.")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--date", help="only rebuild this YYYY-MM-DD day (default: all history)")
+    args = parser.parse_args()
+
+    from utils.migrations import apply_migrations
+    apply_migrations(args.db)
+    rows = rebuild_daily_metrics(args.db, args.date)
+    print(f"{args.db}: rebuilt {rows} rep-day row(s)" + (f" for {args.date}" if args.date else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+import asyncio
+import contextvars
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from utils.telemetry import TELEMETRY_ENABLED, observe_sql
+
+
+DB_PATH = "sales_agent_co_pilot.db"
+
+# sqlite3 keeps an LRU of compiled statements per connection; since pooled
+# connections live for the whole process the hot queries are prepared once.
+STATEMENT_CACHE_SIZE = 256
+POOL_SIZE = 8
+BUSY_TIMEOUT_S = 5.0
+
+
+def dict_factory(cursor: sqlite3.Cursor, row: tuple) -> Dict[str, Any]:
+    """Row factory returning plain dicts keyed by column name."""
+    return {col[0]: value for col, value in zip(cursor.description, row)}
+
+
+class MeteredCursor(sqlite3.Cursor):
+    """
+    Cursor that reports each statement to utils.telemetry.
+
+    A statement that returns no rows is reported when it executes; a query
+    when its rows are fetched, with the fetch time and row count included.
+    """
+
+    _sql: Optional[str] = None
+    _seconds = 0.0
+
+    def execute(self, sql: str, parameters: Any = (), /) -> "MeteredCursor":
+        self._sql = None
+        start = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        except Exception:
+            observe_sql(sql, time.perf_counter() - start, error=True)
+            raise
+        self._pending(sql, time.perf_counter() - start)
+        return self
+
+    def executemany(self, sql: str, seq_of_parameters: Iterable[Any], /) -> "MeteredCursor":
+        self._sql = None
+        start = time.perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        except Exception:
+            observe_sql(sql, time.perf_counter() - start, error=True)
+            raise
+        self._pending(sql, time.perf_counter() - start)
+        return self
+
+    def _pending(self, sql: str, seconds: float) -> None:
+        if self.description is None:
+            observe_sql(sql, seconds, rows=max(self.rowcount, 0))
+        else:
+            self._sql, self._seconds = sql, seconds
+
+    def _fetched(self, start: float, rows: int) -> None:
+        if self._sql is not None:
+            observe_sql(self._sql, self._seconds + time.perf_counter() - start, rows=rows)
+            self._sql = None
+
+    def fetchall(self) -> List[Any]:
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows))
+        return rows
+
+    def fetchone(self) -> Any:
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size: int = 1) -> List[Any]:
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(start, len(rows))
+        return rows
+
+
+class MeteredConnection(sqlite3.Connection):
+    """Connection whose cursors (including the ones `execute` opens) are MeteredCursors."""
+
+    def cursor(self, factory: Any = MeteredCursor) -> sqlite3.Cursor:
+        return super().cursor(factory)
+
+    # sqlite3's own shortcuts bypass an overridden Cursor.execute, so route them through one
+    def execute(self, sql: str, parameters: Any = (), /) -> sqlite3.Cursor:
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters: Iterable[Any], /) -> sqlite3.Cursor:
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self) -> None:
+        if not self.in_transaction:
+            return super().commit()
+        start = time.perf_counter()
+        super().commit()
+        observe_sql("COMMIT", time.perf_counter() - start)
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of SQLite connections for one database file.
+
+    Connections are opened lazily (up to `size`), configured once for WAL
+    journaling and dict rows, and handed out to one thread at a time.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, size: int = POOL_SIZE):
+        self.db_path = db_path
+        self.size = size
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=size)
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=BUSY_TIMEOUT_S,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            factory=MeteredConnection if TELEMETRY_ENABLED else sqlite3.Connection,
+        )
+        conn.row_factory = dict_factory
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        if self._closed:
+            raise RuntimeError(f"Connection pool for {self.db_path} is closed.")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return self._open()
+                except Exception:
+                    self._opened -= 1
+                    raise
+
+        # Pool exhausted: wait for another thread to hand a connection back
+        return self._idle.get(timeout=BUSY_TIMEOUT_S)
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+            return
+        self._idle.put_nowait(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Yields a connection inside BEGIN ... COMMIT, rolling back on error."""
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._opened = 0
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str = DB_PATH) -> ConnectionPool:
+    """Returns the process-wide pool for `db_path`, creating it on first use."""
+    pool = _pools.get(db_path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(db_path)
+            if pool is None:
+                pool = ConnectionPool(db_path)
+                _pools[db_path] = pool
+    return pool
+
+
+def close_all_pools() -> None:
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+# ---------- Query helpers ----------
+def fetch_all(query: str, params: Sequence[Any] = (), db_path: str = DB_PATH) -> List[Dict[str, Any]]:
+    with get_pool(db_path).connection() as conn:
+        return conn.execute(query, params).fetchall()
+
+
+def fetch_one(query: str, params: Sequence[Any] = (), db_path: str = DB_PATH) -> Optional[Dict[str, Any]]:
+    with get_pool(db_path).connection() as conn:
+        return conn.execute(query, params).fetchone()
+
+
+def execute(query: str, params: Sequence[Any] = (), db_path: str = DB_PATH) -> int:
+    """Runs a single write statement in its own transaction and returns the rowcount."""
+    with get_pool(db_path).transaction() as conn:
+        return conn.execute(query, params).rowcount
+
+
+def execute_many(query: str, rows: Iterable[Sequence[Any]], db_path: str = DB_PATH) -> int:
+    with get_pool(db_path).transaction() as conn:
+        return conn.executemany(query, rows).rowcount
+
+
+def transaction(db_path: str = DB_PATH):
+    """Shortcut for `get_pool(db_path).transaction()`."""
+    return get_pool(db_path).transaction()
+
+
+# ---------- Async offload ----------
+# One thread per pooled connection, so offloaded work never queues on the pool itself
+_db_executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="sqlite")
+
+
+async def run_db(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Runs blocking DB work on the SQLite executor without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    # In the caller's context, so the statements count towards the node that awaited them
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_db_executor, partial(context.run, fn, *args, **kwargs))
@@ -1,20 +1,14 @@
-import sqlite3
-import pandas as pd
+from utils.db import DB_PATH, fetch_all
 
 
-def get_active_agents():
-    db_path = "sales_agent_co_pilot.db"
-    conn = sqlite3.connect(db_path)
-
+def get_active_agents(db_path: str = DB_PATH):
     query = """
         SELECT Agent_ID, Name 
         FROM sales_agents
     """
-    agents_df = pd.read_sql_query(query, conn)
-    
-    conn.close()
+    agents = fetch_all(query, db_path=db_path)
     
-    if agents_df.empty:
+    if not agents:
         return "No active agents found."
     
-    return agents_df
\ No newline at end of file
+    return [a["Agent_ID"] for a in agents]
\ No newline at end of file
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+from collections import defaultdict
+from io import BytesIO
+from typing import Any, Dict, List, Tuple
+
+
+GRAPH_DIAGRAM_DIR = os.getenv("GRAPH_DIAGRAM_DIR", ".graph_diagrams")
+
+
+def graph_structure(drawable: Any) -> Dict[str, Any]:
+    """Nodes and edges of a LangChain drawable graph (`compiled.get_graph()`) in a stable order."""
+    nodes = sorted(node.name for node in drawable.nodes.values())
+    edges = sorted(
+        (drawable.nodes[e.source].name, drawable.nodes[e.target].name, bool(e.conditional))
+        for e in drawable.edges
+    )
+    return {"nodes": nodes, "edges": edges}
+
+
+def structure_hash(structure: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(structure, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def _layers(nodes: List[str], edges: List[Tuple[str, str, bool]]) -> Dict[str, int]:
+    """Longest-path layering from the start node; a cycle stops growing at the last layer."""
+    depth = {node: 0 for node in nodes}
+    # Bounded relaxation: each pass can only push a node one layer further down
+    for _ in range(len(nodes)):
+        changed = False
+        for source, target, _ in edges:
+            if depth[target] < depth[source] + 1 <= len(nodes) - 1:
+                depth[target] = depth[source] + 1
+                changed = True
+        if not changed:
+            break
+    if "__end__" in depth:
+        depth["__end__"] = max(depth.values()) + (0 if len(nodes) == 1 else 1)
+    return depth
+
+
+def render_png(structure: Dict[str, Any]) -> bytes:
+    """
+    Draws the graph top-down with matplotlib, no network or Graphviz needed.
+
+    Conditional edges are dashed, like the Mermaid rendering.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    nodes, edges = structure["nodes"], [tuple(e) for e in structure["edges"]]
+    depth = _layers(nodes, edges)
+    rows = defaultdict(list)
+    for node in sorted(nodes, key=lambda n: (depth[n], n)):
+        rows[depth[node]].append(node)
+
+    width = max(len(row) for row in rows.values())
+    positions = {}
+    # Renumber layers so empty ones do not leave gaps
+    for level, depth_key in enumerate(sorted(rows)):
+        row = rows[depth_key]
+        for i, node in enumerate(row):
+            positions[node] = ((i + 1) * width / (len(row) + 1), -level)
+
+    fig, ax = plt.subplots(figsize=(max(6, 3 * width), 1.1 * (len(rows) + 1)))
+    for n, (source, target, conditional) in enumerate(edges):
+        span = positions[source][1] - positions[target][1]
+        # Edges skipping layers (or pointing back up) bow out so they don't hide straight ones
+        rad = 0.0 if span == 1 else (0.25 + 0.05 * abs(span)) * (1 if n % 2 else -1)
+        ax.annotate(
+            "",
+            xy=positions[target],
+            xytext=positions[source],
+            annotation_clip=False,
+            arrowprops=dict(
+                arrowstyle="-|>",
+                color="#555555",
+                linestyle="--" if conditional else "-",
+                shrinkA=14,
+                shrinkB=14,
+                connectionstyle=f"arc3,rad={rad}",
+            ),
+        )
+    for node, (x, y) in positions.items():
+        terminal = node in ("__start__", "__end__")
+        ax.text(
+            x, y, node.strip("_") if terminal else node,
+            ha="center", va="center", fontsize=10,
+            bbox=dict(
+                boxstyle="round,pad=0.5",
+                facecolor="#f2f0ff" if not terminal else "#ffffff",
+                edgecolor="#9370db" if not terminal else "#bbbbbb",
+            ),
+        )
+
+    ax.set_xlim(-0.5, width + 0.5)
+    ax.set_ylim(-len(rows) + 0.5, 0.5)
+    ax.axis("off")
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png", dpi=120, bbox_inches="tight")
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def get_diagram_png(compiled_graph: Any, cache_dir: str = GRAPH_DIAGRAM_DIR) -> bytes:
+    """
+    PNG of the compiled graph, cached on disk under a hash of its nodes and edges.
+
+    The image is only re-rendered when the graph structure changes.
+    """
+    structure = graph_structure(compiled_graph.get_graph())
+    path = os.path.join(cache_dir, f"agent_graph_{structure_hash(structure)}.png")
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    png_bytes = render_png(structure)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write-then-rename so a concurrent worker never reads a half-written file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(png_bytes)
+    os.replace(tmp_path, path)
+    return png_bytes
@@ -0,0 +1,114 @@
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import Runnable
+
+from utils.telemetry import TELEMETRY_ENABLED, node_span, observe_llm
+
+
+# LangChain / LangGraph hooks feeding utils.telemetry: a wrapper that times a
+# graph node (and opens the span its SQL and LLM time is added to), and a
+# callback handler on every chat model from utils.llm_clients that times the
+# call, its first streamed token and its token usage. The handler runs inline,
+# in the caller's context, so an LLM call made inside a node lands in that
+# node's span.
+
+
+class MeteredNode(Runnable):
+    """Runs a graph node inside a telemetry span named after it."""
+
+    def __init__(self, name: str, node: Runnable):
+        super().__init__()
+        self.name = name
+        self.node = node
+
+    def invoke(self, state: Dict[str, Any], config: Dict = None, **kwargs: Any) -> Any:
+        with node_span(self.name):
+            return self.node.invoke(state, config, **kwargs)
+
+    async def ainvoke(self, state: Dict[str, Any], config: Dict = None, **kwargs: Any) -> Any:
+        with node_span(self.name):
+            return await self.node.ainvoke(state, config, **kwargs)
+
+
+def metered_node(name: str, node: Runnable) -> Runnable:
+    return MeteredNode(name, node) if TELEMETRY_ENABLED else node
+
+
+def token_usage(response: LLMResult) -> Tuple[int, int, int]:
+    """(prompt, completion, cached prompt) tokens of a chat model result; zeros when the model reports none."""
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+        return usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0, cached
+    # Streamed responses carry usage on the message instead (ChatOpenAI with stream_usage)
+    for generations in response.generations:
+        for generation in generations:
+            meta = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if meta:
+                cached = (meta.get("input_token_details") or {}).get("cache_read") or 0
+                return meta.get("input_tokens") or 0, meta.get("output_tokens") or 0, cached
+    return 0, 0, 0
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """Times every chat model call it is attached to and records its token usage."""
+
+    run_inline = True
+
+    def __init__(self):
+        super().__init__()
+        # run_id -> [llm name, start, first token time]
+        self._runs: Dict[UUID, List[Any]] = {}
+
+    def _start(self, run_id: UUID, serialized: Optional[Dict[str, Any]], metadata: Optional[Dict[str, Any]]) -> None:
+        name = (metadata or {}).get("llm") or ((serialized or {}).get("kwargs") or {}).get("model_name") or "llm"
+        self._runs[run_id] = [name, time.perf_counter(), None]
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs: Any) -> None:
+        self._start(run_id, serialized, metadata)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs: Any) -> None:
+        self._start(run_id, serialized, metadata)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs: Any) -> None:
+        run = self._runs.get(run_id)
+        if run is not None and run[2] is None:
+            run[2] = time.perf_counter()
+
+    def on_llm_end(self, response: LLMResult, *, run_id, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        name, start, first_token = run
+        prompt_tokens, completion_tokens, cached = token_usage(response)
+        observe_llm(
+            name, time.perf_counter() - start, prompt_tokens, completion_tokens, cached,
+            first_token_s=first_token - start if first_token is not None else None,
+        )
+
+    def on_llm_error(self, error: BaseException, *, run_id, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            observe_llm(run[0], time.perf_counter() - run[1], error=True)
+
+
+# Shared by every model in utils.llm_clients
+llm_metrics_handler = LLMMetricsHandler()
+
+
+def instrument_llm(name: str, model: Any) -> Any:
+    """Tags `model` with its agent name and attaches llm_metrics_handler (once); returns it."""
+    if not TELEMETRY_ENABLED or not hasattr(model, "metadata"):
+        return model
+    callbacks = getattr(model, "callbacks", None)
+    if callbacks is not None and not isinstance(callbacks, list):
+        # A callback manager the caller set up; leave it as it is
+        return model
+    model.metadata = {**(model.metadata or {}), "llm": name}
+    if llm_metrics_handler not in (callbacks or []):
+        model.callbacks = [*(callbacks or []), llm_metrics_handler]
+    return model
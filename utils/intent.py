@@ -0,0 +1,95 @@
+import re
+from functools import lru_cache
+from typing import Any, Dict, Literal, Optional, Tuple
+
+from typing_extensions import TypedDict
+
+
+# What a chat message asks for, classified once per turn by parse_command and
+# carried in SalesRepState["Command"]; the graph's routers and app.py branch
+# on the intent instead of re-testing the text with `"visit" in msg`.
+#
+# Every keyword is matched on word boundaries, so "revisit" is not a visit
+# and "planogram" is not a plan. One compiled alternation scans the message
+# once; when it names several commands ("replan the remaining stops") the
+# earliest in PRIORITY wins, matching the order the old checks ran in.
+Intent = Literal[
+    "day_summary", "refresh", "replan", "visit", "nearby", "unvisited", "plan", "cart", "chat",
+]
+PRIORITY: Tuple[Intent, ...] = (
+    "day_summary", "refresh", "replan", "visit", "nearby", "unvisited", "plan", "cart",
+)
+# Answered from the state the last turn left behind; app.py does not run the graph for these
+VIEW_INTENTS = frozenset({"plan", "unvisited", "nearby", "cart"})
+# "stores nearby" without a distance
+NEARBY_RADIUS_KM = 0.5
+
+_UNITS = r"km|kms|kilometers?|kilometres?|m|meters?|metres?"
+_COMMAND = re.compile(
+    r"(?P<day_summary>\b(?:day|daily)[\s-]*summary\b)"
+    r"|(?P<refresh>\b(?:refresh|reload)\b)"
+    r"|(?P<replan>\bre-?plan(?:ned|ning)?\b)"
+    r"|(?P<visit>\bvisit(?:ing)?\b)"
+    rf"|(?P<nearby>\b(?:within|in|under)\s+(?P<radius>\d+(?:\.\d+)?)\s*(?P<unit>{_UNITS})\b"
+    r"|\bnearby\b|\bnear\s+me\b|\baround\s+me\b)"
+    r"|(?P<unvisited>\b(?:unvisited|remaining|pending|not\s+visited)\b)"
+    r"|(?P<plan>\b(?:plan|route)\b)"
+    r"|(?P<cart>\b(?:cart|basket)\b)"
+)
+
+
+class UserCommand(TypedDict):
+    intent: Intent
+    # The user_message this was parsed from; one left over from an earlier turn is ignored
+    text: str
+    # "nearby" only: search radius in km
+    radius_km: Optional[float]
+
+
+@lru_cache(maxsize=1024)
+def _classify(text: str) -> Tuple[Intent, Optional[float]]:
+    found: Dict[str, Optional[float]] = {}
+    for m in _COMMAND.finditer(text.lower()):
+        for intent in PRIORITY:
+            if m.group(intent) is not None:
+                break
+        if intent == "nearby" and "nearby" not in found and m.group("radius"):
+            value = float(m.group("radius"))
+            found[intent] = value if m.group("unit").startswith("k") else value / 1000
+        else:
+            found.setdefault(intent, NEARBY_RADIUS_KM if intent == "nearby" else None)
+    for intent in PRIORITY:
+        if intent in found:
+            return intent, found[intent]
+    return "chat", None
+
+
+def parse_command(message: Optional[str]) -> UserCommand:
+    """
+    Classifies one chat message.
+
+    Args:
+        message (str): The rep's message, e.g. "visit 3", "plan unvisited",
+            "stores within 500 m".
+
+    Returns:
+        UserCommand with the intent ("chat" when nothing matched), the message
+        itself, and for "nearby" the radius asked for (NEARBY_RADIUS_KM by default).
+    """
+    text = message or ""
+    intent, radius_km = _classify(text)
+    return {"intent": intent, "text": text, "radius_km": radius_km}
+
+
+def command_of(state: Dict[str, Any]) -> UserCommand:
+    """state["Command"] when it was parsed from the current user_message, else the message parsed now."""
+    command = state.get("Command")
+    message = state.get("user_message") or ""
+    if command and command.get("text") == message:
+        return command
+    return parse_command(message)
+
+
+def intent_of(state: Dict[str, Any]) -> Intent:
+    return command_of(state)["intent"]
+
@@ -0,0 +1,193 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+from utils.db import get_pool, run_db
+from utils.telemetry import observe_llm_cache
+
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.db")
+LLM_CACHE_TTL_S = float(os.getenv("LLM_CACHE_TTL_S", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+LLM_CACHE_BYPASS = os.getenv("LLM_CACHE_BYPASS", "0") == "1"
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS llm_cache (
+        Cache_Key TEXT PRIMARY KEY,
+        Model TEXT,
+        Temperature REAL,
+        Response TEXT,
+        Created_At REAL,
+        Last_Access REAL
+    )
+"""
+LRU_INDEX = "CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache (Last_Access)"
+
+
+def model_params(llm: Any) -> Dict[str, Any]:
+    """Reads the model name and temperature off a LangChain chat model."""
+    model = getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+    return {"model": str(model), "temperature": getattr(llm, "temperature", None)}
+
+
+def cache_key(model: str, temperature: Optional[float], prompt: str) -> str:
+    payload = f"{model}\x1f{temperature}\x1f{prompt}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Disk-backed cache of LLM responses keyed by (model, temperature, sha256(prompt)).
+
+    Entries older than `ttl_s` are treated as misses and purged. Once the
+    table grows past `max_entries`, the least recently read entries are evicted.
+    """
+
+    def __init__(
+        self,
+        db_path: str = LLM_CACHE_PATH,
+        ttl_s: float = LLM_CACHE_TTL_S,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+        bypass: bool = LLM_CACHE_BYPASS,
+    ):
+        self.db_path = db_path
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self._counter_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _pool(self):
+        pool = get_pool(self.db_path)
+        if not self._schema_ready:
+            with pool.transaction() as conn:
+                conn.execute(SCHEMA)
+                conn.execute(LRU_INDEX)
+            self._schema_ready = True
+        return pool
+
+    def _count(self, hit: bool) -> None:
+        with self._counter_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, model: str, temperature: Optional[float], prompt: str) -> Optional[str]:
+        key = cache_key(model, temperature, prompt)
+        now = time.time()
+        with self._pool().connection() as conn:
+            row = conn.execute(
+                "SELECT Response, Created_At FROM llm_cache WHERE Cache_Key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row["Created_At"] <= self.ttl_s:
+                conn.execute("UPDATE llm_cache SET Last_Access = ? WHERE Cache_Key = ?", (now, key))
+                conn.commit()
+                self._count(hit=True)
+                return row["Response"]
+        self._count(hit=False)
+        return None
+
+    def put(self, model: str, temperature: Optional[float], prompt: str, response: str) -> None:
+        key = cache_key(model, temperature, prompt)
+        now = time.time()
+        with self._pool().transaction() as conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO llm_cache (Cache_Key, Model, Temperature, Response, Created_At, Last_Access)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (key, model, temperature, response, now, now),
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now: float) -> None:
+        conn.execute("DELETE FROM llm_cache WHERE Created_At < ?", (now - self.ttl_s,))
+        excess = conn.execute("SELECT count(*) AS n FROM llm_cache").fetchone()["n"] - self.max_entries
+        if excess > 0:
+            conn.execute(
+                """
+                DELETE FROM llm_cache WHERE Cache_Key IN (
+                    SELECT Cache_Key FROM llm_cache ORDER BY Last_Access ASC LIMIT ?
+                )
+                """,
+                (excess,),
+            )
+
+    def invoke(self, llm: Any, prompt: str, bypass: Optional[bool] = None) -> str:
+        """
+        Returns `llm.invoke(prompt).content`, served from the cache when possible.
+
+        With `bypass` (or the instance-wide flag) the lookup is skipped and the
+        fresh response overwrites the cached one.
+        """
+        params = model_params(llm)
+        skip = self.bypass if bypass is None else bypass
+        if not skip:
+            cached = self.get(params["model"], params["temperature"], prompt)
+            observe_llm_cache(llm, cached is not None)
+            if cached is not None:
+                return cached
+
+        response = llm.invoke(prompt).content
+        self.put(params["model"], params["temperature"], prompt, response)
+        return response
+
+    def stream(self, llm: Any, prompt: str, bypass: Optional[bool] = None) -> Iterator[str]:
+        """
+        Streaming counterpart of `invoke`: yields text chunks as they arrive.
+
+        A cached response is yielded as a single chunk; a fresh one is stored
+        once the stream completes.
+        """
+        params = model_params(llm)
+        skip = self.bypass if bypass is None else bypass
+        if not skip:
+            cached = self.get(params["model"], params["temperature"], prompt)
+            observe_llm_cache(llm, cached is not None)
+            if cached is not None:
+                yield cached
+                return
+
+        parts = []
+        for chunk in llm.stream(prompt):
+            if chunk.content:
+                parts.append(chunk.content)
+                yield chunk.content
+        self.put(params["model"], params["temperature"], prompt, "".join(parts))
+
+    async def astream(self, llm: Any, prompt: str, bypass: Optional[bool] = None) -> AsyncIterator[str]:
+        """Async counterpart of `stream`; cache reads and writes run on the DB executor."""
+        params = model_params(llm)
+        skip = self.bypass if bypass is None else bypass
+        if not skip:
+            cached = await run_db(self.get, params["model"], params["temperature"], prompt)
+            observe_llm_cache(llm, cached is not None)
+            if cached is not None:
+                yield cached
+                return
+
+        parts = []
+        async for chunk in llm.astream(prompt):
+            if chunk.content:
+                parts.append(chunk.content)
+                yield chunk.content
+        await run_db(self.put, params["model"], params["temperature"], prompt, "".join(parts))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._counter_lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {"hits": hits, "misses": misses, "hit_rate": hits / total if total else 0.0}
+
+    def clear(self) -> None:
+        with self._pool().transaction() as conn:
+            conn.execute("DELETE FROM llm_cache")
+
+
+# Process-wide instance shared by the pitch and day summary agents
+llm_cache = LLMResponseCache()
@@ -0,0 +1,131 @@
+import asyncio
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+
+# Model settings per agent; clients are only built when an agent first calls its LLM
+LLM_SPECS: Dict[str, Dict[str, Any]] = {
+    "pitch": {"model": "gpt-4o-mini", "temperature": 0.7},
+    "select_retailer": {"model": "gpt-4o-mini"},
+    "day_summary": {"model": "gpt-4o-mini", "temperature": 0.7},
+}
+
+
+class MissingAPIKeyError(RuntimeError):
+    pass
+
+
+class LLMClientRegistry:
+    """
+    Lazily built, process-wide chat models keyed by agent name.
+
+    Nothing heavy happens at import: `.env` is read, `langchain_openai` is
+    imported and the HTTP clients are opened on the first `get`. Every model
+    shares one sync HTTP client, so connections to the API are pooled across
+    agents. An async connection pool belongs to the event loop it was opened
+    on, so a `get` from inside a running loop returns models built for that
+    loop, sharing one async client per loop; they are dropped once the loop
+    is closed, so separate `asyncio.run` calls never reuse a dead loop's
+    connections.
+    `set` installs a ready-made model (e.g. a fake chat model in a benchmark)
+    in place of the configured one, for every loop. Either way the model is
+    tagged with its agent name and timed by utils.graph_telemetry.
+    """
+
+    def __init__(self, specs: Dict[str, Dict[str, Any]] = LLM_SPECS):
+        self.specs = specs
+        # Installed with `set`; used everywhere
+        self._installed: Dict[str, Any] = {}
+        # Built outside any event loop
+        self._models: Dict[str, Any] = {}
+        # event loop -> (its async HTTP client, models built on it)
+        self._loop_models: Dict[asyncio.AbstractEventLoop, Tuple[Any, Dict[str, Any]]] = {}
+        self._http_client = None
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Any:
+        model = self._installed.get(name)
+        if model is not None:
+            return model
+        loop = _running_loop()
+        with self._lock:
+            if name in self._installed:
+                return self._installed[name]
+            if loop is None:
+                if name not in self._models:
+                    self._models[name] = self._build(name)
+                return self._models[name]
+            if loop not in self._loop_models:
+                import httpx
+                # A closed loop's pool can't be used (or closed) any more; let it go
+                for closed in [done for done in self._loop_models if done.is_closed()]:
+                    del self._loop_models[closed]
+                self._loop_models[loop] = (httpx.AsyncClient(), {})
+            async_client, models = self._loop_models[loop]
+            if name not in models:
+                models[name] = self._build(name, async_client)
+            return models[name]
+
+    def set(self, name: str, model: Any) -> None:
+        from utils.graph_telemetry import instrument_llm
+
+        with self._lock:
+            self._installed[name] = instrument_llm(name, model)
+
+    def reset(self, name: Optional[str] = None) -> None:
+        """Forgets built and installed models so the next `get` rebuilds them (e.g. after a key change)."""
+        with self._lock:
+            if name is None:
+                self._installed.clear()
+                self._models.clear()
+                self._loop_models.clear()
+                return
+            self._installed.pop(name, None)
+            self._models.pop(name, None)
+            for _, models in self._loop_models.values():
+                models.pop(name, None)
+
+    def _build(self, name: str, http_async_client: Any = None) -> Any:
+        if name not in self.specs:
+            raise KeyError(f"No LLM configured for '{name}'. Known: {', '.join(sorted(self.specs))}")
+
+        from dotenv import load_dotenv
+        load_dotenv(override=True)
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise MissingAPIKeyError(
+                f"OPENAI_API_KEY is not set; the '{name}' agent needs it. Add it to .env or the environment."
+            )
+
+        import httpx
+        from langchain_openai import ChatOpenAI
+
+        from utils.graph_telemetry import instrument_llm
+
+        if self._http_client is None:
+            self._http_client = httpx.Client()
+        return instrument_llm(name, ChatOpenAI(
+            **self.specs[name],
+            api_key=api_key,
+            http_client=self._http_client,
+            # Outside a loop: a pool of the model's own, opened by whichever loop first awaits it
+            http_async_client=http_async_client or httpx.AsyncClient(),
+            # Token usage on streamed responses too, for the metrics
+            stream_usage=True,
+        ))
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+# Process-wide registry shared by all agents
+llm_clients = LLMClientRegistry()
+
+
+def get_llm(name: str) -> Any:
+    return llm_clients.get(name)
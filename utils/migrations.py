@@ -0,0 +1,256 @@
+import argparse
+import re
+import sqlite3
+from typing import Any, Callable, Dict, List, Sequence, Tuple, Union
+
+from utils.db import DB_PATH, get_pool
+from utils.daily_metrics import REBUILD_METRICS_SQL, REBUILD_PRODUCT_QTY_SQL
+from utils.online_recommendations import FEATURE_TABLES
+
+
+# Each migration is (version, description, statements). The applied version is
+# tracked in PRAGMA user_version so every step runs exactly once per database.
+# Statements must be idempotent so `--reapply` can restore indexes dropped by
+# notebooks that rewrite tables with `to_sql(if_exists="replace")`. A statement
+# may also be a function of the connection, for steps that depend on what the
+# database already holds.
+Statement = Union[str, Callable[[sqlite3.Connection], None]]
+
+
+def table_exists(conn: sqlite3.Connection, table: str) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone() is not None
+
+
+def index_if_table(table: str, statement: str) -> Callable[[sqlite3.Connection], None]:
+    """A migration step running `statement` only when `table` exists (it is owned by something else)."""
+    def step(conn: sqlite3.Connection) -> None:
+        if table_exists(conn, table):
+            conn.execute(statement)
+    return step
+
+
+MIGRATIONS: List[Tuple[int, str, List[Statement]]] = [
+    (
+        1,
+        "Secondary indexes for the request-path queries",
+        [
+            # fetch_assigned_beats / planned visits
+            "CREATE INDEX IF NOT EXISTS idx_beats_agent_day ON beats (Assigned_Agent, Beat_day)",
+            # fetch_beat_route_plan (incl. the max(Visit_Sequence) probe)
+            "CREATE INDEX IF NOT EXISTS idx_beat_route_plan_beat_seq ON beat_route_plan (Beat_ID, Visit_Sequence)",
+            # fetch_retailer_info: latest visit per retailer
+            "CREATE INDEX IF NOT EXISTS idx_visits_retailer_date ON visits (Retailer_ID, Date)",
+            # day summary: visits by rep for a date range
+            "CREATE INDEX IF NOT EXISTS idx_visits_agent_date ON visits (Agent_ID, Date)",
+            # day summary: sales joined back to the rep's visits
+            "CREATE INDEX IF NOT EXISTS idx_sales_visit ON sales (Visit_ID)",
+            # fetch_retailer_info: recommendations ordered by score. The table belongs to
+            # product_recommendation.ipynb / pipelines.recommendations (which index it
+            # themselves); `--reapply` adds the index once the notebook has written it
+            index_if_table(
+                "product_recommendations_ml",
+                "CREATE INDEX IF NOT EXISTS idx_recs_retailer_score ON product_recommendations_ml (Retailer_ID, Final_Score)",
+            ),
+        ],
+    ),
+    (
+        2,
+        "Per-rep daily rollups for the day summary, backfilled from visits and sales",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS agent_daily_metrics (
+                Agent_ID TEXT NOT NULL,
+                Date TEXT NOT NULL,
+                Actual_Visits INTEGER NOT NULL DEFAULT 0,
+                Orders INTEGER NOT NULL DEFAULT 0,
+                Revenue REAL NOT NULL DEFAULT 0.0,
+                PRIMARY KEY (Agent_ID, Date)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS agent_daily_product_qty (
+                Agent_ID TEXT NOT NULL,
+                Date TEXT NOT NULL,
+                Product_ID TEXT NOT NULL,
+                Quantity INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (Agent_ID, Date, Product_ID)
+            )
+            """,
+            "DELETE FROM agent_daily_metrics",
+            "DELETE FROM agent_daily_product_qty",
+            REBUILD_METRICS_SQL.format(where=""),
+            REBUILD_PRODUCT_QTY_SQL.format(where=""),
+        ],
+    ),
+    (
+        3,
+        "Feature aggregates for rescoring one retailer's recommendations per order (filled by pipelines.recommendations)",
+        FEATURE_TABLES,
+    ),
+    (
+        4,
+        "Change counters on retailers, so the in-memory spatial index knows when to refresh",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS table_versions (
+                Table_Name TEXT PRIMARY KEY,
+                Inserts INTEGER NOT NULL DEFAULT 0,
+                Changes INTEGER NOT NULL DEFAULT 0
+            )
+            """,
+            "INSERT OR IGNORE INTO table_versions (Table_Name) VALUES ('retailers')",
+            # Inserts alone can be appended to the index; anything else rebuilds it
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_retailers_insert AFTER INSERT ON retailers BEGIN
+                UPDATE table_versions SET Inserts = Inserts + 1, Changes = Changes + 1 WHERE Table_Name = 'retailers';
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_retailers_update AFTER UPDATE ON retailers BEGIN
+                UPDATE table_versions SET Changes = Changes + 1 WHERE Table_Name = 'retailers';
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_retailers_delete AFTER DELETE ON retailers BEGIN
+                UPDATE table_versions SET Changes = Changes + 1 WHERE Table_Name = 'retailers';
+            END
+            """,
+            # `--reapply` after a notebook replaced the table: force a rebuild
+            "UPDATE table_versions SET Changes = Changes + 1 WHERE Table_Name = 'retailers'",
+        ],
+    ),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()["user_version"]
+
+
+def apply_migrations(db_path: str = DB_PATH, reapply: bool = False) -> int:
+    """
+    Brings the database up to SCHEMA_VERSION.
+
+    Args:
+        db_path (str): Path to the SQLite database file.
+        reapply (bool): Re-run every migration, not only the pending ones.
+
+    Returns:
+        The schema version after migrating.
+    """
+    pool = get_pool(db_path)
+    with pool.connection() as conn:
+        current = get_schema_version(conn)
+    if current >= SCHEMA_VERSION and not reapply:
+        return current
+
+    with pool.transaction() as conn:
+        # Re-read inside the write lock in case another worker migrated first
+        current = 0 if reapply else get_schema_version(conn)
+        for version, _, statements in MIGRATIONS:
+            if version <= current:
+                continue
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.execute("ANALYZE")
+    return SCHEMA_VERSION
+
+
+# ---------- Query plan check ----------
+# "SCAN <table>" is a full pass over a table (or an index standing in for it);
+# "SEARCH" lines are index seeks. Subquery/CTE bookkeeping rows are ignored.
+# Plans are taken on an empty in-memory copy of the schema: with the
+# sqlite_stat1 rows ANALYZE wrote, SQLite rightly prefers a SCAN of a small
+# table, so the answer would depend on how much data the database holds. The
+# check is about whether a usable index exists, not about today's row counts.
+_FULL_SCAN = re.compile(r"^SCAN (?!CONSTANT ROW)(\S+)")
+
+
+def find_full_scans(conn: sqlite3.Connection, query: str, params: Sequence[Any] = ()) -> List[str]:
+    """Returns the EXPLAIN QUERY PLAN lines of `query` that scan a whole table."""
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+    return [row["detail"] for row in plan if _FULL_SCAN.match(row["detail"])]
+
+
+def request_path_queries() -> Dict[str, Tuple[str, Sequence[Any]]]:
+    """The SQL issued per chat turn, with placeholder parameters."""
+    from agents.get_assigned_beats_agent import ASSIGNED_BEATS_QUERY
+    from agents.get_beat_route_plan_agent import ROUTE_PLAN_QUERY
+    from agents.get_retailer_info_agent import (
+        RETAILER_QUERY, LATEST_VISIT_QUERY, VISIT_STOCK_QUERY, RECOMMENDATIONS_QUERY,
+    )
+    from agents.day_summary_agent import PLANNED_VISITS_QUERY
+    from utils.daily_metrics import DAILY_METRICS_QUERY, DAILY_TOP_PRODUCTS_QUERY, SEEN_RETAILER_QUERY
+    from utils.retailer_index import VERSION_QUERY as RETAILER_VERSION_QUERY
+
+    day = ("2025-01-01", "2025-01-02")
+    return {
+        "assigned_beats": (ASSIGNED_BEATS_QUERY, ("A001", "Monday")),
+        "route_plan": (ROUTE_PLAN_QUERY, ("B001", "B001")),
+        "retailer": (RETAILER_QUERY, ("R0001",)),
+        "latest_visit": (LATEST_VISIT_QUERY, ("R0001",)),
+        "visit_stock": (VISIT_STOCK_QUERY, ("V00001",)),
+        "recommendations": (RECOMMENDATIONS_QUERY, ("R0001",)),
+        "planned_visits": (PLANNED_VISITS_QUERY, ("A001", "Monday")),
+        "daily_metrics": (DAILY_METRICS_QUERY, ("A001", day[0])),
+        "daily_top_products": (DAILY_TOP_PRODUCTS_QUERY, ("A001", day[0])),
+        "seen_retailer": (SEEN_RETAILER_QUERY, ("A001", *day, "R0001", "V00001")),
+        "product_price": ("SELECT Price FROM products WHERE Product_ID = ?", ("P001",)),
+        "retailer_index_version": (RETAILER_VERSION_QUERY, ()),
+    }
+
+
+def schema_copy(conn: sqlite3.Connection) -> sqlite3.Connection:
+    """An in-memory database with `conn`'s tables, indexes and views, no rows and no statistics."""
+    copy = sqlite3.connect(":memory:")
+    copy.row_factory = sqlite3.Row
+    for row in conn.execute(
+        """
+        SELECT sql FROM sqlite_master
+        WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'
+        ORDER BY CASE type WHEN 'table' THEN 0 WHEN 'index' THEN 1 ELSE 2 END
+        """
+    ):
+        copy.execute(row["sql"])
+    return copy
+
+
+def assert_no_full_scans(db_path: str = DB_PATH) -> None:
+    """
+    Raises AssertionError if any request-path query plans a full table scan.
+
+    The same schema gives the same answer whatever the data size (see schema_copy).
+    """
+    offenders = {}
+    with get_pool(db_path).connection() as conn:
+        copy = schema_copy(conn)
+    try:
+        for name, (query, params) in request_path_queries().items():
+            scans = find_full_scans(copy, query, params)
+            if scans:
+                offenders[name] = scans
+    finally:
+        copy.close()
+
+    assert not offenders, f"Full table scans on the request path: {offenders}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply schema migrations to the co-pilot database.")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--reapply", action="store_true", help="re-run all migrations (restores dropped indexes)")
+    parser.add_argument("--check", action="store_true", help="fail if a request-path query does a full table scan")
+    args = parser.parse_args()
+
+    version = apply_migrations(args.db, reapply=args.reapply)
+    print(f"{args.db}: schema version {version}")
+    if args.check:
+        assert_no_full_scans(args.db)
+        print("Query plan check passed: no full table scans on the request path.")
@@ -0,0 +1,296 @@
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from utils.db import DB_PATH, get_pool
+
+
+logger = logging.getLogger(__name__)
+
+# Classifier + resolved rules saved by pipelines.recommendations; defaults to
+# <db>_recs_model.joblib next to the database
+RECS_MODEL_PATH = os.getenv("RECS_MODEL_PATH")
+
+# Feature aggregates behind product_recommendations_ml. The batch pipeline
+# rewrites them; every logged order bumps them, so one retailer can be
+# rescored without re-reading sales.
+FEATURE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS rec_city_popularity (
+        City TEXT NOT NULL,
+        Product_ID TEXT NOT NULL,
+        Purchase_Count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (City, Product_ID)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rec_channel_popularity (
+        Channel TEXT NOT NULL,
+        Product_ID TEXT NOT NULL,
+        Purchase_Count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (Channel, Product_ID)
+    )
+    """,
+    # Per day, so the recent-purchase window can slide without a rebuild
+    """
+    CREATE TABLE IF NOT EXISTS rec_recent_purchases (
+        Retailer_ID TEXT NOT NULL,
+        Product_ID TEXT NOT NULL,
+        Date TEXT NOT NULL,
+        Purchases INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (Retailer_ID, Product_ID, Date)
+    )
+    """,
+    # Classifier output per (City, Channel, Product); it only depends on those
+    """
+    CREATE TABLE IF NOT EXISTS rec_combo_scores (
+        City TEXT NOT NULL,
+        Channel TEXT NOT NULL,
+        Product_ID TEXT NOT NULL,
+        ML_Score REAL NOT NULL,
+        PRIMARY KEY (City, Channel, Product_ID)
+    )
+    """,
+]
+
+RETAILER_SEGMENT_QUERY = "SELECT City, Channel FROM retailers WHERE Retailer_ID = ?"
+# Sales lines written after a batch run read its snapshot (rowid range scan)
+SALES_SINCE_QUERY = """
+    SELECT s.Retailer_ID, s.Product_ID, substr(s.Date, 1, 10) AS Day, r.City, r.Channel
+    FROM sales s JOIN retailers r ON r.Retailer_ID = s.Retailer_ID
+    WHERE s.rowid > ?
+"""
+
+_CITY_UPSERT = """
+    INSERT INTO rec_city_popularity (City, Product_ID, Purchase_Count) VALUES (?, ?, 1)
+    ON CONFLICT (City, Product_ID) DO UPDATE SET Purchase_Count = Purchase_Count + 1
+"""
+_CHANNEL_UPSERT = """
+    INSERT INTO rec_channel_popularity (Channel, Product_ID, Purchase_Count) VALUES (?, ?, 1)
+    ON CONFLICT (Channel, Product_ID) DO UPDATE SET Purchase_Count = Purchase_Count + 1
+"""
+_RECENT_UPSERT = """
+    INSERT INTO rec_recent_purchases (Retailer_ID, Product_ID, Date, Purchases) VALUES (?, ?, ?, 1)
+    ON CONFLICT (Retailer_ID, Product_ID, Date) DO UPDATE SET Purchases = Purchases + 1
+"""
+_COMBO_SCORE_UPSERT = """
+    INSERT INTO rec_combo_scores (City, Channel, Product_ID, ML_Score) VALUES (?, ?, ?, ?)
+    ON CONFLICT (City, Channel, Product_ID) DO UPDATE SET ML_Score = excluded.ML_Score
+"""
+
+# Everything needed to score one retailer against every product, in product order
+RETAILER_FEATURES_QUERY = """
+    SELECT p.Product_ID,
+           s.ML_Score,
+           COALESCE(c.Purchase_Count, 0) AS City_Count,
+           COALESCE(ch.Purchase_Count, 0) AS Channel_Count,
+           COALESCE(r.Purchases, 0) AS Recent_Count
+    FROM products p
+    LEFT JOIN rec_combo_scores s
+        ON s.City = :city AND s.Channel = :channel AND s.Product_ID = p.Product_ID
+    LEFT JOIN rec_city_popularity c ON c.City = :city AND c.Product_ID = p.Product_ID
+    LEFT JOIN rec_channel_popularity ch ON ch.Channel = :channel AND ch.Product_ID = p.Product_ID
+    LEFT JOIN (
+        SELECT Product_ID, SUM(Purchases) AS Purchases
+        FROM rec_recent_purchases
+        WHERE Retailer_ID = :retailer AND Date >= :cutoff
+        GROUP BY Product_ID
+    ) r ON r.Product_ID = p.Product_ID
+    ORDER BY p.rowid
+"""
+
+
+def model_path(db_path: str = DB_PATH) -> str:
+    return RECS_MODEL_PATH or f"{os.path.splitext(db_path)[0]}_recs_model.joblib"
+
+
+# ---------- Counters ----------
+def record_purchase_features(conn: sqlite3.Connection, order: Dict[str, Any]) -> None:
+    """
+    Folds one newly written order's sales lines into the feature aggregates,
+    inside the caller's transaction.
+
+    Each sales row counts once, as in the batch features. Like
+    utils.daily_metrics.record_order, only call it for an order whose visit
+    row was just inserted.
+    """
+    products = order["products"]
+    if not products:
+        return
+    segment = conn.execute(RETAILER_SEGMENT_QUERY, (order["retailer_id"],)).fetchone()
+    if segment is None:
+        # Not in retailers: the batch features ignore its sales as well
+        return
+
+    product_ids = [p["Product_ID"] for p in products]
+    conn.executemany(_CITY_UPSERT, [(segment["City"], pid) for pid in product_ids])
+    conn.executemany(_CHANNEL_UPSERT, [(segment["Channel"], pid) for pid in product_ids])
+    conn.executemany(_RECENT_UPSERT, [(order["retailer_id"], pid, order["date"][:10]) for pid in product_ids])
+
+
+def replay_sales_since(conn: sqlite3.Connection, sales_rowid: int) -> Dict[str, List[str]]:
+    """
+    Folds the sales rows after `sales_rowid` into the feature aggregates, as
+    record_purchase_features did when their orders landed. The batch pipeline
+    calls it in its swap transaction, after rewriting the aggregates from a
+    snapshot that predates them.
+
+    Returns:
+        The products bought per retailer, for rescoring.
+    """
+    rows = conn.execute(SALES_SINCE_QUERY, (sales_rowid,)).fetchall()
+    conn.executemany(_CITY_UPSERT, [(r["City"], r["Product_ID"]) for r in rows])
+    conn.executemany(_CHANNEL_UPSERT, [(r["Channel"], r["Product_ID"]) for r in rows])
+    conn.executemany(_RECENT_UPSERT, [(r["Retailer_ID"], r["Product_ID"], r["Day"]) for r in rows])
+    bought: Dict[str, List[str]] = {}
+    for r in rows:
+        bought.setdefault(r["Retailer_ID"], []).append(r["Product_ID"])
+    return bought
+
+
+# ---------- Model ----------
+_models: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+_models_lock = threading.Lock()
+
+
+def save_model(db_path: str, model: Dict[str, Any]) -> str:
+    """Writes the model next to the database (write-then-rename, so readers never see half a file)."""
+    import joblib
+
+    path = model_path(db_path)
+    tmp_path = f"{path}.tmp"
+    joblib.dump(model, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_model(db_path: str = DB_PATH) -> Optional[Dict[str, Any]]:
+    """
+    The last model saved by the batch pipeline, or None if it has never run.
+
+    Loaded once per process and reloaded when the file changes.
+    """
+    path = model_path(db_path)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    with _models_lock:
+        cached = _models.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        import joblib
+
+        model = joblib.load(path)
+        _models[path] = (mtime, model)
+        return model
+
+
+# ---------- Rescoring ----------
+def _positive_proba(clf, X):
+    """
+    RandomForestClassifier.predict_proba(X)[:, positive], minus the per-tree
+    job dispatch that dominates when X is a few rows.
+    """
+    import numpy as np
+
+    classes = list(clf.classes_)
+    if 1.0 not in classes:
+        return np.zeros(len(X))
+    proba = np.zeros((len(X), len(classes)))
+    for tree in clf.estimators_:
+        proba += tree.predict_proba(X, check_input=False)
+    return proba[:, classes.index(1.0)] / len(clf.estimators_)
+
+
+
+def rescore_retailer(
+    db_path: str,
+    retailer_id: str,
+    changed_products: Iterable[str] = (),
+    now: Optional[datetime] = None,
+) -> Optional[int]:
+    """
+    Recomputes one retailer's rows in product_recommendations_ml from the
+    feature aggregates and the saved model.
+
+    Products in `changed_products` (and any the retailer's City/Channel combo
+    has no stored classifier score for) are re-run through the classifier;
+    every other product reuses its stored score. Other retailers in the same
+    city or channel keep their rows until the next batch run.
+
+    Returns:
+        The number of recommendations written, or None if there is no model
+        yet or the retailer's City/Channel was not seen in training.
+    """
+    model = load_model(db_path)
+    if model is None:
+        return None
+
+    import numpy as np
+    from pipelines import recommendations as recs
+
+    now = now or datetime.now()
+    cutoff = (now - timedelta(days=recs.RECENT_DAYS)).strftime("%Y-%m-%d")
+    changed = set(changed_products)
+
+    with get_pool(db_path).transaction() as conn:
+        segment = conn.execute(RETAILER_SEGMENT_QUERY, (retailer_id,)).fetchone()
+        if segment is None or segment["City"] not in model["cities"] or segment["Channel"] not in model["channels"]:
+            return None
+        city, channel = segment["City"], segment["Channel"]
+
+        conn.execute("DELETE FROM rec_recent_purchases WHERE Retailer_ID = ? AND Date < ?", (retailer_id, cutoff))
+        # One row per product: plain tuples, dicts cost more than the query here
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        rows = cursor.execute(RETAILER_FEATURES_QUERY, {
+            "city": city, "channel": channel, "retailer": retailer_id, "cutoff": cutoff,
+        }).fetchall()
+        if not rows:
+            return 0
+
+        product_ids, ml, city_count, channel_count, recent = zip(*rows)
+        ml = np.array(ml, dtype=np.float64)  # None (no stored score) becomes nan
+        city_count, channel_count, recent = (np.array(c, dtype=np.float64) for c in (city_count, channel_count, recent))
+
+        stale = np.isnan(ml) | np.array([pid in changed for pid in product_ids])
+        if stale.any():
+            n_stale = int(stale.sum())
+            ml[stale] = _positive_proba(model["classifier"], recs.ml_features(
+                np.full(n_stale, model["cities"].index(city)),
+                np.full(n_stale, model["channels"].index(channel)),
+                city_count[stale],
+                channel_count[stale],
+            ))
+            conn.executemany(_COMBO_SCORE_UPSERT, [
+                (city, channel, product_ids[i], float(ml[i])) for i in np.flatnonzero(stale)
+            ])
+
+        rule = recs.rule_score({recs.RECENT: recent, recs.CITY: city_count, recs.CHANNEL: channel_count}, model["rules"])
+        final = recs.ML_WEIGHT * ml + (1 - recs.ML_WEIGHT) * rule / model["rule_max"]
+        top_n = int(recs.top_n_size(np.array([np.count_nonzero(recent)]), len(rows))[0])
+        # Highest score first, ties in product order
+        best = np.lexsort((np.arange(len(rows)), -final))[:top_n]
+
+        timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
+        conn.execute(f"DELETE FROM {recs.RECS_TABLE} WHERE Retailer_ID = ?", (retailer_id,))
+        conn.executemany(
+            f"INSERT INTO {recs.RECS_TABLE} (Retailer_ID, Product_ID, Final_Score, Recommendation_Timestamp) "
+            "VALUES (?, ?, ?, ?)",
+            [(retailer_id, product_ids[i], float(final[i]), timestamp) for i in best],
+        )
+    return len(best)
+
+
+def rescore_after_order(db_path: str, order: Dict[str, Any]) -> None:
+    """Rescores the ordering retailer once its order is in; failures only leave its rows stale."""
+    try:
+        rescore_retailer(db_path, order["retailer_id"], [p["Product_ID"] for p in order["products"]])
+    except Exception as e:
+        logger.warning("Recommendation rescore failed for %s: %s", order["retailer_id"], e)
@@ -0,0 +1,322 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from utils.daily_metrics import record_order
+from utils.db import DB_PATH, get_pool
+from utils.online_recommendations import record_purchase_features, rescore_after_order
+from utils.retailer_cache import retailer_bundle_cache
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds between flush attempts while orders keep failing (doubles up to the max)
+OUTBOX_RETRY_S = float(os.getenv("ORDER_OUTBOX_RETRY_S", "1.0"))
+OUTBOX_MAX_RETRY_S = 60.0
+# Flushed orders are kept this long for auditing, then purged
+OUTBOX_RETENTION_S = float(os.getenv("ORDER_OUTBOX_RETENTION_S", str(7 * 24 * 3600)))
+OUTBOX_BATCH_SIZE = 100
+# A submit that finds the outbox busy is retried this many times (50 ms, doubling) before it fails
+OUTBOX_SUBMIT_RETRIES = 3
+# An order that has failed this many flushes is quarantined: kept, but no longer retried
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("ORDER_OUTBOX_MAX_ATTEMPTS", "10"))
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS order_outbox (
+        Seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        Visit_ID TEXT NOT NULL UNIQUE,
+        Payload TEXT NOT NULL,
+        Created_At REAL NOT NULL,
+        Attempts INTEGER NOT NULL DEFAULT 0,
+        Last_Error TEXT,
+        Flushed_At REAL
+    )
+"""
+PENDING_INDEX = "CREATE INDEX IF NOT EXISTS idx_order_outbox_pending ON order_outbox (Flushed_At, Seq)"
+
+VISIT_INSERT = """
+    INSERT OR IGNORE INTO visits (Visit_ID, Retailer_ID, Date, Products_Suggested, Feedback, Order_Placed, Agent_ID)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+VISIT_STOCK_INSERT = """
+    INSERT INTO visit_stock (Visit_ID, Product_ID, Retailer_ID, Available_Stock)
+    VALUES (?, ?, ?, ?)
+"""
+SALES_INSERT = """
+    INSERT INTO sales (Invoice_ID, Visit_ID, Retailer_ID, Product_ID, Quantity, Date, Total_Amount)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def write_order(conn: sqlite3.Connection, order: Dict[str, Any]) -> bool:
+    """
+    Writes one order (visit, visit_stock and sales rows, plus the daily
+    rollups and recommendation feature counters) inside the caller's transaction.
+
+    Visit_ID is the visits primary key, so replaying an order that already
+    landed inserts nothing.
+
+    Returns:
+        True if the order was written, False if the visit already existed.
+    """
+    visit_id, retailer_id, date = order["visit_id"], order["retailer_id"], order["date"]
+    products = order["products"]
+
+    inserted = conn.execute(VISIT_INSERT, (
+        visit_id,
+        retailer_id,
+        date,
+        ", ".join([p.get("Product_ID", "") for p in products]) if products else "N.A",
+        order.get("feedback") or "",
+        1 if products else 0,
+        order.get("agent_id"),
+    )).rowcount
+    if not inserted:
+        return False
+
+    if products:
+        conn.executemany(VISIT_STOCK_INSERT, [
+            (visit_id, p["Product_ID"], retailer_id, p["Available_Stock"]) for p in products
+        ])
+        conn.executemany(SALES_INSERT, [
+            (order["invoice_id"], visit_id, retailer_id, p["Product_ID"], p["Quantity"], date,
+             p["Quantity"] * p.get("Price", 0.0))
+            for p in products
+        ])
+    record_order(conn, order)
+    record_purchase_features(conn, order)
+    return True
+
+
+class OrderOutbox:
+    """
+    Durable, append-only queue of submitted orders in front of the sales database.
+
+    `submit` is one small insert into a local outbox file, so the rep never
+    waits on the main database's write lock. A background thread drains the
+    outbox into `db_path`, one transaction per order, and retries with backoff
+    until each order lands. An order that still fails after
+    OUTBOX_MAX_ATTEMPTS flushes (e.g. a payload the sales schema rejects) is
+    quarantined: it stays in the outbox with its last error, see
+    `quarantined` and `requeue`, but no longer holds the flusher busy.
+    Orders are keyed by Visit_ID end to end, so a double submit or a replay
+    after a crash writes the visit once.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, outbox_path: Optional[str] = None):
+        self.db_path = db_path
+        self.outbox_path = outbox_path or os.getenv("ORDER_OUTBOX_PATH") or (
+            f"{os.path.splitext(db_path)[0]}_outbox.db"
+        )
+        self._schema_ready = False
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        self._stopped = False
+
+    def _pool(self):
+        pool = get_pool(self.outbox_path)
+        if not self._schema_ready:
+            with pool.transaction() as conn:
+                conn.execute(SCHEMA)
+                conn.execute(PENDING_INDEX)
+            self._schema_ready = True
+        return pool
+
+    # ---------- Producer ----------
+    def submit(self, order: Dict[str, Any]) -> bool:
+        """
+        Appends an order to the outbox and wakes the flusher. A locked or
+        busy outbox is retried briefly; the insert is keyed by visit_id, so a
+        retry never queues the order twice.
+
+        Returns:
+            False if an order with this visit_id was already submitted.
+
+        Raises:
+            sqlite3.Error: The outbox could not be written.
+        """
+        payload, delay = json.dumps(order), 0.05
+        for attempt in range(OUTBOX_SUBMIT_RETRIES + 1):
+            try:
+                with self._pool().transaction() as conn:
+                    added = conn.execute(
+                        "INSERT OR IGNORE INTO order_outbox (Visit_ID, Payload, Created_At) VALUES (?, ?, ?)",
+                        (order["visit_id"], payload, time.time()),
+                    ).rowcount
+                break
+            except sqlite3.OperationalError as e:
+                if attempt == OUTBOX_SUBMIT_RETRIES:
+                    raise
+                logger.warning("Order outbox busy, retrying submit of %s: %s", order["visit_id"], e)
+                time.sleep(delay)
+                delay *= 2
+        self._ensure_flusher()
+        self._wakeup.set()
+        return bool(added)
+
+    def pending(self) -> int:
+        """Orders still to be flushed (quarantined ones not included)."""
+        with self._pool().connection() as conn:
+            return conn.execute(
+                "SELECT count(*) AS n FROM order_outbox WHERE Flushed_At IS NULL AND Attempts < ?",
+                (OUTBOX_MAX_ATTEMPTS,),
+            ).fetchone()["n"]
+
+    def quarantined(self) -> List[Dict[str, Any]]:
+        """Orders the flusher gave up on, oldest first, with their last error."""
+        with self._pool().connection() as conn:
+            return conn.execute(
+                """
+                SELECT Visit_ID, Attempts, Last_Error, Created_At FROM order_outbox
+                WHERE Flushed_At IS NULL AND Attempts >= ? ORDER BY Seq
+                """,
+                (OUTBOX_MAX_ATTEMPTS,),
+            ).fetchall()
+
+    def requeue(self, visit_id: str) -> bool:
+        """Puts a quarantined order back in the queue (e.g. once the cause is fixed)."""
+        with self._pool().transaction() as conn:
+            requeued = conn.execute(
+                "UPDATE order_outbox SET Attempts = 0 WHERE Visit_ID = ? AND Flushed_At IS NULL", (visit_id,)
+            ).rowcount
+        self._ensure_flusher()
+        self._wakeup.set()
+        return bool(requeued)
+
+    def status(self, visit_id: str) -> Optional[Dict[str, Any]]:
+        with self._pool().connection() as conn:
+            return conn.execute(
+                "SELECT Attempts, Last_Error, Flushed_At FROM order_outbox WHERE Visit_ID = ?", (visit_id,)
+            ).fetchone()
+
+    # ---------- Flusher ----------
+    def flush(self) -> int:
+        """
+        Makes one pass over the pending orders, writing each to the sales
+        database in its own transaction. An order that fails, for any reason,
+        stays pending for the next pass (or is quarantined after
+        OUTBOX_MAX_ATTEMPTS) without holding up the ones behind it. Safe to
+        call from any thread.
+
+        Returns:
+            The number of orders flushed.
+        """
+        flushed, last_seq = 0, 0
+        with self._flush_lock:
+            while True:
+                with self._pool().connection() as conn:
+                    batch = conn.execute(
+                        """
+                        SELECT Seq, Payload FROM order_outbox
+                        WHERE Flushed_At IS NULL AND Attempts < ? AND Seq > ? ORDER BY Seq LIMIT ?
+                        """,
+                        (OUTBOX_MAX_ATTEMPTS, last_seq, OUTBOX_BATCH_SIZE),
+                    ).fetchall()
+                if not batch:
+                    break
+
+                for row in batch:
+                    last_seq = row["Seq"]
+                    try:
+                        order = json.loads(row["Payload"])
+                        with get_pool(self.db_path).transaction() as conn:
+                            written = write_order(conn, order)
+                    except Exception as e:
+                        # A malformed payload as much as a locked database: the transaction
+                        # rolled back, so record it and move on to the next order
+                        self._mark_failed(row["Seq"], e)
+                        continue
+                    self._mark_flushed(row["Seq"])
+                    flushed += 1
+                    try:
+                        if written and order["products"]:
+                            rescore_after_order(self.db_path, order)
+                        # Last-visit stock changed for this store; drop it from every session's prefetch
+                        retailer_bundle_cache.invalidate(order["retailer_id"])
+                    except Exception:
+                        # The order has landed; stale caches are not a reason to replay it
+                        logger.exception("Order outbox post-flush refresh failed (Seq=%s)", row["Seq"])
+
+            self._purge_flushed()
+        return flushed
+
+    def _mark_flushed(self, seq: int) -> None:
+        with self._pool().transaction() as conn:
+            conn.execute("UPDATE order_outbox SET Flushed_At = ?, Last_Error = NULL WHERE Seq = ?", (time.time(), seq))
+
+    def _mark_failed(self, seq: int, error: Exception) -> None:
+        with self._pool().transaction() as conn:
+            attempts = conn.execute(
+                "UPDATE order_outbox SET Attempts = Attempts + 1, Last_Error = ? WHERE Seq = ? RETURNING Attempts",
+                (f"{type(error).__name__}: {error}", seq),
+            ).fetchone()["Attempts"]
+        if attempts >= OUTBOX_MAX_ATTEMPTS:
+            logger.error("Order outbox quarantined Seq=%s after %s failed flushes: %r", seq, attempts, error)
+        else:
+            logger.warning("Order outbox flush failed (Seq=%s, attempt %s): %r", seq, attempts, error)
+
+    def _purge_flushed(self) -> None:
+        with self._pool().transaction() as conn:
+            conn.execute(
+                "DELETE FROM order_outbox WHERE Flushed_At IS NOT NULL AND Flushed_At < ?",
+                (time.time() - OUTBOX_RETENTION_S,),
+            )
+
+    def _ensure_flusher(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped = False
+                self._thread = threading.Thread(target=self._run, name="order-outbox", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        # The first pass also drains orders left over from a previous process
+        delay = OUTBOX_RETRY_S
+        while not self._stopped:
+            # Cleared before flushing so a submit during the pass triggers another one
+            self._wakeup.clear()
+            try:
+                self.flush()
+                idle = self.pending() == 0
+            except Exception:
+                # Outbox file unreadable, disk full, ...: back off and retry rather than let the thread die
+                logger.exception("Order outbox unavailable")
+                idle = False
+            if idle:
+                delay = OUTBOX_RETRY_S
+                self._wakeup.wait()
+            else:
+                self._wakeup.wait(delay)
+                delay = min(delay * 2, OUTBOX_MAX_RETRY_S)
+
+    def start(self) -> None:
+        """Starts the flusher so orders left by a previous process are drained."""
+        self._ensure_flusher()
+        self._wakeup.set()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stopped = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+_outboxes: Dict[str, OrderOutbox] = {}
+_outboxes_lock = threading.Lock()
+
+
+def get_order_outbox(db_path: str = DB_PATH) -> OrderOutbox:
+    """Returns the process-wide outbox feeding `db_path`, creating it on first use."""
+    with _outboxes_lock:
+        outbox = _outboxes.get(db_path)
+        if outbox is None:
+            outbox = _outboxes[db_path] = OrderOutbox(db_path)
+        return outbox
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+# How many upcoming unvisited stops get a pitch generated ahead of time
+PITCH_LOOKAHEAD = int(os.getenv("PITCH_LOOKAHEAD", "3"))
+PITCH_WORKERS = int(os.getenv("PITCH_WORKERS", "2"))
+# Longest the pitch node waits on a running background job before calling the LLM itself
+PITCH_WAIT_S = float(os.getenv("PITCH_WAIT_S", "20"))
+MAX_SESSIONS = 256
+
+
+def next_unvisited_stops(
+    route: List[Dict[str, Any]], visited: Iterable[str], lookahead: int, order: Optional[Iterable[str]] = None,
+) -> List[str]:
+    """
+    Returns the Retailer_IDs of the next `lookahead` unvisited stops in
+    Visit_Sequence order, or in `order` (a re-planned route) for the stops it lists.
+    """
+    visited = {str(v) for v in visited or []}
+    stops = sorted(
+        (r for r in route if isinstance(r, dict) and "Retailer_ID" in r),
+        key=lambda r: int(r.get("Visit_Sequence", 0)),
+    )
+    ids = [str(r["Retailer_ID"]) for r in stops]
+    on_route = set(ids)
+    ids = [str(rid) for rid in order or [] if str(rid) in on_route] + ids
+    upcoming = [rid for rid in dict.fromkeys(ids) if rid not in visited]
+    return upcoming[:max(lookahead, 0)]
+
+
+def bundle_version(bundle: Optional[Dict[str, Any]]) -> str:
+    """Content version of a retailer bundle; a pitch is only reused for the bundle it was written from."""
+    blob = json.dumps(bundle, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:16]
+
+
+class _SessionJobs:
+    def __init__(self, route_key: Tuple[str, ...]):
+        self.route_key = route_key
+        # Retailer_ID -> (bundle version, pitch job)
+        self.jobs: Dict[str, Tuple[str, Future]] = {}
+
+
+class PitchPregenerator:
+    """
+    Background worker pool that generates pitches for the next stops on a route.
+
+    `generate` turns a retailer bundle (Retailer_Info, Last_Visit_Stock,
+    Product_Recommendations) into pitch text; pass a function backed by a stub
+    chat model to exercise this without network calls.
+
+    Jobs are keyed by the version of the bundle they were written from. When
+    an order refreshes a store's stock or rescores its recommendations, its
+    bundle (and so its version) changes, and the old pitch is not served.
+    """
+
+    def __init__(
+        self,
+        generate: Callable[[Dict[str, Any]], str],
+        lookahead: int = PITCH_LOOKAHEAD,
+        max_workers: int = PITCH_WORKERS,
+    ):
+        self.generate = generate
+        self.lookahead = lookahead
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pitch-pregen")
+        self._sessions: "OrderedDict[str, _SessionJobs]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def schedule(
+        self,
+        session_id: str,
+        route: List[Dict[str, Any]],
+        visited: Iterable[str],
+        load_bundle: Callable[[str], Optional[Dict[str, Any]]],
+        order: Optional[Iterable[str]] = None,
+    ) -> List[str]:
+        """
+        Queues pitch generation for the next unvisited stops of `route`
+        (following `order` after a replan, see next_unvisited_stops).
+
+        A route that differs from the one last scheduled for the session cancels
+        all of that session's outstanding jobs first.
+
+        Returns:
+            The Retailer_IDs newly submitted to the pool.
+        """
+        route_key = tuple(str(r.get("Retailer_ID")) for r in route if isinstance(r, dict))
+        upcoming = next_unvisited_stops(route, visited, self.lookahead, order)
+
+        submitted = []
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session.route_key != route_key:
+                if session is not None:
+                    self._cancel_jobs(session)
+                session = self._sessions[session_id] = _SessionJobs(route_key)
+                while len(self._sessions) > MAX_SESSIONS:
+                    self._cancel_jobs(self._sessions.popitem(last=False)[1])
+            self._sessions.move_to_end(session_id)
+
+            for retailer_id in upcoming:
+                bundle = load_bundle(retailer_id)
+                if not bundle or "Retailer_Info" not in bundle:
+                    continue
+                version = bundle_version(bundle)
+                entry = session.jobs.get(retailer_id)
+                if entry is not None:
+                    if entry[0] == version and not self._failed(entry[1]):
+                        continue
+                    entry[1].cancel()
+                session.jobs[retailer_id] = (version, self._executor.submit(self.generate, bundle))
+                submitted.append(retailer_id)
+
+        return submitted
+
+    def get_ready(
+        self, session_id: str, retailer_id: str, bundle: Optional[Dict[str, Any]], timeout: float = PITCH_WAIT_S,
+    ) -> Optional[str]:
+        """
+        Returns the pre-generated pitch for a store, or None if there is none to use.
+
+        Only a pitch written from `bundle` (the store's current one) counts; an
+        older one is dropped. A job that is already running is waited on (up
+        to `timeout`), since it will finish sooner than a fresh call. A job
+        still queued, or one that outlives the wait, is dropped so the caller's
+        live call replaces it.
+        """
+        retailer_id = str(retailer_id)
+        with self._lock:
+            session = self._sessions.get(session_id)
+            entry = session.jobs.get(retailer_id) if session else None
+        if entry is None:
+            return None
+        version, job = entry
+
+        if version != bundle_version(bundle) or (not job.done() and job.cancel()):
+            self._drop(session, retailer_id, entry)
+            return None
+        try:
+            return job.result(timeout=timeout)
+        except (CancelledError, Exception):
+            # Timed out, cancelled by a route change or the LLM call failed
+            self._drop(session, retailer_id, entry)
+            return None
+
+    def set_ready(self, session_id: str, retailer_id: str, bundle: Optional[Dict[str, Any]], pitch: str) -> None:
+        """Records a pitch a live call wrote from `bundle` so the pool does not generate it again."""
+        done: Future = Future()
+        done.set_result(pitch)
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.jobs[str(retailer_id)] = (bundle_version(bundle), done)
+
+    def _drop(self, session: _SessionJobs, retailer_id: str, entry: Tuple[str, Future]) -> None:
+        entry[1].cancel()
+        with self._lock:
+            if session.jobs.get(retailer_id) is entry:
+                del session.jobs[retailer_id]
+
+    def cancel(self, session_id: str) -> None:
+        """Cancels outstanding jobs and forgets ready pitches for a session."""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                self._cancel_jobs(session)
+
+    @staticmethod
+    def _failed(job: Future) -> bool:
+        return job.done() and (job.cancelled() or job.exception() is not None)
+
+    @staticmethod
+    def _cancel_jobs(session: _SessionJobs) -> None:
+        for _, job in session.jobs.values():
+            job.cancel()
+        session.jobs.clear()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            for session in self._sessions.values():
+                self._cancel_jobs(session)
+            self._sessions.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
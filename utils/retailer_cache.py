@@ -0,0 +1,77 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+
+DEFAULT_SESSION = "default"
+MAX_SESSIONS = 256
+
+
+def session_id_from_config(config: Optional[Dict[str, Any]]) -> str:
+    """Reads the LangGraph thread_id, which identifies one rep's chat session."""
+    configurable = (config or {}).get("configurable") or {}
+    return str(configurable.get("thread_id") or DEFAULT_SESSION)
+
+
+class RetailerBundleCache:
+    """
+    Per-session cache of retailer bundles, i.e. the dict loaded by
+    fetch_retailer_info: Retailer_Info, Last_Visit_Stock and Product_Recommendations.
+    The graph state only names the retailer; utils.state_store.retailer_bundle reads it back.
+
+    Sessions are kept in LRU order and capped at `max_sessions` so idle reps
+    do not pin memory for the lifetime of the process.
+    """
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, Dict[str, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _session(self, session_id: str) -> Dict[str, Dict[str, Any]]:
+        bundles = self._sessions.get(session_id)
+        if bundles is None:
+            bundles = self._sessions[session_id] = {}
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(session_id)
+        return bundles
+
+    def get(self, session_id: str, retailer_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            bundle = self._session(session_id).get(str(retailer_id))
+        # Shallow copy so graph state updates never write back into the cache
+        return dict(bundle) if bundle is not None else None
+
+    def put(self, session_id: str, retailer_id: str, bundle: Dict[str, Any]) -> None:
+        with self._lock:
+            self._session(session_id)[str(retailer_id)] = bundle
+
+    def put_many(self, session_id: str, bundles: Dict[str, Dict[str, Any]]) -> None:
+        with self._lock:
+            self._session(session_id).update({str(k): v for k, v in bundles.items()})
+
+    def missing(self, session_id: str, retailer_ids: Iterable[str]) -> List[str]:
+        with self._lock:
+            cached = self._session(session_id)
+            return [str(rid) for rid in retailer_ids if str(rid) not in cached]
+
+    def invalidate(self, retailer_id: str, session_id: Optional[str] = None) -> None:
+        """Drops a retailer's bundle from one session, or from every session when none is given."""
+        with self._lock:
+            sessions = [self._sessions.get(session_id, {})] if session_id else self._sessions.values()
+            for bundles in sessions:
+                bundles.pop(str(retailer_id), None)
+
+    def drop_session(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sessions.clear()
+
+
+# Process-wide instance shared by the retailer info and order logging agents
+retailer_bundle_cache = RetailerBundleCache()
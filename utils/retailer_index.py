@@ -0,0 +1,211 @@
+import copy
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from utils.db import DB_PATH, get_pool
+
+
+# In-memory spatial index over `retailers` for "visit nearest", "stores within
+# 500 m" and off-route drop-ins. Retailers are points on the unit sphere in a
+# KD-tree: the straight-line distance between two such points grows with
+# their great-circle distance, so nearest and radius queries return exactly
+# what haversine would, with no flat-map approximation.
+#
+# Freshness comes from the change counters migration 4 keeps on `retailers`
+# (one primary-key read per lookup). Retailers appended since the tree was
+# built sit in a short side list that is searched by brute force, so new
+# stores show up at once without a rebuild until REBUILD_PENDING of them pile
+# up; any update or delete rebuilds the index.
+REBUILD_PENDING = 256
+
+VERSION_QUERY = "SELECT Inserts, Changes FROM table_versions WHERE Table_Name = 'retailers'"
+# Fallback for databases migration 4 has not reached: any change rebuilds
+SIGNATURE_QUERY = "SELECT count(*) AS Inserts, max(rowid) AS Changes FROM retailers"
+RETAILERS_QUERY = """
+    SELECT rowid AS Row_ID, Retailer_ID, Name, City, Channel, Latitude, Longitude
+    FROM retailers
+    WHERE rowid > ? AND Latitude IS NOT NULL AND Longitude IS NOT NULL
+    ORDER BY rowid
+"""
+
+
+def _unit_xyz(lat, lon) -> np.ndarray:
+    lat, lon = np.radians(np.asarray(lat, dtype=np.float64)), np.radians(np.asarray(lon, dtype=np.float64))
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def _chord_to_km(chord: np.ndarray) -> np.ndarray:
+    from pipelines.beats import EARTH_RADIUS_KM
+
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord) / 2, 0.0, 1.0))
+
+
+def _km_to_chord(km: float) -> float:
+    from pipelines.beats import EARTH_RADIUS_KM
+
+    return 2 * np.sin(min(km / EARTH_RADIUS_KM, np.pi) / 2)
+
+
+class RetailerIndex:
+    """
+    KD-tree over retailers' coordinates, plus the retailers appended since it was built.
+
+    Lookups return (retailer, km) pairs, nearest first, where retailer is the
+    row from `retailers` (Retailer_ID, Name, City, Channel, Latitude, Longitude).
+    """
+
+    def __init__(self, rows: List[Dict[str, Any]], version: Tuple[Any, Any]):
+        from scipy.spatial import cKDTree
+
+        self.version = version
+        self.retailers = [{k: v for k, v in r.items() if k != "Row_ID"} for r in rows]
+        self.by_id = {str(r["Retailer_ID"]): i for i, r in enumerate(self.retailers)}
+        self.max_row_id = max((r["Row_ID"] for r in rows), default=0)
+        self.indexed = len(rows)
+        points = _unit_xyz([r["Latitude"] for r in rows], [r["Longitude"] for r in rows]).reshape(-1, 3)
+        self.tree = cKDTree(points)
+        # Appended after the build; searched by brute force
+        self.pending = np.zeros((0, 3))
+
+    def appended(self, rows: List[Dict[str, Any]], version: Tuple[Any, Any]) -> "RetailerIndex":
+        """A copy that also holds `rows`; the tree is shared, readers of this one are unaffected."""
+        index = copy.copy(self)
+        index.retailers = self.retailers + [{k: v for k, v in r.items() if k != "Row_ID"} for r in rows]
+        index.by_id = {**self.by_id, **{str(r["Retailer_ID"]): len(self.retailers) + i for i, r in enumerate(rows)}}
+        points = _unit_xyz([r["Latitude"] for r in rows], [r["Longitude"] for r in rows]).reshape(-1, 3)
+        index.pending = np.vstack([self.pending, points])
+        index.max_row_id = max([self.max_row_id] + [r["Row_ID"] for r in rows])
+        index.version = version
+        return index
+
+    def __len__(self) -> int:
+        return len(self.retailers)
+
+    def get(self, retailer_id: str) -> Optional[Dict[str, Any]]:
+        i = self.by_id.get(str(retailer_id))
+        return dict(self.retailers[i]) if i is not None else None
+
+    # ---------- Queries ----------
+    def nearest(
+        self,
+        lat: float,
+        lon: float,
+        k: int = 1,
+        exclude: Optional[Iterable[str]] = None,
+        among: Optional[Iterable[str]] = None,
+    ) -> List[Tuple[Dict[str, Any], float]]:
+        """
+        The k retailers closest to (lat, lon).
+
+        Args:
+            exclude: Retailer_IDs to skip (e.g. already visited).
+            among: Only consider these Retailer_IDs (e.g. today's route).
+        """
+        excluded = {str(e) for e in exclude or []}
+        if among is not None:
+            idx = np.array([self.by_id[str(a)] for a in among if str(a) in self.by_id and str(a) not in excluded], dtype=np.int64)
+            return self._ranked(lat, lon, idx, k)
+
+        # Ask the tree for enough extra neighbours to cover the excluded ones
+        want = min(k + len(excluded), self.indexed)
+        found: np.ndarray = np.zeros(0, dtype=np.int64)
+        if want:
+            _, found = self.tree.query(_unit_xyz(lat, lon), k=want)
+            found = np.atleast_1d(found)
+        idx = np.concatenate([found, np.arange(self.indexed, len(self.retailers))])
+        idx = np.array([i for i in idx if str(self.retailers[i]["Retailer_ID"]) not in excluded], dtype=np.int64)
+        return self._ranked(lat, lon, idx, k)
+
+    def within(
+        self,
+        lat: float,
+        lon: float,
+        radius_km: float,
+        exclude: Optional[Iterable[str]] = None,
+    ) -> List[Tuple[Dict[str, Any], float]]:
+        """Retailers no more than radius_km from (lat, lon), nearest first."""
+        excluded = {str(e) for e in exclude or []}
+        point = _unit_xyz(lat, lon)
+        chord = _km_to_chord(radius_km)
+        found = np.array(self.tree.query_ball_point(point, chord), dtype=np.int64)
+        extra = np.flatnonzero(np.linalg.norm(self.pending - point, axis=1) <= chord) + self.indexed
+        idx = np.array(
+            [i for i in np.concatenate([found, extra]) if str(self.retailers[i]["Retailer_ID"]) not in excluded],
+            dtype=np.int64,
+        )
+        return self._ranked(lat, lon, idx, len(idx))
+
+    def _point(self, i: int) -> np.ndarray:
+        return self.tree.data[i] if i < self.indexed else self.pending[i - self.indexed]
+
+    def _ranked(self, lat: float, lon: float, idx: np.ndarray, k: int) -> List[Tuple[Dict[str, Any], float]]:
+        if not len(idx) or k <= 0:
+            return []
+        points = np.array([self._point(i) for i in idx]).reshape(-1, 3)
+        km = _chord_to_km(np.linalg.norm(points - _unit_xyz(lat, lon), axis=1))
+        order = np.argsort(km, kind="stable")[:k]
+        return [(dict(self.retailers[idx[o]]), float(km[o])) for o in order]
+
+
+# ---------- Process-wide index per database ----------
+_indexes: Dict[str, RetailerIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def _read_version(conn) -> Tuple[Any, Any]:
+    try:
+        row = conn.execute(VERSION_QUERY).fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    if row is None:
+        row = conn.execute(SIGNATURE_QUERY).fetchone()
+        # Tagged so it never compares equal to, or diffs against, real counters
+        return ("signature", (row["Inserts"], row["Changes"]))
+    return (row["Inserts"], row["Changes"])
+
+
+def _only_appended(old: Tuple[Any, Any], new: Tuple[Any, Any]) -> bool:
+    """Whether every change between the two counter readings was an insert."""
+    if old[0] == "signature" or new[0] == "signature":
+        return False
+    return new[0] - old[0] == new[1] - old[1] >= 0
+
+
+def get_retailer_index(db_path: str = DB_PATH) -> RetailerIndex:
+    """
+    Returns the spatial index for `db_path`, built on first use and brought
+    up to date with `retailers` before it is handed out.
+    """
+    with get_pool(db_path).connection() as conn:
+        version = _read_version(conn)
+    index = _indexes.get(db_path)
+    if index is not None and index.version == version:
+        return index
+
+    with _indexes_lock:
+        index = _indexes.get(db_path)
+        if index is not None and index.version == version:
+            return index
+        with get_pool(db_path).connection() as conn:
+            # One snapshot for the counters and the rows they describe
+            conn.execute("BEGIN")
+            version = _read_version(conn)
+            if index is not None and _only_appended(index.version, version):
+                rows = conn.execute(RETAILERS_QUERY, (index.max_row_id,)).fetchall()
+                # INSERT OR REPLACE re-adds an existing Retailer_ID under a new rowid
+                if len(index) - index.indexed + len(rows) <= REBUILD_PENDING and not any(
+                    str(r["Retailer_ID"]) in index.by_id for r in rows
+                ):
+                    index = _indexes[db_path] = index.appended(rows, version)
+                    return index
+            rows = conn.execute(RETAILERS_QUERY, (0,)).fetchall()
+        index = _indexes[db_path] = RetailerIndex(rows, version)
+        return index
+
+
+def drop_retailer_index(db_path: str = DB_PATH) -> None:
+    with _indexes_lock:
+        _indexes.pop(db_path, None)
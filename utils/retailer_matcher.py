@@ -0,0 +1,260 @@
+import re
+import threading
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+# Below this confidence select_retailer_node falls back to the LLM
+CONFIDENCE_THRESHOLD = 0.6
+# Best name match must beat the runner-up by this much to count as unambiguous
+MIN_MARGIN = 0.12
+MAX_CACHED_ROUTES = 512
+
+ORDINALS = {
+    "first": 1, "second": 2, "third": 3, "fourth": 4, "fifth": 5, "sixth": 6, "seventh": 7,
+    "eighth": 8, "ninth": 9, "tenth": 10, "eleventh": 11, "twelfth": 12, "thirteenth": 13,
+    "fourteenth": 14, "fifteenth": 15, "sixteenth": 16, "seventeenth": 17, "eighteenth": 18,
+    "nineteenth": 19, "twentieth": 20,
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+    "nine": 9, "ten": 10,
+}
+NEXT_WORDS = {"next", "upcoming", "following"}
+LAST_WORDS = {"last", "final"}
+# Words that can point at a stop by position but also appear in store names ("Next Door Mart")
+POSITIONAL_WORDS = NEXT_WORDS | LAST_WORDS | set(ORDINALS)
+
+# Words reps wrap around a store reference; they carry no identity
+STOPWORDS = {
+    "visit", "visiting", "go", "goto", "going", "to", "the", "a", "an", "store", "shop", "outlet",
+    "retailer", "stop", "open", "please", "pls", "lets", "let", "s", "us", "i", "am", "at", "now",
+    "take", "me", "number", "no", "one", "on", "route", "in", "of", "id", "want", "will", "head",
+    "move", "start", "with", "show", "call", "and",
+}
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_SEQ_PATTERNS = [
+    re.compile(r"\b(?:visit|stop|store|shop|outlet|number|no)\.?\s*(?:number|no\.?)?\s*#?\s*(\d{1,3})\b"),
+    re.compile(r"#\s*(\d{1,3})\b"),
+    re.compile(r"^\s*(\d{1,3})\s*$"),
+    re.compile(r"\b(\d{1,3})(?:st|nd|rd|th)\b"),
+]
+_LLM_ID = re.compile(r"\(\s*ID\s*:\s*([A-Za-z0-9_-]+)\s*\)", re.I)
+_LLM_SEQ = re.compile(r"^\s*(\d{1,3})\s*[.)]")
+
+
+@dataclass
+class RetailerMatch:
+    store: Optional[Dict[str, Any]]
+    confidence: float
+    method: str
+
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+def _query(tokens: List[str]) -> List[str]:
+    """The tokens of a message that can be part of a store name."""
+    return [t for t in tokens if t not in STOPWORDS and not t.isdigit()]
+
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _within_edits(a: str, b: str, limit: int) -> Optional[int]:
+    """Levenshtein distance between a and b if it is <= limit, else None."""
+    if abs(len(a) - len(b)) > limit:
+        return None
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return None
+        previous = current
+    return previous[-1] if previous[-1] <= limit else None
+
+
+@lru_cache(maxsize=65536)
+def _token_similarity(query: str, name_token: str) -> float:
+    if query == name_token:
+        return 1.0
+    if len(query) >= 3 and name_token.startswith(query):
+        return 0.9
+    if len(query) >= 4:
+        distance = _within_edits(query, name_token, 2 if len(query) >= 7 else 1)
+        if distance == 1:
+            return 0.8
+        if distance == 2:
+            return 0.6
+    return 0.0
+
+
+class RouteMatcher:
+    """
+    Matching index for one route, built once and reused for every selection.
+
+    Resolves, in order: Retailer_IDs ("R0012", "r12"), store names with typo
+    tolerance (token prefix / edit distance plus character trigram overlap)
+    when the message names a store confidently, explicit sequence numbers
+    ("visit 3", "#3", "3rd"), then ordinal words ("third", "next", "last").
+    So "visit Next Door Mart" or "visit Three Brothers Store" open the store
+    of that name, while "visit next" or "visit third" go by position. A
+    message made only of positional words never counts as a name.
+    """
+
+    def __init__(self, route: List[Dict[str, Any]]):
+        self.stops = sorted(
+            (r for r in route if isinstance(r, dict) and "Retailer_ID" in r),
+            key=lambda r: int(r.get("Visit_Sequence", 0)),
+        )
+        self.by_seq = {int(r.get("Visit_Sequence", 0)): r for r in self.stops}
+        self.by_id = {str(r["Retailer_ID"]).upper(): r for r in self.stops}
+        # "R0012" is also reachable as "r12" (same prefix, leading zeros dropped)
+        self.by_id_number = {}
+        for rid, stop in self.by_id.items():
+            prefix, digits = re.match(r"([A-Z]*)(\d*)", rid).groups()
+            if digits:
+                self.by_id_number[(prefix, int(digits))] = stop
+
+        self.name_tokens: List[List[str]] = []
+        self.trigram_index: Dict[str, set] = defaultdict(set)
+        self.name_trigrams: List[set] = []
+        for i, stop in enumerate(self.stops):
+            tokens = _tokens(str(stop.get("Name", "")))
+            self.name_tokens.append(tokens)
+            grams = _trigrams(" ".join(tokens))
+            self.name_trigrams.append(grams)
+            for gram in grams:
+                self.trigram_index[gram].add(i)
+
+    # ---------- Public API ----------
+    def match(
+        self, message: str, visited: Optional[Iterable[str]] = None, order: Optional[Iterable[str]] = None,
+    ) -> RetailerMatch:
+        """
+        Args:
+            visited: Retailer_IDs already visited; "next" skips them.
+            order: Retailer_IDs in the order "next" should follow (a re-planned
+                route); stops it leaves out come after, by Visit_Sequence.
+        """
+        text = (message or "").lower()
+        tokens = _tokens(text)
+
+        found = self._by_id(text, tokens, visited, order)
+        if found is not None:
+            return found
+        by_name = self._by_name(tokens)
+        named = [t for t in tokens if t not in POSITIONAL_WORDS]
+        if _query(named):
+            # "last sharma store": the name may also match without the positional words
+            if by_name.confidence < CONFIDENCE_THRESHOLD and len(named) < len(tokens):
+                by_name = max(by_name, self._by_name(named), key=lambda m: m.confidence)
+            if by_name.confidence >= CONFIDENCE_THRESHOLD:
+                return by_name
+        for resolver in (self._by_sequence, self._by_ordinal):
+            found = resolver(text, tokens, visited, order)
+            if found is not None:
+                return found
+        return by_name
+
+    def match_llm_output(self, output: str) -> RetailerMatch:
+        """Maps the LLM's pick (normally a "N. Name (ID: X)" line) back to a stop."""
+        id_match = _LLM_ID.search(output or "")
+        if id_match and id_match.group(1).upper() in self.by_id:
+            return RetailerMatch(self.by_id[id_match.group(1).upper()], 1.0, "llm_id")
+        seq_match = _LLM_SEQ.match(output or "")
+        if seq_match and int(seq_match.group(1)) in self.by_seq:
+            return RetailerMatch(self.by_seq[int(seq_match.group(1))], 0.9, "llm_sequence")
+        found = self.match(output)
+        return RetailerMatch(found.store, found.confidence, f"llm_{found.method}")
+
+    # ---------- Resolvers ----------
+    def _by_sequence(self, text, tokens, visited, order) -> Optional[RetailerMatch]:
+        for pattern in _SEQ_PATTERNS:
+            m = pattern.search(text)
+            if m and int(m.group(1)) in self.by_seq:
+                return RetailerMatch(self.by_seq[int(m.group(1))], 1.0, "sequence")
+        return None
+
+    def _by_ordinal(self, text, tokens, visited, order) -> Optional[RetailerMatch]:
+        words = set(tokens)
+        if words & NEXT_WORDS:
+            done = {str(v).upper() for v in visited or []}
+            preferred = [self.by_id[rid] for rid in (str(r).upper() for r in order or []) if rid in self.by_id]
+            upcoming = next((s for s in preferred + self.stops if str(s["Retailer_ID"]).upper() not in done), None)
+            return RetailerMatch(upcoming, 1.0 if upcoming else 0.0, "next")
+        if words & LAST_WORDS and self.stops:
+            return RetailerMatch(self.stops[-1], 1.0, "last")
+        for token in tokens:
+            seq = ORDINALS.get(token)
+            # Bare "one" is too common in phrasing to mean "stop 1" on its own
+            if seq is not None and token != "one" and seq in self.by_seq:
+                return RetailerMatch(self.by_seq[seq], 0.95, "ordinal")
+        return None
+
+    def _by_id(self, text, tokens, visited, order) -> Optional[RetailerMatch]:
+        for token in tokens:
+            upper = token.upper()
+            if upper in self.by_id:
+                return RetailerMatch(self.by_id[upper], 1.0, "retailer_id")
+            m = re.fullmatch(r"([A-Z]+)(\d+)", upper)
+            if m and (m.group(1), int(m.group(2))) in self.by_id_number:
+                return RetailerMatch(self.by_id_number[(m.group(1), int(m.group(2)))], 0.95, "retailer_id")
+        return None
+
+    def _by_name(self, tokens: List[str]) -> RetailerMatch:
+        query = _query(tokens)
+        if not query or not self.stops:
+            return RetailerMatch(None, 0.0, "none")
+
+        query_grams = _trigrams(" ".join(query))
+        candidates = set()
+        for gram in query_grams:
+            candidates |= self.trigram_index.get(gram, set())
+        if not candidates:
+            return RetailerMatch(None, 0.0, "none")
+
+        scored: List[Tuple[float, int]] = []
+        for i in candidates:
+            name_tokens = self.name_tokens[i]
+            token_score = sum(
+                max((_token_similarity(q, n) for n in name_tokens), default=0.0) for q in query
+            ) / len(query)
+            grams = self.name_trigrams[i]
+            dice = 2 * len(query_grams & grams) / (len(query_grams) + len(grams))
+            scored.append((0.7 * token_score + 0.3 * dice, i))
+
+        scored.sort(reverse=True)
+        best, index = scored[0]
+        runner_up = scored[1][0] if len(scored) > 1 else 0.0
+        confidence = best if best - runner_up >= MIN_MARGIN else best / 2
+        return RetailerMatch(self.stops[index], round(confidence, 4), "name")
+
+
+_matchers: "OrderedDict[Tuple, RouteMatcher]" = OrderedDict()
+_matchers_lock = threading.Lock()
+
+
+def get_route_matcher(route: List[Dict[str, Any]]) -> RouteMatcher:
+    """Returns the cached matcher for this route, building it on first use."""
+    key = tuple(
+        (str(r.get("Retailer_ID")), r.get("Visit_Sequence"), r.get("Name"))
+        for r in route if isinstance(r, dict)
+    )
+    with _matchers_lock:
+        matcher = _matchers.get(key)
+        if matcher is not None:
+            _matchers.move_to_end(key)
+            return matcher
+    matcher = RouteMatcher(route)
+    with _matchers_lock:
+        _matchers[key] = matcher
+        while len(_matchers) > MAX_CACHED_ROUTES:
+            _matchers.popitem(last=False)
+    return matcher
@@ -1,24 +1,33 @@
 from typing import  List, Dict, Any
 from typing_extensions import TypedDict
 from pydantic import BaseModel
+from utils.intent import UserCommand
 
 
 class SalesRepState(TypedDict, total=False):
     sales_rep_id: str
     Weekday: str
     Beat_ID: str
-    Beat_Route_Plan: List[dict]
+    # Today's stops live in utils.state_store; read them with beat_route(state)
+    Route_Version: str
+    # rep|weekday|date the beat and route were loaded for; the graph skips reloading them while it matches
+    Route_Key: str
+    # Unvisited stops re-sequenced by "replan": {Beat_ID, order, start, origin, km, previous_km}
+    Route_Replan: dict
     Retailer_ID: str
     visit_id: str
-    Product_Recommendations: List[dict]
-    Last_Visit_Stock: List[dict]
+    # Retailer row of the open store; its stock and recommendations: retailer_bundle(Retailer_ID, config)
     Retailer_Info: dict
     Pitch: str
     Store_Info: dict
     user_message: str
+    # user_message classified once (utils.intent.parse_command); routers branch on Command["intent"]
+    Command: UserCommand
     order_products : List[dict]
     feedback: str
     order_log : str
+    # Why the last submitted order was not queued; None once it was
+    order_error: str
     visited_retailers: List[str]
     Day_Summary: str
     next_node: str
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.db import DB_PATH
+from utils.retailer_cache import retailer_bundle_cache, session_id_from_config
+
+
+# Large payloads a turn needs but the graph state does not carry. State holds
+# references - Beat_ID + Route_Version for today's route, Retailer_ID for the
+# open store - and the accessors below resolve them, from memory when this
+# process has them, else from the sales DB (after a restart, or on another
+# worker). The checkpointer then snapshots ids and short text only, so
+# checkpoints and per-turn copies stay the same size whatever the length of
+# the route or the recommendation list.
+#
+# A route is stored under a hash of its rows, so a stored version never
+# changes and is shared by every session on the beat. When a reload finds
+# different rows in beat_route_plan the old version resolves to [], and
+# needs_route() fetches the new one like any stale route. Retailer bundles
+# (Retailer_Info, Last_Visit_Stock, Product_Recommendations) are the
+# per-session ones in utils.retailer_cache, dropped when an order rescores
+# the store, so a bundle read after that is re-fetched rather than stale.
+MAX_ROUTES = 1024
+
+
+def route_version(route: List[Dict[str, Any]]) -> str:
+    """Content version of a route: changes when a stop, its order or its details change."""
+    blob = json.dumps(route, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:16]
+
+
+class RouteStore:
+    """Beat routes by (Beat_ID, Route_Version), least recently used dropped past `max_routes`."""
+
+    def __init__(self, max_routes: int = MAX_ROUTES):
+        self.max_routes = max_routes
+        self._routes: "OrderedDict[Tuple[str, str], List[Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, beat_id: str, version: str) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            route = self._routes.get((str(beat_id), version))
+            if route is not None:
+                self._routes.move_to_end((str(beat_id), version))
+            return route
+
+    def put(self, beat_id: str, route: List[Dict[str, Any]]) -> str:
+        """Stores `route` and returns its version. Callers must not mutate it afterwards."""
+        version = route_version(route)
+        with self._lock:
+            self._routes[(str(beat_id), version)] = route
+            self._routes.move_to_end((str(beat_id), version))
+            while len(self._routes) > self.max_routes:
+                self._routes.popitem(last=False)
+        return version
+
+    def clear(self) -> None:
+        with self._lock:
+            self._routes.clear()
+
+
+# Process-wide instance behind beat_route
+route_store = RouteStore()
+
+
+# ---------- Accessors ----------
+def beat_route(state: Dict[str, Any], db_path: str = DB_PATH) -> List[Dict[str, Any]]:
+    """
+    Today's route stops for the Beat_ID / Route_Version in `state`, in Visit_Sequence order.
+
+    Returns:
+        The stored list (shared; do not mutate), or [] when the state has no
+        route yet or beat_route_plan no longer holds that version.
+    """
+    beat_id, version = state.get("Beat_ID"), state.get("Route_Version")
+    if not beat_id or not version:
+        return []
+    route = route_store.get(beat_id, version)
+    if route is None:
+        from agents.get_beat_route_plan_agent import load_route
+
+        route = load_route(beat_id, db_path)
+        if route_version(route) != version:
+            return []
+        route_store.put(beat_id, route)
+    return route
+
+
+def retailer_bundle(
+    retailer_id: Optional[str], config: Optional[Dict[str, Any]] = None, db_path: str = DB_PATH,
+) -> Optional[Dict[str, Any]]:
+    """
+    Retailer_Info, Last_Visit_Stock and Product_Recommendations for one store.
+
+    Args:
+        retailer_id (str): The store, normally state["Retailer_ID"].
+        config (Dict): Run config; its thread_id selects the session cache.
+        db_path (str): Path to the SQLite database file.
+
+    Returns:
+        The bundle from the session cache, loaded and cached on a miss, or
+        None for an unknown retailer.
+    """
+    if not retailer_id:
+        return None
+    session_id = session_id_from_config(config)
+    bundle = retailer_bundle_cache.get(session_id, retailer_id)
+    if bundle is None:
+        from agents.get_retailer_info_agent import fetch_retailer_bundles
+
+        bundle = fetch_retailer_bundles([retailer_id], db_path=db_path).get(str(retailer_id))
+        if bundle is not None:
+            retailer_bundle_cache.put(session_id, retailer_id, bundle)
+    return bundle
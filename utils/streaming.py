@@ -0,0 +1,41 @@
+from typing import Any, Callable
+
+from langgraph.config import get_stream_writer
+
+
+# Chunks written to LangGraph's "custom" stream look like {"stream": <name>, "token": <text>}
+PITCH_STREAM = "pitch"
+DAY_SUMMARY_STREAM = "day_summary"
+
+
+def token_writer(stream: str) -> Callable[[str], None]:
+    """
+    Returns a function that forwards text to the graph's custom stream.
+
+    Outside a graph run (background workers, scripts) the function is a no-op.
+    """
+    try:
+        writer = get_stream_writer()
+    except RuntimeError:
+        return lambda token: None
+    return lambda token: writer({"stream": stream, "token": token})
+
+
+def stream_llm_text(llm: Any, prompt: str, stream: str, cache: Any) -> str:
+    """Streams `llm`'s answer through `cache` to the named custom stream and returns the full text."""
+    write = token_writer(stream)
+    parts = []
+    for token in cache.stream(llm, prompt):
+        parts.append(token)
+        write(token)
+    return "".join(parts)
+
+
+async def astream_llm_text(llm: Any, prompt: str, stream: str, cache: Any) -> str:
+    """Async counterpart of stream_llm_text."""
+    write = token_writer(stream)
+    parts = []
+    async for token in cache.astream(llm, prompt):
+        parts.append(token)
+        write(token)
+    return "".join(parts)
@@ -0,0 +1,332 @@
+import json
+import logging
+import math
+import os
+import re
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# Where a turn's time goes: every graph node, every SQL statement run through
+# utils.db's pool and every chat model call is timed into a process-wide
+# registry of series keyed by (kind, name):
+#
+#   node : graph node name (agent_orchastrator wraps each node)
+#   sql  : "<VERB> <table>" of the statement, e.g. "SELECT beat_route_plan"
+#   llm  : agent name from utils.llm_clients ("pitch", "select_retailer", ...)
+#
+# Each series keeps running totals (count, seconds, errors, rows, tokens,
+# cache hits) and the last TELEMETRY_WINDOW durations, from which the Metrics
+# tab and the Prometheus endpoint read rolling p50/p95/p99. A node also sums
+# the SQL and LLM time spent inside it (its span), so a slow node shows
+# whether SQLite or the model was behind it; work in background threads
+# (pitch pregeneration, the order outbox) is recorded without a node.
+#
+# With TELEMETRY_LOG set every event is also written as one JSON line (to
+# stderr, or to the file it names). Nothing here imports LangChain; the node
+# wrapper and the LLM callback handler are in utils.graph_telemetry.
+TELEMETRY_ENABLED = os.getenv("TELEMETRY_ENABLED", "1") == "1"
+TELEMETRY_WINDOW = int(os.getenv("TELEMETRY_WINDOW", "1000"))
+# "" off, "stderr" / "1", or a file path for the JSON lines
+TELEMETRY_LOG = os.getenv("TELEMETRY_LOG", "")
+# Port of the Prometheus text endpoint (GET /metrics); 0 leaves it off
+TELEMETRY_PORT = int(os.getenv("TELEMETRY_PORT", "0"))
+TELEMETRY_HOST = os.getenv("TELEMETRY_HOST", "127.0.0.1")
+
+QUANTILES = (0.5, 0.95, 0.99)
+PROMETHEUS_PREFIX = "sales_agent"
+# Prometheus label each kind's name goes under
+LABELS = {"node": "node", "sql": "statement", "llm": "llm"}
+# Counters a series may carry besides count / seconds / errors
+COUNTERS = (
+    "rows", "prompt_tokens", "completion_tokens", "cached_prompt_tokens",
+    "cache_hits", "cache_misses", "sql_seconds", "llm_seconds",
+)
+
+
+class Series:
+    """Running totals plus a rolling window of durations for one (kind, name)."""
+
+    __slots__ = ("count", "seconds", "errors", "counters", "samples")
+
+    def __init__(self, window: int):
+        self.count = 0
+        self.seconds = 0.0
+        self.errors = 0
+        self.counters: Dict[str, float] = defaultdict(float)
+        self.samples: Deque[float] = deque(maxlen=window)
+
+
+def quantile(ordered: List[float], q: float) -> Optional[float]:
+    """Nearest-rank quantile of an already sorted list (None when empty)."""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered), max(1, math.ceil(q * len(ordered)))) - 1]
+
+
+class MetricsRegistry:
+    """Thread-safe (kind, name) -> Series map shared by the whole process."""
+
+    def __init__(self, window: int = TELEMETRY_WINDOW):
+        self.window = window
+        self._series: Dict[Tuple[str, str], Series] = {}
+        self._lock = threading.Lock()
+
+    def observe(
+        self, kind: str, name: str, seconds: Optional[float] = None, error: bool = False, **counters: float,
+    ) -> None:
+        """Adds one timed call (when `seconds` is given) and/or counter increments to a series."""
+        with self._lock:
+            series = self._series.get((kind, name))
+            if series is None:
+                series = self._series[(kind, name)] = Series(self.window)
+            if seconds is not None:
+                series.count += 1
+                series.seconds += seconds
+                series.samples.append(seconds)
+            if error:
+                series.errors += 1
+            for counter, value in counters.items():
+                if value:
+                    series.counters[counter] += value
+
+    def snapshot(self, kind: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        One row per series, sorted by kind then total time.
+
+        Returns:
+            Dicts with kind, name, count, errors, seconds (total), mean_s,
+            p50_s / p95_s / p99_s over the rolling window, and the counters.
+        """
+        with self._lock:
+            items = [
+                (k, n, s.count, s.seconds, s.errors, dict(s.counters), sorted(s.samples))
+                for (k, n), s in self._series.items() if kind is None or k == kind
+            ]
+        rows = []
+        for k, n, count, seconds, errors, counters, ordered in items:
+            row = {"kind": k, "name": n, "count": count, "errors": errors, "seconds": seconds,
+                   "mean_s": seconds / count if count else None}
+            for q in QUANTILES:
+                row[f"p{int(q * 100)}_s"] = quantile(ordered, q)
+            row.update({counter: counters.get(counter, 0) for counter in COUNTERS})
+            rows.append(row)
+        rows.sort(key=lambda r: (r["kind"], -r["seconds"]))
+        return rows
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def render_prometheus(self) -> str:
+        """The registry in the Prometheus text exposition format (summaries plus counters)."""
+        by_kind: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for row in self.snapshot():
+            by_kind[row["kind"]].append(row)
+
+        lines = []
+        for kind, rows in sorted(by_kind.items()):
+            label = LABELS.get(kind, "name")
+            metric = f"{PROMETHEUS_PREFIX}_{kind}_seconds"
+            lines += [f"# HELP {metric} Wall time per {kind} call over the last {self.window} calls.",
+                      f"# TYPE {metric} summary"]
+            for row in rows:
+                name = _label_value(row["name"])
+                for q in QUANTILES:
+                    value = row[f"p{int(q * 100)}_s"]
+                    if value is not None:
+                        lines.append(f'{metric}{{{label}="{name}",quantile="{q}"}} {value:.6f}')
+                lines.append(f'{metric}_sum{{{label}="{name}"}} {row["seconds"]:.6f}')
+                lines.append(f'{metric}_count{{{label}="{name}"}} {row["count"]}')
+
+            counters = [("errors", "errors")] + [(c, c) for c in COUNTERS]
+            for field, suffix in counters:
+                if not any(row[field] for row in rows):
+                    continue
+                counter = f"{PROMETHEUS_PREFIX}_{kind}_{suffix}_total"
+                lines += [f"# HELP {counter} Total {suffix.replace('_', ' ')} per {kind}.",
+                          f"# TYPE {counter} counter"]
+                for row in rows:
+                    value = row[field]
+                    lines.append(f'{counter}{{{label}="{_label_value(row["name"])}"}} {value:g}')
+        return "\n".join(lines) + "\n"
+
+
+def _label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Process-wide registry read by the Metrics tab and the /metrics endpoint
+metrics = MetricsRegistry()
+
+
+# ---------- JSON event log ----------
+def configure_json_log(target: str = TELEMETRY_LOG) -> None:
+    """Writes this module's events as bare JSON lines to stderr ("1" / "stderr") or to the file `target`."""
+    if not target or target == "0" or any(getattr(h, "_telemetry", False) for h in logger.handlers):
+        return
+    handler = logging.StreamHandler(sys.stderr) if target in ("1", "stderr") else logging.FileHandler(target)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    handler._telemetry = True
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def log_event(kind: str, name: str, seconds: Optional[float], **fields: Any) -> None:
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    event = {"ts": round(time.time(), 6), "kind": kind, "name": name}
+    if seconds is not None:
+        event["ms"] = round(seconds * 1000, 3)
+    event.update({k: v for k, v in fields.items() if v is not None})
+    logger.info(json.dumps(event, default=str))
+
+
+# ---------- Spans ----------
+# The node running in this context; SQL and LLM time is added to it
+_span: ContextVar[Optional[Dict[str, Any]]] = ContextVar("telemetry_span", default=None)
+
+
+def current_node() -> Optional[str]:
+    span = _span.get()
+    return span["node"] if span else None
+
+
+@contextmanager
+def node_span(name: str) -> Iterator[Dict[str, Any]]:
+    """Times one node run and collects the SQL / LLM time spent inside it."""
+    span = {"node": name, "sql_seconds": 0.0, "sql_statements": 0, "llm_seconds": 0.0}
+    token = _span.set(span)
+    start = time.perf_counter()
+    error = False
+    try:
+        yield span
+    except BaseException:
+        error = True
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        _span.reset(token)
+        metrics.observe("node", name, seconds, error,
+                        sql_seconds=span["sql_seconds"], llm_seconds=span["llm_seconds"])
+        log_event("node", name, seconds, error=error or None,
+                  sql_ms=round(span["sql_seconds"] * 1000, 3), sql_statements=span["sql_statements"],
+                  llm_ms=round(span["llm_seconds"] * 1000, 3))
+
+
+# ---------- SQL ----------
+_STATEMENT = re.compile(
+    r"\b(?:FROM|INTO|UPDATE|TABLE(?:\s+IF\s+(?:NOT\s+)?EXISTS)?|INDEX(?:\s+IF\s+NOT\s+EXISTS)?\s+\w+\s+ON)\s+[\"`\[]?(\w+)",
+    re.IGNORECASE,
+)
+
+
+@lru_cache(maxsize=1024)
+def statement_label(sql: str) -> str:
+    """Low-cardinality name of a statement: its verb and first table ("SELECT beats", "INSERT visits")."""
+    words = sql.split(None, 1)
+    if not words:
+        return "EMPTY"
+    verb = words[0].upper()
+    if verb in ("BEGIN", "COMMIT", "ROLLBACK", "PRAGMA", "VACUUM", "ANALYZE"):
+        return verb
+    if verb == "WITH":
+        # The verb of a CTE query is the first one after the CTEs
+        main = re.search(r"\)\s*(SELECT|INSERT|UPDATE|DELETE|REPLACE)\b", sql, re.IGNORECASE)
+        verb = main.group(1).upper() if main else "SELECT"
+        tables = _STATEMENT.findall(sql[main.start():] if main else sql)
+    else:
+        tables = _STATEMENT.findall(sql)
+    return f"{verb} {tables[0]}" if tables else verb
+
+
+def observe_sql(sql: str, seconds: float, rows: int = 0, error: bool = False) -> None:
+    label = statement_label(sql)
+    metrics.observe("sql", label, seconds, error, rows=rows)
+    span = _span.get()
+    if span is not None:
+        span["sql_seconds"] += seconds
+        span["sql_statements"] += 1
+    log_event("sql", label, seconds, rows=rows, error=error or None, node=span["node"] if span else None)
+
+
+# ---------- LLM ----------
+def observe_llm(
+    name: str, seconds: float, prompt_tokens: int = 0, completion_tokens: int = 0,
+    cached_prompt_tokens: int = 0, error: bool = False, first_token_s: Optional[float] = None,
+) -> None:
+    metrics.observe("llm", name, seconds, error, prompt_tokens=prompt_tokens,
+                    completion_tokens=completion_tokens, cached_prompt_tokens=cached_prompt_tokens)
+    span = _span.get()
+    if span is not None:
+        span["llm_seconds"] += seconds
+    log_event("llm", name, seconds, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+              cached_prompt_tokens=cached_prompt_tokens or None, error=error or None,
+              first_token_ms=round(first_token_s * 1000, 3) if first_token_s is not None else None,
+              node=span["node"] if span else None)
+
+
+def llm_name(llm: Any) -> str:
+    """Agent name utils.llm_clients tagged the model with, else its model name."""
+    name = (getattr(llm, "metadata", None) or {}).get("llm")
+    return str(name or getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__)
+
+
+def observe_llm_cache(llm: Any, hit: bool) -> None:
+    """Counts a response-cache lookup for `llm` (a hit means the model was not called)."""
+    name = llm_name(llm)
+    metrics.observe("llm", name, cache_hits=int(hit), cache_misses=int(not hit))
+    log_event("llm_cache", name, None, hit=hit, node=current_node())
+
+
+# ---------- Prometheus endpoint ----------
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = TELEMETRY_PORT, host: str = TELEMETRY_HOST):
+    """
+    Serves `metrics.render_prometheus()` at http://host:port/metrics from a daemon thread.
+
+    Returns:
+        The running server (the same one on later calls), or None when `port` is 0.
+    """
+    global _server
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+            class MetricsHandler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                        self.send_error(404)
+                        return
+                    body = metrics.render_prometheus().encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            _server = ThreadingHTTPServer((host, port), MetricsHandler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+            logger.debug("Serving metrics on http://%s:%s/metrics", host, port)
+    return _server
+
+
+configure_json_log()